@@ -0,0 +1,151 @@
+"""Audio decoding helpers for speech-to-text.
+
+decode_audio pipes encoded bytes (webm/ogg/mp3/wav, anything ffmpeg reads)
+through a single ffmpeg process and returns mono float32 samples at
+SAMPLE_RATE, the format Whisper consumes directly. Nothing touches disk.
+StreamDecoder does the same for audio arriving in pieces (e.g. MediaRecorder
+webm chunks over a WebSocket), yielding samples as ffmpeg produces them.
+"""
+from __future__ import annotations
+
+import logging
+import os
+import shutil
+import subprocess
+import threading
+from pathlib import Path
+from typing import Any, List, Optional
+
+logger = logging.getLogger("ai_core.audio")
+
+SAMPLE_RATE = 16000
+
+
+def find_ffmpeg() -> Optional[str]:
+    """Find ffmpeg executable in common locations."""
+    # Check project-local ffmpeg first
+    bin_dir = Path(__file__).parent.parent / "ffmpeg-8.0-essentials_build" / "bin"
+    for name in ("ffmpeg.exe", "ffmpeg"):
+        if (bin_dir / name).exists():
+            return str(bin_dir / name)
+
+    # Check if ffmpeg is in PATH
+    ffmpeg_path = shutil.which("ffmpeg")
+    if ffmpeg_path:
+        return ffmpeg_path
+
+    # Check common Windows installation locations
+    common_paths = [
+        r"C:\Program Files\ffmpeg\bin\ffmpeg.exe",
+        r"C:\ffmpeg\bin\ffmpeg.exe",
+        r"C:\Program Files (x86)\ffmpeg\bin\ffmpeg.exe",
+    ]
+    for path in common_paths:
+        if os.path.exists(path):
+            return path
+
+    return None
+
+
+def _ffmpeg_cmd(sample_rate: int) -> List[str]:
+    ffmpeg_exe = find_ffmpeg()
+    if not ffmpeg_exe:
+        raise RuntimeError("ffmpeg not found in PATH or common locations")
+    return [
+        ffmpeg_exe,
+        "-nostdin",
+        "-loglevel", "error",
+        "-i", "pipe:0",
+        "-f", "s16le",
+        "-acodec", "pcm_s16le",
+        "-ac", "1",
+        "-ar", str(sample_rate),
+        "pipe:1",
+    ]
+
+
+def pcm16_to_float(data: bytes) -> Any:
+    """Convert little-endian 16-bit PCM bytes to float32 samples in [-1, 1]."""
+    import numpy as np  # type: ignore
+
+    return np.frombuffer(data, dtype=np.int16).astype(np.float32) / 32768.0
+
+
+def decode_audio(data: bytes, sample_rate: int = SAMPLE_RATE) -> Any:
+    """Decode encoded audio bytes into a mono float32 NumPy array in [-1, 1].
+
+    Raises RuntimeError if ffmpeg is missing or cannot decode the input.
+    """
+    proc = subprocess.run(_ffmpeg_cmd(sample_rate), input=data, capture_output=True)
+    if proc.returncode != 0:
+        raise RuntimeError(f"ffmpeg failed: {proc.stderr.decode(errors='replace').strip()}")
+    return pcm16_to_float(proc.stdout)
+
+
+def duration_seconds(samples: Any, sample_rate: int = SAMPLE_RATE) -> float:
+    """Duration of a decoded buffer, from its sample count."""
+    return len(samples) / float(sample_rate)
+
+
+class StreamDecoder:
+    """Long-running ffmpeg process decoding a stream fed in arbitrary chunks.
+
+    feed() writes encoded bytes, read() returns the samples decoded so far
+    (possibly empty) and close() flushes the decoder and returns the rest.
+    """
+
+    def __init__(self, sample_rate: int = SAMPLE_RATE) -> None:
+        self._proc = subprocess.Popen(
+            _ffmpeg_cmd(sample_rate),
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+        )
+        self._buf = bytearray()
+        self._lock = threading.Lock()
+        self._reader = threading.Thread(target=self._pump, name="ffmpeg-stream-reader", daemon=True)
+        self._reader.start()
+
+    def _pump(self) -> None:
+        stdout = self._proc.stdout
+        while True:
+            chunk = stdout.read1(8192) if hasattr(stdout, "read1") else stdout.read(8192)
+            if not chunk:
+                break
+            with self._lock:
+                self._buf.extend(chunk)
+
+    def feed(self, data: bytes) -> None:
+        self._proc.stdin.write(data)
+        self._proc.stdin.flush()
+
+    def read(self) -> Any:
+        with self._lock:
+            # Keep an odd trailing byte until its sample is complete
+            n = len(self._buf) - (len(self._buf) % 2)
+            data = bytes(self._buf[:n])
+            del self._buf[:n]
+        return pcm16_to_float(data)
+
+    def close(self) -> Any:
+        try:
+            self._proc.stdin.close()
+        except Exception:
+            pass
+        self._reader.join(timeout=10)
+        self._proc.wait(timeout=10)
+        return self.read()
+
+    def kill(self) -> None:
+        """Abort decoding (client went away) and reap the ffmpeg process."""
+        try:
+            self._proc.kill()
+            self._proc.wait(timeout=5)
+        except Exception:
+            pass
+        self._reader.join(timeout=5)
+        for pipe in (self._proc.stdin, self._proc.stdout):
+            try:
+                pipe.close()
+            except Exception:
+                pass
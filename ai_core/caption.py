@@ -1,60 +1,255 @@
 """Image captioning using BLIP (Salesforce/blip-image-captioning-base).
 
-Lazy-loads model and processor to keep import times low.
+Lazy-loads model and processor to keep import times low. Use caption_images to
+caption many images in batches (CAPTION_BATCH_SIZE, CAPTION_MAX_SIDE). Captions
+are cached on disk by image content (CAPTION_CACHE_PATH) so repeated logos and
+template graphics never hit BLIP twice.
 """
 from __future__ import annotations
 
-from typing import Optional
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+from typing import TYPE_CHECKING, Dict, List, Optional
 
-from PIL import Image
+from . import model_host
+
+if TYPE_CHECKING:  # PIL is imported where images are actually handled
+    from PIL import Image
+
+CAPTION_BATCH_SIZE = int(os.getenv("CAPTION_BATCH_SIZE", "8"))
+CAPTION_MAX_SIDE = int(os.getenv("CAPTION_MAX_SIDE", "768"))
+# Persistent caption cache keyed by image content; set to "" to disable
+CAPTION_CACHE_PATH = os.getenv("CAPTION_CACHE_PATH", "./data/caption_cache.sqlite3")
+
+_MODEL_NAME = "Salesforce/blip-image-captioning-base"
+_stats: Dict[str, int] = {"hits": 0, "misses": 0}
+_stats_lock = threading.Lock()
 
 _pipe = None  # type: ignore[var-annotated]
+_pipe_lock = threading.Lock()
 
 
 def _get_pipeline():
     global _pipe
     if _pipe is None:
-        try:
-            from transformers import BlipProcessor, BlipForConditionalGeneration  # type: ignore
-        except Exception as e:  # pragma: no cover - import guard
-            raise RuntimeError(
-                "transformers is required for BLIP captions. Please install 'transformers'."
-            ) from e
-        # Lazy load heavy weights
-        processor = BlipProcessor.from_pretrained("Salesforce/blip-image-captioning-base")
-        model = BlipForConditionalGeneration.from_pretrained(
-            "Salesforce/blip-image-captioning-base"
-        )
-        _pipe = (processor, model)
+        with _pipe_lock:
+            if _pipe is None:
+                try:
+                    from transformers import BlipProcessor, BlipForConditionalGeneration  # type: ignore
+                except Exception as e:  # pragma: no cover - import guard
+                    raise RuntimeError(
+                        "transformers is required for BLIP captions. Please install 'transformers'."
+                    ) from e
+                # Lazy load heavy weights
+                processor = BlipProcessor.from_pretrained(_MODEL_NAME)
+                model = BlipForConditionalGeneration.from_pretrained(_MODEL_NAME)
+                _pipe = (processor, model)
     return _pipe
 
 
-def caption_image(pil_image: Image.Image) -> str:
-    """Generate a caption for the given image.
+def warmup() -> None:
+    """Load BLIP now instead of on the first caption."""
+    if model_host.enabled():
+        model_host.client().warmup(["caption"])
+        return
+    _get_pipeline()
 
-    Returns an empty string if captioning fails for any reason.
+
+def is_loaded() -> bool:
+    if model_host.enabled():
+        return model_host.remote_loaded("caption")
+    return _pipe is not None
+
+
+def image_key(pil_image: Image.Image, max_side: Optional[int] = None) -> str:
+    """Content address of an image: hash of its pixels plus the caption settings."""
+    max_side = int(max_side if max_side is not None else CAPTION_MAX_SIDE)
+    h = hashlib.sha256()
+    h.update(f"{_MODEL_NAME}:{max_side}:{pil_image.mode}:{pil_image.size}".encode("utf-8"))
+    h.update(pil_image.tobytes())
+    return h.hexdigest()
+
+
+_cache_local = threading.local()
+
+
+def _cache_conn() -> Optional[sqlite3.Connection]:
+    """This thread's connection to the caption cache, opened on first use."""
+    if not CAPTION_CACHE_PATH:
+        return None
+    conn = getattr(_cache_local, "conn", None)
+    if conn is None:
+        os.makedirs(os.path.dirname(os.path.abspath(CAPTION_CACHE_PATH)), exist_ok=True)
+        conn = sqlite3.connect(CAPTION_CACHE_PATH, timeout=10, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        with conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS captions (key TEXT PRIMARY KEY, caption TEXT NOT NULL)")
+        _cache_local.conn = conn
+    return conn
+
+
+def get_cached_captions(keys: List[str]) -> Dict[str, str]:
+    """Look up captions by image key; updates the hit/miss counters."""
+    unique = list(dict.fromkeys(keys))
+    found: Dict[str, str] = {}
+    try:
+        conn = _cache_conn()
+        if conn is not None:
+            for start in range(0, len(unique), 500):
+                chunk = unique[start:start + 500]
+                marks = ",".join("?" * len(chunk))
+                rows = conn.execute(
+                    f"SELECT key, caption FROM captions WHERE key IN ({marks})", chunk
+                ).fetchall()
+                found.update(rows)
+    except Exception as e:
+        logging.getLogger("ai_core.caption").warning(f"Caption cache lookup failed: {e}")
+    with _stats_lock:
+        _stats["hits"] += sum(1 for k in keys if k in found)
+        _stats["misses"] += sum(1 for k in keys if k not in found)
+    return found
+
+
+def put_cached_captions(items: Dict[str, str]) -> None:
+    """Persist captions by image key. Empty captions (failures) are not stored."""
+    rows = [(k, v) for k, v in items.items() if v]
+    if not rows:
+        return
+    try:
+        conn = _cache_conn()
+        if conn is not None:
+            with conn:
+                conn.executemany("INSERT OR REPLACE INTO captions (key, caption) VALUES (?, ?)", rows)
+    except Exception as e:
+        logging.getLogger("ai_core.caption").warning(f"Caption cache write failed: {e}")
+
+
+def cache_stats() -> Dict[str, int]:
+    """Hit/miss counters of the caption cache for this process."""
+    with _stats_lock:
+        return dict(_stats)
+
+
+def _prepare(pil_image: Image.Image, max_side: int) -> Image.Image:
+    """Convert to RGB and downscale so the longest side is at most max_side."""
+    img = pil_image.convert("RGB") if pil_image.mode != "RGB" else pil_image
+    if max_side and max(img.size) > max_side:
+        img = img.copy()
+        img.thumbnail((max_side, max_side))
+    return img
+
+
+def _pick(caption: str, caption_conditional: str) -> str:
+    # Use the longer, more descriptive caption
+    if len(caption_conditional) > len(caption):
+        return f"Figure: {caption_conditional.strip()}"
+    return f"Figure: {caption.strip()}"
+
+
+def _generate_captions(images: List[Image.Image], batch_size: int, max_side: int) -> List[str]:
+    """Run BLIP over images, one batched generate pass per variant per batch.
+
+    The processor resizes every image to the model's fixed input size, so a batch
+    becomes a single pixel_values tensor. Each batch runs the unconditional caption
+    and the "a chart or diagram showing" conditional caption once.
     """
+    if not images:
+        return []
+    logger = logging.getLogger("ai_core.caption")
+    if model_host.enabled():
+        try:
+            return model_host.client().caption(images, batch_size, max_side)
+        except Exception as e:
+            logger.warning(f"Caption generation failed: {e}")
+            return [""] * len(images)
+
     try:
         processor, model = _get_pipeline()
-        
-        # Generate unconditional caption (what is in the image)
-        inputs = processor(images=pil_image, return_tensors="pt")
-        out = model.generate(**inputs, max_new_tokens=50)  # Increased from 30 to 50
-        caption = processor.decode(out[0], skip_special_tokens=True)
-        
-        # Also try conditional caption with "this figure shows" prompt for better context
-        text_prompt = "a chart or diagram showing"
-        inputs_conditional = processor(images=pil_image, text=text_prompt, return_tensors="pt")
-        out_conditional = model.generate(**inputs_conditional, max_new_tokens=50)
-        caption_conditional = processor.decode(out_conditional[0], skip_special_tokens=True)
-        
-        # Use the longer, more descriptive caption
-        if len(caption_conditional) > len(caption):
-            return f"Figure: {caption_conditional.strip()}"
-        else:
-            return f"Figure: {caption.strip()}"
     except Exception as e:
-        # Log the error but don't crash
-        import logging
-        logging.getLogger("ai_core.caption").warning(f"Caption generation failed: {e}")
-        return ""
+        logger.warning(f"Caption generation failed: {e}")
+        return [""] * len(images)
+
+    out: List[str] = []
+    for start in range(0, len(images), batch_size):
+        batch = images[start:start + batch_size]
+        try:
+            prepared = [_prepare(img, max_side) for img in batch]
+
+            # Generate unconditional captions (what is in the image)
+            inputs = processor(images=prepared, return_tensors="pt")
+            gen = model.generate(**inputs, max_new_tokens=50)
+            captions = processor.batch_decode(gen, skip_special_tokens=True)
+
+            # Conditional captions with a figure prompt for better context
+            text_prompt = "a chart or diagram showing"
+            inputs_conditional = processor(
+                images=prepared, text=[text_prompt] * len(prepared), return_tensors="pt", padding=True
+            )
+            gen_conditional = model.generate(**inputs_conditional, max_new_tokens=50)
+            captions_conditional = processor.batch_decode(gen_conditional, skip_special_tokens=True)
+
+            out.extend(_pick(c, cc) for c, cc in zip(captions, captions_conditional))
+        except Exception as e:
+            # Log the error but don't crash; fall back to one image at a time
+            logger.warning(f"Batched caption generation failed ({len(batch)} images): {e}")
+            if len(batch) == 1:
+                out.append("")
+            else:
+                out.extend(_generate_captions(batch, 1, max_side))
+    return out
+
+
+def caption_images(
+    images: List[Image.Image],
+    batch_size: Optional[int] = None,
+    max_side: Optional[int] = None,
+    use_cache: bool = True,
+) -> List[str]:
+    """Caption many images in batches, skipping BLIP for images seen before.
+
+    Identical images (by pixel hash) are captioned once per call, and with
+    use_cache the persistent caption cache is consulted and filled.
+
+    Returns one caption per input image, in order; entries are "" where
+    captioning failed.
+    """
+    if not images:
+        return []
+    batch_size = max(1, int(batch_size or CAPTION_BATCH_SIZE))
+    max_side = int(max_side if max_side is not None else CAPTION_MAX_SIDE)
+
+    keys = [image_key(img, max_side) for img in images]
+    known: Dict[str, str] = get_cached_captions(keys) if use_cache else {}
+
+    todo: Dict[str, Image.Image] = {}
+    for key, img in zip(keys, images):
+        if key not in known and key not in todo:
+            todo[key] = img
+    if todo:
+        fresh = dict(zip(todo.keys(), _generate_captions(list(todo.values()), batch_size, max_side)))
+        if use_cache:
+            put_cached_captions(fresh)
+        known.update(fresh)
+    return [known.get(k, "") for k in keys]
+
+
+def caption_image(pil_image: Image.Image) -> str:
+    """Generate a caption for the given image.
+
+    Returns an empty string if captioning fails for any reason.
+    """
+    return caption_images([pil_image], batch_size=1)[0]
+
+
+def _reset_after_fork() -> None:
+    # SQLite connections must not cross fork
+    global _cache_local
+    _cache_local = threading.local()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
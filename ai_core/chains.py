@@ -1,17 +1,22 @@
 """LangChain-like lightweight chains that call llm_client under the hood.
 
 We avoid heavy agent machinery; these are thin adapters building prompts and
-parsing outputs. Results cached in-memory keyed by (fn_name, prompt_hash).
+parsing outputs. Results are cached keyed by (fn_name, hash of mode + model +
+prompt) in a bounded, optionally persistent cache (see ai_core.llm_cache).
 """
 from __future__ import annotations
 
 import hashlib
-from typing import Dict, List, Tuple, Optional
+from typing import AsyncIterator, Callable, Dict, List, Tuple, Optional
 import logging
 import re
 import os
+import threading
+import asyncio
 
 from . import llm_client
+from .llm_client import LLMConfig, resolve_config
+from .llm_cache import get_cache
 from .prompts import (
     EXPLAIN_PAGE,
     ANSWER_WITH_CITATIONS,
@@ -22,74 +27,293 @@ from .prompts import (
 )
 
 
-_CACHE: Dict[Tuple[str, str], str] = {}
 logger = logging.getLogger("ai_core.chains")
 
 
 def clear_cache():
     """Clear all cached LLM responses."""
-    global _CACHE
-    _CACHE.clear()
+    get_cache().clear()
     logger.info("Cleared LLM response cache")
 
 
-def _cache_key(name: str, content: str) -> Tuple[str, str]:
+def cache_stats() -> Dict:
+    """Hit/miss/size counters of the LLM response cache."""
+    return get_cache().stats()
+
+
+def _cache_get(key: Tuple[str, str]) -> Optional[str]:
+    return get_cache().get(f"{key[0]}:{key[1]}")
+
+
+def _cache_set(key: Tuple[str, str], value: str) -> None:
+    get_cache().set(f"{key[0]}:{key[1]}", value)
+
+
+# The cache may have a SQLite tier; async callers reach it off the event loop
+async def _acache_get(key: Tuple[str, str]) -> Optional[str]:
+    return await asyncio.to_thread(_cache_get, key)
+
+
+async def _acache_set(key: Tuple[str, str], value: str) -> None:
+    await asyncio.to_thread(_cache_set, key, value)
+
+
+class _Flight:
+    """One in-progress generation that concurrent callers can wait on."""
+
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.result: Optional[str] = None
+        self.error: Optional[BaseException] = None
+
+
+_INFLIGHT: Dict[Tuple[str, str], _Flight] = {}
+_INFLIGHT_LOCK = threading.Lock()
+_COALESCED = 0
+
+
+def _single_flight(key: Tuple[str, str], fn: Callable[[], str]) -> str:
+    """Run fn once per key at a time; concurrent callers with the same key wait
+    for the first caller's result instead of issuing an identical LLM call."""
+    global _COALESCED
+    with _INFLIGHT_LOCK:
+        flight = _INFLIGHT.get(key)
+        leader = flight is None
+        if leader:
+            flight = _INFLIGHT[key] = _Flight()
+        else:
+            _COALESCED += 1
+    if not leader:
+        logger.debug(f"single-flight: waiting on in-flight call for key={key[1][:16]}")
+        flight.done.wait()
+        if flight.error is not None:
+            raise flight.error
+        return flight.result or ""
+    try:
+        flight.result = fn()
+        return flight.result
+    except BaseException as e:
+        flight.error = e
+        raise
+    finally:
+        with _INFLIGHT_LOCK:
+            _INFLIGHT.pop(key, None)
+        flight.done.set()
+
+
+def _generate_once(
+    key: Tuple[str, str],
+    prompt: str,
+    sys_prompt: Optional[str] = None,
+    config: Optional[LLMConfig] = None,
+) -> str:
+    """Generate and cache a completion, coalescing concurrent identical requests."""
+    def run() -> str:
+        # A caller that just finished may have filled the cache meanwhile
+        cached = _cache_get(key)
+        if cached is not None:
+            return cached
+        out = llm_client.generate(prompt, sys_prompt=sys_prompt, config=config)
+        _cache_set(key, out)
+        return out
+
+    return _single_flight(key, run)
+
+
+# Async single-flight: one detached task per (event loop, cache key)
+_AINFLIGHT: Dict[Tuple[int, Tuple[str, str]], "asyncio.Task[str]"] = {}
+
+
+async def _agenerate_once(
+    key: Tuple[str, str],
+    prompt: str,
+    sys_prompt: Optional[str] = None,
+    config: Optional[LLMConfig] = None,
+) -> str:
+    """Async counterpart of _generate_once built on llm_client.agenerate.
+
+    The provider call runs as its own task and every caller, the first one
+    included, awaits it through asyncio.shield: a caller that is cancelled
+    (e.g. its client disconnected) stops waiting without failing the others.
+    """
+    global _COALESCED
+    cached = await _acache_get(key)
+    if cached is not None:
+        return cached
+    loop = asyncio.get_running_loop()
+    fkey = (id(loop), key)
+    task = _AINFLIGHT.get(fkey)
+    if task is not None and task.get_loop() is not loop:
+        task = None  # left behind by a closed loop whose id was reused
+    if task is not None:
+        with _INFLIGHT_LOCK:
+            _COALESCED += 1
+        logger.debug(f"single-flight: awaiting in-flight call for key={key[1][:16]}")
+        return await asyncio.shield(task)
+
+    async def run() -> str:
+        try:
+            out = await llm_client.agenerate(prompt, sys_prompt=sys_prompt, config=config)
+            await _acache_set(key, out)
+            return out
+        finally:
+            _AINFLIGHT.pop(fkey, None)
+
+    task = _AINFLIGHT[fkey] = asyncio.ensure_future(run())
+    # Mark a failure as retrieved when every caller has gone away
+    task.add_done_callback(lambda t: t.cancelled() or t.exception())
+    return await asyncio.shield(task)
+
+
+async def _astream_once(
+    key: Tuple[str, str],
+    prompt: str,
+    sys_prompt: Optional[str] = None,
+    config: Optional[LLMConfig] = None,
+) -> AsyncIterator[str]:
+    """Stream a completion chunk by chunk; the full text is cached once the
+    stream completes (a cached answer is sent as a single chunk)."""
+    cached = await _acache_get(key)
+    if cached is not None:
+        yield cached
+        return
+    parts: List[str] = []
+    async for chunk in llm_client.astream(prompt, sys_prompt=sys_prompt, config=config):
+        parts.append(chunk)
+        yield chunk
+    # Only reached when the client consumed the whole stream and the provider
+    # finished it; an interrupted stream raises and is never cached
+    await _acache_set(key, "".join(parts).strip())
+
+
+def flight_stats() -> Dict[str, int]:
+    """Number of LLM calls coalesced into an identical in-flight call."""
+    with _INFLIGHT_LOCK:
+        return {"coalesced": _COALESCED, "inflight": len(_INFLIGHT) + len(_AINFLIGHT)}
+
+
+def _cache_key(name: str, content: str, config: Optional[LLMConfig] = None) -> Tuple[str, str]:
     # Include model info in cache key to prevent cross-model caching
-    app_mode = os.getenv("APP_MODE", "local")
-    model = os.getenv("GEMINI_MODEL" if app_mode == "cloud" else "OLLAMA_MODEL", "default")
-    combined = f"{app_mode}:{model}:{content}"
+    config = resolve_config(config)
+    combined = f"{config.app_mode}:{config.model}:{content}"
     h = hashlib.sha256(combined.encode("utf-8")).hexdigest()
     return (name, h)
 
 
-def explain_page(page_context: str) -> str:
+_EXPLAIN_SYS = "You are a precise teaching assistant."
+_ANSWER_SYS = "You are a helpful tutor. Use your knowledge and cite relevant slides when available."
+
+
+def explain_page(page_context: str, config: Optional[LLMConfig] = None) -> str:
     prompt = EXPLAIN_PAGE.format(page_context=page_context)
-    key = _cache_key("explain_page", prompt)
-    app_mode = os.getenv("APP_MODE", "local")
-    model = os.getenv("GEMINI_MODEL" if app_mode == "cloud" else "OLLAMA_MODEL", "default")
-    logger.debug(f"explain_page: app_mode={app_mode}, model={model}, cache_key={key[1][:16]}")
-    if key in _CACHE:
+    config = resolve_config(config)
+    key = _cache_key("explain_page", prompt, config)
+    logger.debug(f"explain_page: app_mode={config.app_mode}, model={config.model}, cache_key={key[1][:16]}")
+    cached = _cache_get(key)
+    if cached is not None:
         logger.debug(f"explain_page: CACHE HIT")
-        return _CACHE[key]
+        return cached
     logger.debug(f"explain_page: CACHE MISS, generating")
-    out = llm_client.generate(prompt, sys_prompt="You are a precise teaching assistant.")
-    _CACHE[key] = out
+    out = _generate_once(key, prompt, sys_prompt=_EXPLAIN_SYS, config=config)
     return out
 
 
-def answer_question(question: str, ctx_texts: List[str]) -> str:
+async def aexplain_page(page_context: str, config: Optional[LLMConfig] = None) -> str:
+    prompt = EXPLAIN_PAGE.format(page_context=page_context)
+    config = resolve_config(config)
+    key = _cache_key("explain_page", prompt, config)
+    logger.debug(f"aexplain_page: app_mode={config.app_mode}, model={config.model}, cache_key={key[1][:16]}")
+    return await _agenerate_once(key, prompt, sys_prompt=_EXPLAIN_SYS, config=config)
+
+
+async def astream_explain_page(
+    page_context: str, config: Optional[LLMConfig] = None
+) -> AsyncIterator[str]:
+    prompt = EXPLAIN_PAGE.format(page_context=page_context)
+    config = resolve_config(config)
+    key = _cache_key("explain_page", prompt, config)
+    logger.debug(f"astream_explain_page: app_mode={config.app_mode}, model={config.model}, cache_key={key[1][:16]}")
+    async for chunk in _astream_once(key, prompt, sys_prompt=_EXPLAIN_SYS, config=config):
+        yield chunk
+
+
+def answer_question(
+    question: str, ctx_texts: List[str], config: Optional[LLMConfig] = None
+) -> str:
     contexts = render_ctx_blocks(ctx_texts)
     prompt = ANSWER_WITH_CITATIONS.format(contexts=contexts, question=question)
-    key = _cache_key("answer_question", prompt)
-    app_mode = os.getenv("APP_MODE", "local")
-    model = os.getenv("GEMINI_MODEL" if app_mode == "cloud" else "OLLAMA_MODEL", "default")
-    logger.debug(f"answer_question: app_mode={app_mode}, model={model}, question='{question[:50]}...'")
-    if key in _CACHE:
+    config = resolve_config(config)
+    key = _cache_key("answer_question", prompt, config)
+    logger.debug(f"answer_question: app_mode={config.app_mode}, model={config.model}, question='{question[:50]}...'")
+    cached = _cache_get(key)
+    if cached is not None:
         logger.debug(f"answer_question: CACHE HIT")
-        return _CACHE[key]
+        return cached
     logger.debug(f"answer_question: CACHE MISS, generating answer")
-    out = llm_client.generate(prompt, sys_prompt="You are a helpful tutor. Use your knowledge and cite relevant slides when available.")
-    _CACHE[key] = out
+    out = _generate_once(key, prompt, sys_prompt=_ANSWER_SYS, config=config)
     logger.debug(f"answer_question: generated answer with {len(out)} chars")
     return out
 
 
-def make_flashcards(page_context: str) -> List[Dict]:
+async def aanswer_question(
+    question: str, ctx_texts: List[str], config: Optional[LLMConfig] = None
+) -> str:
+    contexts = render_ctx_blocks(ctx_texts)
+    prompt = ANSWER_WITH_CITATIONS.format(contexts=contexts, question=question)
+    config = resolve_config(config)
+    key = _cache_key("answer_question", prompt, config)
+    logger.debug(f"aanswer_question: app_mode={config.app_mode}, model={config.model}, question='{question[:50]}...'")
+    out = await _agenerate_once(key, prompt, sys_prompt=_ANSWER_SYS, config=config)
+    logger.debug(f"aanswer_question: answer with {len(out)} chars")
+    return out
+
+
+async def astream_answer_question(
+    question: str, ctx_texts: List[str], config: Optional[LLMConfig] = None
+) -> AsyncIterator[str]:
+    contexts = render_ctx_blocks(ctx_texts)
+    prompt = ANSWER_WITH_CITATIONS.format(contexts=contexts, question=question)
+    config = resolve_config(config)
+    key = _cache_key("answer_question", prompt, config)
+    logger.debug(f"astream_answer_question: app_mode={config.app_mode}, model={config.model}, question='{question[:50]}...'")
+    async for chunk in _astream_once(key, prompt, sys_prompt=_ANSWER_SYS, config=config):
+        yield chunk
+
+
+def _dump_raw(app_mode: str, filename: str, raw: str) -> None:
+    """Save the raw LLM output under ./out for debugging when in cloud mode."""
+    if app_mode.lower() != "cloud":
+        return
+    try:
+        out_dir = os.path.abspath(os.path.join(os.getcwd(), "out"))
+        os.makedirs(out_dir, exist_ok=True)
+        with open(os.path.join(out_dir, filename), "w", encoding="utf-8") as f:
+            f.write(raw)
+    except Exception:
+        pass
+
+
+def make_flashcards(page_context: str, config: Optional[LLMConfig] = None) -> List[Dict]:
     prompt = FLASHCARDS_FROM_CONTEXT.format(page_context=page_context)
-    key = _cache_key("make_flashcards", prompt)
-    if key in _CACHE:
-        raw = _CACHE[key]
-    else:
-        raw = llm_client.generate(prompt)
-        _CACHE[key] = raw
+    config = resolve_config(config)
+    key = _cache_key("make_flashcards", prompt, config)
+    raw = _cache_get(key)
+    if raw is None:
+        raw = _generate_once(key, prompt, config=config)
+    _dump_raw(config.app_mode, "last_flashcards_raw.txt", raw)
+    return _parse_flashcards(raw, page_context)
 
-    if os.getenv("APP_MODE", "local").lower() == "cloud":
-        try:
-            with open("./out/last_flashcards_raw.txt", "w", encoding="utf-8") as f:
-                f.write(raw)
-        except Exception:
-            pass
 
+async def amake_flashcards(page_context: str, config: Optional[LLMConfig] = None) -> List[Dict]:
+    prompt = FLASHCARDS_FROM_CONTEXT.format(page_context=page_context)
+    config = resolve_config(config)
+    key = _cache_key("make_flashcards", prompt, config)
+    raw = await _agenerate_once(key, prompt, config=config)
+    _dump_raw(config.app_mode, "last_flashcards_raw.txt", raw)
+    return _parse_flashcards(raw, page_context)
+
+
+def _parse_flashcards(raw: str, page_context: str) -> List[Dict]:
     # Parse into Q/A pairs
     cards: List[Dict] = []
     current_q: Optional[str] = None
@@ -149,26 +373,31 @@ def make_flashcards(page_context: str) -> List[Dict]:
     return cards
 
 
-def make_quiz(page_context: str) -> List[Dict]:
+def make_quiz(page_context: str, config: Optional[LLMConfig] = None) -> List[Dict]:
     prompt = QUIZ_FROM_CONTEXT.format(page_context=page_context)
-    key = _cache_key("make_quiz", prompt)
-    if key in _CACHE:
+    config = resolve_config(config)
+    key = _cache_key("make_quiz", prompt, config)
+    raw = _cache_get(key)
+    if raw is not None:
         logger.info("make_quiz: Using cached response")
-        raw = _CACHE[key]
     else:
         logger.info("make_quiz: Generating new response from LLM")
-        raw = llm_client.generate(prompt)
-        _CACHE[key] = raw
+        raw = _generate_once(key, prompt, config=config)
         logger.info(f"make_quiz: Raw LLM output (first 500 chars): {raw[:500]}")
+    _dump_raw(config.app_mode, "last_quiz_raw.txt", raw)
+    return _parse_quiz(raw, page_context)
 
-    # Log raw output for debugging when in cloud mode
-    if os.getenv("APP_MODE", "local").lower() == "cloud":
-        out_dir = os.path.abspath(os.path.join(os.getcwd(), "out"))
-        os.makedirs(out_dir, exist_ok=True)
-        with open(os.path.join(out_dir, "last_quiz_raw.txt"), "w", encoding="utf-8") as f:
-            f.write(raw)
-        logger.info(f"make_quiz: Saved raw output to out/last_quiz_raw.txt")
 
+async def amake_quiz(page_context: str, config: Optional[LLMConfig] = None) -> List[Dict]:
+    prompt = QUIZ_FROM_CONTEXT.format(page_context=page_context)
+    config = resolve_config(config)
+    key = _cache_key("make_quiz", prompt, config)
+    raw = await _agenerate_once(key, prompt, config=config)
+    _dump_raw(config.app_mode, "last_quiz_raw.txt", raw)
+    return _parse_quiz(raw, page_context)
+
+
+def _parse_quiz(raw: str, page_context: str) -> List[Dict]:
     lines = [l.strip() for l in raw.splitlines() if l.strip()]
     logger.debug(f"make_quiz: Parsed {len(lines)} non-empty lines")
 
@@ -254,17 +483,24 @@ def make_quiz(page_context: str) -> List[Dict]:
     return items
 
 
-def make_cheatsheet(page_context: str) -> str:
+def make_cheatsheet(page_context: str, config: Optional[LLMConfig] = None) -> str:
     prompt = CHEATSHEET_FROM_CONTEXT.format(page_context=page_context)
-    key = _cache_key("make_cheatsheet", prompt)
-    app_mode = os.getenv("APP_MODE", "local")
-    model = os.getenv("GEMINI_MODEL" if app_mode == "cloud" else "OLLAMA_MODEL", "default")
-    logger.debug(f"make_cheatsheet: app_mode={app_mode}, model={model}, cache_key={key[1][:16]}")
-    if key in _CACHE:
+    config = resolve_config(config)
+    key = _cache_key("make_cheatsheet", prompt, config)
+    logger.debug(f"make_cheatsheet: app_mode={config.app_mode}, model={config.model}, cache_key={key[1][:16]}")
+    cached = _cache_get(key)
+    if cached is not None:
         logger.debug(f"make_cheatsheet: CACHE HIT for key={key[1][:16]}")
-        return _CACHE[key]
+        return cached
     logger.debug(f"make_cheatsheet: CACHE MISS, generating new content")
-    out = llm_client.generate(prompt)
-    _CACHE[key] = out
+    out = _generate_once(key, prompt, config=config)
     logger.debug(f"make_cheatsheet: cached result with key={key[1][:16]}")
     return out
+
+
+async def amake_cheatsheet(page_context: str, config: Optional[LLMConfig] = None) -> str:
+    prompt = CHEATSHEET_FROM_CONTEXT.format(page_context=page_context)
+    config = resolve_config(config)
+    key = _cache_key("make_cheatsheet", prompt, config)
+    logger.debug(f"amake_cheatsheet: app_mode={config.app_mode}, model={config.model}, cache_key={key[1][:16]}")
+    return await _agenerate_once(key, prompt, config=config)
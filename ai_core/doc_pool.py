@@ -0,0 +1,181 @@
+"""Pool of open PyMuPDF documents keyed by file path.
+
+Opening a PDF parses its xref table, which is a noticeable share of a page
+render for large decks. document(path) hands out a warm fitz.Document instead:
+  - at most PDF_POOL_SIZE documents stay open, least recently used are closed
+  - handles idle for PDF_POOL_IDLE seconds are closed on the next access
+  - each handle has its own lock, held for the duration of the with block,
+    since fitz documents must not be used from two threads at once
+  - a handle is reopened if the file changed on disk
+  - files are opened outside the pool lock, so a slow open only delays
+    borrowers of that same file
+close_document(path) closes a handle when its file goes away.
+"""
+from __future__ import annotations
+
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+logger = logging.getLogger("ai_core.doc_pool")
+
+PDF_POOL_SIZE = int(os.getenv("PDF_POOL_SIZE", "8"))
+PDF_POOL_IDLE = float(os.getenv("PDF_POOL_IDLE", "300"))
+
+
+class _Handle:
+    def __init__(self, path: str, stamp: Tuple[float, int]) -> None:
+        self.key = path
+        self.doc: Any = None  # set by open(), which the creating borrower calls with self.lock held
+        self.error: Optional[Exception] = None
+        self.stamp = stamp
+        self.lock = threading.Lock()
+        self.users = 0  # borrowers holding or waiting for the lock (pool lock guards this)
+        self.last_used = time.monotonic()
+
+    def open(self) -> None:
+        import fitz  # type: ignore
+
+        try:
+            self.doc = fitz.open(self.key)
+        except Exception as e:
+            self.error = e
+            with _pool_lock:
+                if _handles.get(self.key) is self:
+                    _handles.pop(self.key)
+            raise
+
+    def close(self) -> None:
+        if self.doc is None:
+            return
+        try:
+            self.doc.close()
+        except Exception:
+            pass
+
+
+_handles: "OrderedDict[str, _Handle]" = OrderedDict()
+_pool_lock = threading.Lock()
+_stats: Dict[str, int] = {"hits": 0, "opens": 0, "evictions": 0}
+
+
+def _key(path: str) -> str:
+    return os.path.abspath(path)
+
+
+def _stamp(path: str) -> Tuple[float, int]:
+    st = os.stat(path)
+    return st.st_mtime, st.st_size
+
+
+def _evict_locked(now: float) -> None:
+    """Close idle and surplus handles that nobody is using (pool lock held)."""
+    for key in list(_handles):
+        handle = _handles[key]
+        surplus = len(_handles) > PDF_POOL_SIZE
+        idle = PDF_POOL_IDLE > 0 and now - handle.last_used > PDF_POOL_IDLE
+        if not (surplus or idle):
+            continue
+        if handle.users == 0:
+            del _handles[key]
+            handle.close()
+            _stats["evictions"] += 1
+
+
+def _checkout(path: str) -> Tuple[_Handle, bool]:
+    """Reserve the handle for path; a new one comes back locked and not yet opened."""
+    key = _key(path)
+    stamp = _stamp(key)
+    now = time.monotonic()
+    with _pool_lock:
+        handle = _handles.get(key)
+        if handle is not None and handle.stamp != stamp:
+            # File replaced on disk; the last borrower closes the stale handle
+            _handles.pop(key)
+            if handle.users == 0:
+                handle.close()
+            handle = None
+        fresh = handle is None
+        if fresh:
+            handle = _Handle(key, stamp)
+            handle.lock.acquire()  # other borrowers wait here until open() finishes
+            _handles[key] = handle
+            _stats["opens"] += 1
+        else:
+            _stats["hits"] += 1
+        _handles.move_to_end(key)
+        handle.last_used = now
+        handle.users += 1
+        _evict_locked(now)
+    return handle, fresh
+
+
+def _release(handle: _Handle) -> None:
+    with _pool_lock:
+        handle.users -= 1
+        handle.last_used = time.monotonic()
+        orphaned = handle.users == 0 and _handles.get(handle.key) is not handle
+    if orphaned:
+        # Dropped from the pool (file replaced or closed) while in use
+        handle.close()
+
+
+@contextmanager
+def document(path: str) -> Iterator[Any]:
+    """Borrow the pooled fitz.Document for path (exclusive while inside the block)."""
+    handle, fresh = _checkout(path)
+    try:
+        if not fresh:
+            handle.lock.acquire()
+        try:
+            if fresh:
+                handle.open()
+            elif handle.doc is None:
+                raise RuntimeError(f"Could not open {path}: {handle.error}")
+            yield handle.doc
+        finally:
+            handle.lock.release()
+    finally:
+        _release(handle)
+
+
+def page_count(path: str) -> int:
+    with document(path) as doc:
+        return len(doc)
+
+
+def close_document(path: str) -> bool:
+    """Forget the pooled handle for path; it is closed now or by its last borrower."""
+    with _pool_lock:
+        handle = _handles.pop(_key(path), None)
+        if handle is None:
+            return False
+        if handle.users == 0:
+            handle.close()
+    return True
+
+
+def close_all() -> None:
+    with _pool_lock:
+        for handle in _handles.values():
+            if handle.users == 0:
+                handle.close()
+        _handles.clear()
+
+
+def pool_stats() -> Dict[str, Any]:
+    with _pool_lock:
+        return dict(_stats, open=len(_handles))
+
+
+def _reset_after_fork() -> None:
+    # Forget the parent's handles without closing them; workers open their own
+    _handles.clear()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
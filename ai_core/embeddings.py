@@ -1,20 +1,100 @@
 """Embedding index management using sentence-transformers and Chroma.
 
-This keeps a simple API: build_index and query_index.
+This keeps a simple API: build_index and query_index, both backed by one lazily
+loaded MiniLM embedder per process. Each document gets its own
+Chroma collection (namespaced by doc_id) inside a shared persistent store, so
+indexing one PDF never touches the vectors of another. Use create_index,
+open_index, drop_index and list_indexes to manage those collections.
 """
 from __future__ import annotations
 
-from typing import Any, List, Dict
+import hashlib
+import os
+import re
+import threading
+from functools import lru_cache
+from typing import Any, List, Dict, Optional, Tuple
+
+from . import model_host
+
+EMBED_MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+QUERY_CACHE_SIZE = int(os.getenv("EMBED_QUERY_CACHE_SIZE", "1024"))
+
+_COLLECTION_PREFIX = "doc-"
+_LEGACY_COLLECTION = "pages"
+
+_clients: Dict[str, Any] = {}
+_clients_lock = threading.Lock()
+
+_embedder = None  # type: ignore[var-annotated]
+_embedder_lock = threading.Lock()
 
 
 def _load_embedder():
-    try:
-        from sentence_transformers import SentenceTransformer  # type: ignore
-    except Exception as e:  # pragma: no cover - import guard
-        raise RuntimeError(
-            "sentence-transformers is required. Please install 'sentence-transformers'."
-        ) from e
-    return SentenceTransformer("sentence-transformers/all-MiniLM-L6-v2")
+    """Return the process-wide MiniLM embedder, loading it on first use."""
+    global _embedder
+    if _embedder is None:
+        with _embedder_lock:
+            if _embedder is None:
+                try:
+                    from sentence_transformers import SentenceTransformer  # type: ignore
+                except Exception as e:  # pragma: no cover - import guard
+                    raise RuntimeError(
+                        "sentence-transformers is required. Please install 'sentence-transformers'."
+                    ) from e
+                _embedder = SentenceTransformer(EMBED_MODEL_NAME)
+    return _embedder
+
+
+def warmup(encode: bool = True) -> None:
+    """Load MiniLM now and, unless encode is False, run one encode so the first
+    query does not pay for it (a pre-fork master loads weights only)."""
+    if model_host.enabled():
+        model_host.client().warmup(["embedder"])
+        return
+    model = _load_embedder()
+    if encode:
+        model.encode(["warmup"], show_progress_bar=False)
+
+
+def is_loaded() -> bool:
+    if model_host.enabled():
+        return model_host.remote_loaded("embedder")
+    return _embedder is not None
+
+
+def warmup_store(index_dir: str) -> None:
+    """Import Chroma and open the persistent client for index_dir."""
+    _get_client(index_dir)
+
+
+def store_loaded(index_dir: str) -> bool:
+    return index_dir in _clients
+
+
+def embed_documents(texts: List[str]) -> List[List[float]]:
+    """Encode texts with the shared embedder (normalized, same space as queries)."""
+    if not texts:
+        return []
+    if model_host.enabled():
+        return model_host.client().embed(texts)
+    vectors = _load_embedder().encode(texts, show_progress_bar=False, normalize_embeddings=True)
+    return [list(map(float, v)) for v in vectors]
+
+
+@lru_cache(maxsize=QUERY_CACHE_SIZE)
+def _embed_query_cached(text: str) -> Tuple[float, ...]:
+    return tuple(embed_documents([text])[0])
+
+
+def embed_query(text: str) -> List[float]:
+    """Encode a single query, reusing the vector for repeated questions."""
+    return list(_embed_query_cached(text))
+
+
+def query_cache_info():
+    """Expose hit/miss counters of the query vector cache."""
+    return _embed_query_cached.cache_info()
 
 
 def _load_chroma():
@@ -26,43 +106,129 @@ def _load_chroma():
     return chromadb
 
 
-def build_index(page_contexts: List[Dict], index_dir: str) -> Any:
+def _get_client(index_dir: str) -> Any:
+    """Return a process-wide PersistentClient for index_dir (one per directory)."""
+    with _clients_lock:
+        client = _clients.get(index_dir)
+        if client is None:
+            chromadb = _load_chroma()
+            client = chromadb.PersistentClient(path=index_dir)
+            _clients[index_dir] = client
+        return client
+
+
+def collection_name(doc_id: str) -> str:
+    """Map a doc_id to a valid Chroma collection name.
+
+    Chroma names must be 3-63 chars of [a-zA-Z0-9._-] starting and ending with an
+    alphanumeric character; uuids fit as-is once prefixed. Any other id that had
+    to be rewritten or shortened gets a hash of the original appended, so two
+    ids never share a collection. The original id is kept in the metadata.
+    """
+    doc_id = str(doc_id)
+    safe = re.sub(r"[^a-zA-Z0-9._-]", "-", doc_id).strip("._-")
+    name = _COLLECTION_PREFIX + safe
+    if safe and safe == doc_id and len(name) <= 63:
+        return name
+    digest = hashlib.sha1(doc_id.encode("utf-8")).hexdigest()[:12]
+    return name[:63 - len(digest) - 1].rstrip("._-") + "-" + digest
+
+
+def create_index(doc_id: str, index_dir: str) -> Any:
+    """Create (or return the existing) empty collection for doc_id."""
+    client = _get_client(index_dir)
+    return client.get_or_create_collection(
+        name=collection_name(doc_id), metadata={"doc_id": str(doc_id)}
+    )
+
+
+def open_index(doc_id: str, index_dir: str) -> Optional[Any]:
+    """Open the persisted collection for doc_id.
+
+    Returns None if the collection does not exist or holds no vectors, so callers
+    can decide whether to rebuild.
+    """
+    client = _get_client(index_dir)
+    try:
+        collection = client.get_collection(name=collection_name(doc_id))
+    except Exception:
+        return None
+    try:
+        if not collection.count():
+            return None
+    except Exception:
+        return None
+    return collection
+
+
+def drop_index(doc_id: str, index_dir: str) -> bool:
+    """Delete the collection for doc_id. Returns True if something was removed."""
+    client = _get_client(index_dir)
+    try:
+        client.delete_collection(name=collection_name(doc_id))
+        return True
+    except Exception:
+        return False
+
+
+def list_indexes(index_dir: str) -> List[str]:
+    """Return the doc_ids that have a persisted collection under index_dir."""
+    client = _get_client(index_dir)
+    out: List[str] = []
+    for c in client.list_collections():
+        # Older chromadb returns Collection objects, newer returns names
+        name = c if isinstance(c, str) else getattr(c, "name", "")
+        if not name.startswith(_COLLECTION_PREFIX):
+            continue
+        try:
+            collection = client.get_collection(name=name) if isinstance(c, str) else c
+            doc_id = (collection.metadata or {}).get("doc_id")
+        except Exception:
+            doc_id = None
+        # Collections created before doc_id was stored in metadata
+        out.append(doc_id or name[len(_COLLECTION_PREFIX):])
+    return out
+
+
+def build_index(page_contexts: List[Dict], index_dir: str, doc_id: Optional[str] = None) -> Any:
     """Build a Chroma index storing page contexts.
 
     Each page_context dict must contain keys: 'page_id' and 'page_context'.
+    When doc_id is given the pages go into that document's own collection;
+    otherwise the legacy shared "pages" collection is used.
     Returns a Chroma collection instance (acts as our index).
     """
-    chromadb = _load_chroma()
-    client = chromadb.PersistentClient(path=index_dir)
-    collection = client.get_or_create_collection(name="pages")
-
-    embedder = _load_embedder()
+    if doc_id is not None:
+        collection = create_index(doc_id, index_dir)
+    else:
+        collection = _get_client(index_dir).get_or_create_collection(name=_LEGACY_COLLECTION)
 
     documents = [pc.get("page_context", "") for pc in page_contexts]
     ids = [str(pc.get("page_id", i)) for i, pc in enumerate(page_contexts)]
     metadatas = [{"page_id": int(pc.get("page_id", i))} for i, pc in enumerate(page_contexts)]
 
-    # Clear and add fresh to keep idempotent for tests
-    try:
-        existing = collection.count()
-        if existing:
-            collection.delete(where={})
-    except Exception:
-        pass
+    if not documents:
+        return collection
 
-    # Pre-compute embeddings to avoid multiple model loads
-    vectors = embedder.encode(documents, show_progress_bar=False, normalize_embeddings=True)
+    # Pre-compute embeddings with the shared model so queries score in the same space
+    vectors = embed_documents(documents)
 
-    collection.add(documents=documents, metadatas=metadatas, ids=ids, embeddings=vectors)
+    # Upsert keyed by page_id keeps rebuilds idempotent within the collection
+    collection.upsert(documents=documents, metadatas=metadatas, ids=ids, embeddings=vectors)
     return collection
 
 
 def query_index(index: Any, text: str, k: int = 3) -> List[Dict]:
-    """Query the Chroma index and return top-k results with page_id and score."""
+    """Query the Chroma index and return top-k results with page_id and score.
+
+    The query is embedded with the same MiniLM model used at index time; passing
+    query_texts would make Chroma load its own default embedding function.
+    """
     if not text:
         return []
     try:
-        results = index.query(query_texts=[text], n_results=max(1, int(k)))
+        vector = embed_query(text)
+        results = index.query(query_embeddings=[vector], n_results=max(1, int(k)))
         out: List[Dict] = []
         for i in range(len(results.get("ids", [[]])[0])):
             pid = int(results["metadatas"][0][i]["page_id"])  # type: ignore[index]
@@ -73,3 +239,12 @@ def query_index(index: Any, text: str, k: int = 3) -> List[Dict]:
         return out
     except Exception:
         return []
+
+
+def _reset_after_fork() -> None:
+    # Chroma clients hold SQLite connections; the MiniLM weights stay shared
+    _clients.clear()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
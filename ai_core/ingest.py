@@ -2,102 +2,399 @@
 
 Relies on PyMuPDF (fitz) for text and image extraction, pdf2image to render full page
 bitmaps for OCR fallback.
+
+Pages go through three stages:
+  1. extract  - PyMuPDF text, OCR renders and embedded images (thread pool; each
+                thread opens its own document handle since fitz is not thread-safe)
+  2. ocr/caption - EasyOCR per page and BLIP over all of the document's images
+                in batches (in-process, or a process pool when
+                INGEST_PROCESSES > 0 since both are CPU-bound)
+  3. merge    - merge_fields per page, in page order
+The output is identical to processing pages one after another.
+
+load_pdf returns the whole document at once; iter_pages runs the same stages
+over windows of INGEST_WINDOW pages and yields each page as soon as its window
+is merged, so callers can publish early pages while later ones are still in OCR.
 """
 from __future__ import annotations
 
-from typing import List, Dict
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from typing import Any, Callable, Iterator, List, Dict, Optional
+
+logger = logging.getLogger("ai_core.ingest")
+
+INGEST_THREADS = int(os.getenv("INGEST_THREADS", str(min(4, os.cpu_count() or 1))))
+INGEST_PROCESSES = int(os.getenv("INGEST_PROCESSES", "0"))
+INGEST_WINDOW = int(os.getenv("INGEST_WINDOW", "8"))
+
+_process_pool: Optional[ProcessPoolExecutor] = None
+_process_pool_size = 0
+_process_pool_lock = threading.Lock()
 
 
 def _word_tokens(s: str) -> int:
     return len([w for w in (s or "").split() if w])
 
 
-def load_pdf(path: str) -> List[Dict]:
-    """Load a PDF and produce page contexts.
+def _get_process_pool(workers: int) -> ProcessPoolExecutor:
+    """Reuse one process pool so each worker keeps its OCR/BLIP models warm."""
+    global _process_pool, _process_pool_size
+    with _process_pool_lock:
+        if _process_pool is None or _process_pool_size != workers:
+            if _process_pool is not None:
+                _process_pool.shutdown(wait=False)
+            _process_pool = ProcessPoolExecutor(max_workers=workers)
+            _process_pool_size = workers
+        return _process_pool
 
-    Returns list of dicts: {"page_id", "raw_text", "ocr_text", "captions", "page_context", "tokens"}
+
+def _render_for_ocr(path: str, page, page_id: int):
+    """Render a page bitmap for OCR (pdf2image if available, else PyMuPDF at 2x)."""
+    import fitz  # type: ignore
+    from PIL import Image  # type: ignore
+
+    try:
+        from pdf2image import convert_from_path  # type: ignore
+    except Exception:
+        convert_from_path = None  # type: ignore
+
+    if convert_from_path is not None:
+        page_images = convert_from_path(path, first_page=page_id, last_page=page_id)
+        return page_images[0]
+    # Fallback: render via PyMuPDF directly
+    try:
+        zoom = 2.0
+        mat = fitz.Matrix(zoom, zoom)
+        pix = page.get_pixmap(matrix=mat)
+        mode = "RGB" if pix.alpha == 0 else "RGBA"
+        return Image.frombytes(mode, [pix.width, pix.height], pix.samples)
+    except Exception:
+        return None
+
+
+def _extract_images(doc, page, seen: Optional[Dict[int, Any]] = None) -> List[Any]:
+    """Return embedded images on the page as RGB PIL images (failures are skipped).
+
+    seen memoizes decoded images by xref so a logo repeated on every slide is
+    decoded once per document handle.
     """
-    # Local imports to avoid heavy load if unused
     import fitz  # type: ignore
     from PIL import Image  # type: ignore
 
-    from .cleaning import merge_fields, compact_whitespace
-    from .ocr import extract_text as ocr_extract
-    from .caption import caption_image
+    images: List[Any] = []
+    for img in page.get_images(full=True):
+        xref = img[0]
+        if seen is not None and xref in seen:
+            images.append(seen[xref])
+            continue
+        try:
+            pix = fitz.Pixmap(doc, xref)
+            if pix.n < 5:  # GRAY or RGB
+                pil_img = Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
+            else:  # CMYK -> convert to RGB
+                pix = fitz.Pixmap(fitz.csRGB, pix)
+                pil_img = Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
+            images.append(pil_img)
+            if seen is not None:
+                seen[xref] = pil_img
+        except Exception:
+            continue
+    return images
 
-    doc = fitz.open(path)
 
-    results: List[Dict] = []
-    for i, page in enumerate(doc):
-        page_id = i + 1
-        raw_text = page.get_text("text") or ""
+def _extract_range(path: str, page_indices: List[int], doc=None) -> List[Dict]:
+    """Stage 1 for a contiguous range of pages.
 
-        # OCR fallback if raw text is missing or very short
-        ocr_text = ""
-        if len(raw_text.strip()) < 20:
-            try:
-                # Render this page only to avoid Poppler requirement if not needed
+    Uses doc if given, otherwise a private document handle so several ranges
+    can be extracted in parallel threads.
+    """
+    import fitz  # type: ignore
+
+    out: List[Dict] = []
+    seen: Dict[int, Any] = {}
+    own = doc is None
+    if own:
+        doc = fitz.open(path)
+    try:
+        for i in page_indices:
+            page = doc[i]
+            page_id = i + 1
+            raw_text = page.get_text("text") or ""
+
+            # OCR fallback if raw text is missing or very short
+            ocr_image = None
+            needs_ocr = len(raw_text.strip()) < 20
+            if needs_ocr:
                 try:
-                    from pdf2image import convert_from_path  # type: ignore
+                    ocr_image = _render_for_ocr(path, page, page_id)
                 except Exception:
-                    convert_from_path = None  # type: ignore
-
-                if convert_from_path is not None:
-                    page_images = convert_from_path(path, first_page=page_id, last_page=page_id)
-                    full_img = page_images[0]
-                else:
-                    # Fallback: render via PyMuPDF directly
-                    try:
-                        zoom = 2.0
-                        mat = fitz.Matrix(zoom, zoom)
-                        pix = page.get_pixmap(matrix=mat)
-                        mode = "RGB" if pix.alpha == 0 else "RGBA"
-                        pil_bytes_mode = mode
-                        from PIL import Image  # type: ignore
-
-                        full_img = Image.frombytes(mode, [pix.width, pix.height], pix.samples)
-                        ocr_text = ocr_extract(full_img)
-                    except Exception:
-                        full_img = None
-                if full_img is not None and not ocr_text:
-                    ocr_text = ocr_extract(full_img)
+                    ocr_image = None
+
+            try:
+                images = _extract_images(doc, page, seen)
             except Exception:
-                ocr_text = ""
+                images = []
 
-        # Image captions for embedded images on the page
-        captions: List[str] = []
-        try:
-            image_list = page.get_images(full=True)
-            for img in image_list:
-                xref = img[0]
-                try:
-                    pix = fitz.Pixmap(doc, xref)
-                    if pix.n < 5:  # GRAY or RGB
-                        pil_img = Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
-                    else:  # CMYK -> convert to RGB
-                        pix = fitz.Pixmap(fitz.csRGB, pix)
-                        pil_img = Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
-                    cap = caption_image(pil_img)
-                    if cap:
-                        captions.append(cap)
-                except Exception:
-                    continue
-        except Exception:
-            captions = []
-
-        page_context = merge_fields(raw_text, ocr_text, captions)
-        page_context = compact_whitespace(page_context)
-        tokens = _word_tokens(page_context)
-
-        results.append(
-            {
-                "page_id": page_id,
-                "raw_text": raw_text,
-                "ocr_text": ocr_text,
-                "captions": captions,
-                "page_context": page_context,
-                "tokens": tokens,
-            }
-        )
-
-    return results
+            out.append(
+                {
+                    "page_id": page_id,
+                    "raw_text": raw_text,
+                    "ocr_image": ocr_image,
+                    "images": images,
+                }
+            )
+    finally:
+        if own:
+            doc.close()
+    return out
+
+
+def _ocr_page(image) -> str:
+    """Stage 2 OCR worker; top-level so it can run in a process pool."""
+    from .ocr import extract_text as ocr_extract
+
+    if image is None:
+        return ""
+    try:
+        return ocr_extract(image)
+    except Exception:
+        return ""
+
+
+def _caption_batch(images: List[Any]) -> List[str]:
+    """Stage 2 caption worker for one batch; top-level so it can run in a process pool."""
+    from .caption import CAPTION_BATCH_SIZE, CAPTION_MAX_SIDE, _generate_captions
+
+    try:
+        # Images arrive already hashed, deduplicated and checked against the
+        # caption cache by _caption_document, so go straight to BLIP
+        return _generate_captions(images, CAPTION_BATCH_SIZE, CAPTION_MAX_SIDE)
+    except Exception:
+        return [""] * len(images)
+
+
+def _caption_document(
+    extracted: List[Dict],
+    pool: Optional[ProcessPoolExecutor],
+    report: Optional[Callable[[str, int, int], None]] = None,
+) -> List[List[str]]:
+    """Caption every embedded image of the document in a few batched passes.
+
+    Images are keyed by pixel hash: repeats within the deck are captioned once and
+    images already in the persistent caption cache skip BLIP entirely. The
+    remaining unique images are captioned CAPTION_BATCH_SIZE at a time (batches
+    are spread over the process pool if one is given), then captions are
+    regrouped per page in their original order. Empty captions are dropped.
+    """
+    from .caption import CAPTION_BATCH_SIZE, image_key, get_cached_captions, put_cached_captions
+
+    owners: List[int] = []
+    keys: List[str] = []
+    key_by_obj: Dict[int, str] = {}
+    todo: Dict[str, Any] = {}
+    for idx, p in enumerate(extracted):
+        for img in p["images"]:
+            # The same xref on several pages yields the same image object
+            key = key_by_obj.get(id(img))
+            if key is None:
+                key = image_key(img)
+                key_by_obj[id(img)] = key
+            owners.append(idx)
+            keys.append(key)
+            todo.setdefault(key, img)
+
+    known = get_cached_captions(keys)
+    misses = [(k, img) for k, img in todo.items() if k not in known]
+
+    batches = [misses[i:i + CAPTION_BATCH_SIZE] for i in range(0, len(misses), CAPTION_BATCH_SIZE)]
+    results: List[List[str]] = []
+    futs = [pool.submit(_caption_batch, [img for _, img in b]) for b in batches] if pool is not None else []
+    for i, b in enumerate(batches):
+        results.append(futs[i].result() if pool is not None else _caption_batch([img for _, img in b]))
+        if report is not None:
+            report("caption", sum(len(x) for x in batches[: i + 1]), len(misses))
+
+    fresh: Dict[str, str] = {}
+    for batch, caps in zip(batches, results):
+        fresh.update((k, cap) for (k, _), cap in zip(batch, caps))
+    put_cached_captions(fresh)
+    known.update(fresh)
+
+    captions: List[List[str]] = [[] for _ in extracted]
+    for owner, key in zip(owners, keys):
+        cap = known.get(key, "")
+        if cap:
+            captions[owner].append(cap)
+    logger.debug(
+        "captions: %d images, %d unique, %d sent to BLIP", len(keys), len(todo), len(misses)
+    )
+    return captions
+
+
+def _chunks(n: int, parts: int) -> List[List[int]]:
+    parts = max(1, min(parts, n))
+    size, extra = divmod(n, parts)
+    out: List[List[int]] = []
+    start = 0
+    for p in range(parts):
+        end = start + size + (1 if p < extra else 0)
+        out.append(list(range(start, end)))
+        start = end
+    return [c for c in out if c]
+
+
+def iter_pages(
+    path: str,
+    window: Optional[int] = None,
+    first_page: int = 0,
+    threads: Optional[int] = None,
+    processes: Optional[int] = None,
+    timings: Optional[Dict[str, float]] = None,
+    progress: Optional[Callable[[str, int, int], None]] = None,
+) -> Iterator[Dict]:
+    """Yield page contexts in page order as soon as each window of pages is done.
+
+    Pages are processed INGEST_WINDOW at a time through all three stages, so the
+    first pages are available long before the last one is OCRed and captioned.
+    window=0 processes the whole document as one window (what load_pdf does).
+    first_page (0-based) skips pages a previous, interrupted run already produced.
+    Other arguments are as for load_pdf; stage timings and progress counts
+    accumulate across windows.
+    """
+    from . import doc_pool
+    from .cleaning import merge_fields, compact_whitespace
+
+    def report(stage_name: str, done: int, total: int) -> None:
+        if progress is not None:
+            try:
+                progress(stage_name, done, total)
+            except Exception:
+                pass
+
+    threads = INGEST_THREADS if threads is None else threads
+    processes = INGEST_PROCESSES if processes is None else processes
+    window = INGEST_WINDOW if window is None else window
+    stage: Dict[str, float] = {"extract": 0.0, "ocr": 0.0, "caption": 0.0, "merge": 0.0}
+    t_start = time.perf_counter()
+    pool = _get_process_pool(processes) if processes and processes > 0 else None
+
+    page_count = doc_pool.page_count(path)
+    step = window if window and window > 0 else max(1, page_count)
+    counts = {"extract": 0, "ocr": 0, "merge": 0}
+
+    for first in range(max(0, first_page), page_count, step):
+        indices = list(range(first, min(first + step, page_count)))
+
+        # Stage 1: extraction, one document handle per thread (the pooled one if single-threaded)
+        t0 = time.perf_counter()
+        ranges = [[indices[i] for i in r] for r in _chunks(len(indices), max(1, threads))]
+        extracted: List[Dict] = []
+        if len(ranges) <= 1:
+            for r in ranges:
+                with doc_pool.document(path) as doc:
+                    extracted.extend(_extract_range(path, r, doc))
+                counts["extract"] += len(r)
+                report("extract", counts["extract"], page_count)
+        else:
+            with ThreadPoolExecutor(max_workers=len(ranges)) as tpool:
+                for part in tpool.map(lambda r: _extract_range(path, r), ranges):
+                    extracted.extend(part)
+                    counts["extract"] += len(part)
+                    report("extract", counts["extract"], page_count)
+        stage["extract"] += time.perf_counter() - t0
+
+        # Stage 2: OCR and captions
+        t0 = time.perf_counter()
+        ocr_futs = [pool.submit(_ocr_page, p["ocr_image"]) for p in extracted] if pool is not None else []
+        ocr_texts: List[str] = []
+        for i, p in enumerate(extracted):
+            ocr_texts.append(ocr_futs[i].result() if pool is not None else _ocr_page(p["ocr_image"]))
+            counts["ocr"] += 1
+            report("ocr", counts["ocr"], page_count)
+        stage["ocr"] += time.perf_counter() - t0
+        t0 = time.perf_counter()
+        captions = _caption_document(extracted, pool, report)
+        stage["caption"] += time.perf_counter() - t0
+
+        # Stage 3: merge in page order
+        t0 = time.perf_counter()
+        results: List[Dict] = []
+        for p, ocr_text, caps in zip(extracted, ocr_texts, captions):
+            page_context = merge_fields(p["raw_text"], ocr_text, caps)
+            page_context = compact_whitespace(page_context)
+            tokens = _word_tokens(page_context)
+
+            results.append(
+                {
+                    "page_id": p["page_id"],
+                    "raw_text": p["raw_text"],
+                    "ocr_text": ocr_text,
+                    "captions": caps,
+                    "page_context": page_context,
+                    "tokens": tokens,
+                }
+            )
+            counts["merge"] += 1
+            report("merge", counts["merge"], page_count)
+        stage["merge"] += time.perf_counter() - t0
+
+        for r in results:
+            yield r
+
+    stage["total"] = time.perf_counter() - t_start
+    logger.info(
+        "load_pdf %s: %d pages, threads=%d processes=%d window=%d | %s",
+        path,
+        page_count,
+        threads,
+        processes,
+        step,
+        " ".join(f"{k}={v:.2f}s" for k, v in stage.items()),
+    )
+    if timings is not None:
+        timings.update(stage)
+    try:
+        from .caption import cache_stats
+
+        logger.info("caption cache: %s", cache_stats())
+    except Exception:
+        pass
+
+
+def load_pdf(
+    path: str,
+    threads: Optional[int] = None,
+    processes: Optional[int] = None,
+    timings: Optional[Dict[str, float]] = None,
+    progress: Optional[Callable[[str, int, int], None]] = None,
+) -> List[Dict]:
+    """Load a PDF and produce page contexts.
+
+    Args:
+        path: PDF file path.
+        threads: PyMuPDF extraction threads (default INGEST_THREADS).
+        processes: OCR/caption worker processes; 0 runs them in-process
+            (default INGEST_PROCESSES).
+        timings: Optional dict filled with per-stage wall-clock seconds
+            ("extract", "ocr", "caption", "merge", "total").
+        progress: Optional callback progress(stage, done, total) called as pages
+            finish each stage (for captions, done/total count images).
+
+    Returns list of dicts: {"page_id", "raw_text", "ocr_text", "captions", "page_context", "tokens"}
+    Use iter_pages to receive pages incrementally instead.
+    """
+    return list(iter_pages(path, window=0, threads=threads, processes=processes,
+                           timings=timings, progress=progress))
+
+
+def _reset_after_fork() -> None:
+    global _process_pool
+    _process_pool = None
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
@@ -0,0 +1,352 @@
+"""Pluggable cache backends for LLM responses used by ai_core.chains.
+
+Backends share a tiny interface (get/set/delete/clear/stats) over string keys:
+  - MemoryCache: in-process LRU with optional TTL and a byte budget
+  - SQLiteCache: persistent file tier (WAL mode) shared safely by several
+    worker processes and surviving restarts
+  - TieredCache: a MemoryCache in front of a SQLiteCache
+
+get_cache() builds the process-wide cache from environment variables:
+  LLM_CACHE_BACKEND    memory | sqlite | tiered (default tiered)
+  LLM_CACHE_PATH       SQLite file (default ./data/llm_cache.sqlite3)
+  LLM_CACHE_MAX_ITEMS  in-memory entry limit (default 2048)
+  LLM_CACHE_MAX_BYTES  in-memory byte budget (default 64 MiB)
+  LLM_CACHE_TTL        seconds before entries expire, 0 = never (default 0)
+  LLM_CACHE_DISK_MAX_ITEMS  persistent row limit, least recently used evicted (default 100000)
+  LLM_CACHE_DISK_MAX_BYTES  persistent size limit in UTF-8 bytes of values (default 512 MiB)
+"""
+from __future__ import annotations
+
+import logging
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+logger = logging.getLogger("ai_core.llm_cache")
+
+
+class BaseCache(ABC):
+    """Minimal cache interface; subclasses implement the storage."""
+
+    def __init__(self) -> None:
+        self._stats_lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+    def _count(self, hit: bool) -> None:
+        with self._stats_lock:
+            if hit:
+                self._hits += 1
+            else:
+                self._misses += 1
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[str]:
+        ...
+
+    @abstractmethod
+    def set(self, key: str, value: str) -> None:
+        ...
+
+    @abstractmethod
+    def delete(self, key: str) -> None:
+        ...
+
+    @abstractmethod
+    def clear(self) -> None:
+        ...
+
+    def stats(self) -> Dict[str, object]:
+        with self._stats_lock:
+            return {"backend": type(self).__name__, "hits": self._hits, "misses": self._misses}
+
+
+class MemoryCache(BaseCache):
+    """Thread-safe LRU bounded by entry count and total UTF-8 bytes, with optional TTL."""
+
+    def __init__(self, max_items: int = 2048, max_bytes: int = 64 * 1024 * 1024, ttl: float = 0) -> None:
+        super().__init__()
+        self.max_items = max(1, int(max_items))
+        self.max_bytes = max(1, int(max_bytes))
+        self.ttl = float(ttl or 0)
+        self._data: "OrderedDict[str, Tuple[str, float, int]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._evictions = 0
+
+    def _expired(self, stored_at: float) -> bool:
+        return bool(self.ttl) and (time.time() - stored_at) > self.ttl
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None and self._expired(item[1]):
+                self._drop(key)
+                item = None
+            if item is not None:
+                self._data.move_to_end(key)
+        self._count(item is not None)
+        return item[0] if item is not None else None
+
+    def set(self, key: str, value: str, stored_at: Optional[float] = None) -> None:
+        size = len(value.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._data:
+                self._drop(key)
+            self._data[key] = (value, stored_at or time.time(), size)
+            self._bytes += size
+            while len(self._data) > self.max_items or self._bytes > self.max_bytes:
+                oldest = next(iter(self._data))
+                self._drop(oldest)
+                self._evictions += 1
+
+    def _drop(self, key: str) -> None:
+        _, _, size = self._data.pop(key)
+        self._bytes -= size
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            if key in self._data:
+                self._drop(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, object]:
+        out = super().stats()
+        with self._lock:
+            out.update(
+                {"items": len(self._data), "bytes": self._bytes, "evictions": self._evictions}
+            )
+        return out
+
+
+class SQLiteCache(BaseCache):
+    """Persistent cache in a SQLite file, safe to share between worker processes.
+
+    Uses WAL journaling so readers never block the writer; each thread gets its
+    own connection. Bounded as an LRU by row count and total value bytes: hits
+    refresh accessed_at (at most once per _TOUCH_EVERY seconds per entry) and
+    the least recently read rows are evicted. stored_at is kept for the TTL.
+    """
+
+    _TOUCH_EVERY = 60.0
+
+    def __init__(self, path: str, ttl: float = 0, max_items: int = 100000,
+                 max_bytes: int = 512 * 1024 * 1024) -> None:
+        super().__init__()
+        self.path = path
+        self.ttl = float(ttl or 0)
+        self.max_items = max(1, int(max_items))
+        self.max_bytes = max(1, int(max_bytes))
+        self._local = threading.local()
+        self._writes = 0
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS llm_cache ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, stored_at REAL NOT NULL, "
+                "accessed_at REAL, size INTEGER)"
+            )
+            # Columns added after the first release of this table
+            cols = [r[1] for r in conn.execute("PRAGMA table_info(llm_cache)").fetchall()]
+            if "accessed_at" not in cols:
+                conn.execute("ALTER TABLE llm_cache ADD COLUMN accessed_at REAL")
+                conn.execute("UPDATE llm_cache SET accessed_at = stored_at")
+            if "size" not in cols:
+                conn.execute("ALTER TABLE llm_cache ADD COLUMN size INTEGER")
+                conn.execute("UPDATE llm_cache SET size = LENGTH(CAST(value AS BLOB))")
+            conn.execute("DROP INDEX IF EXISTS llm_cache_stored_at")
+            conn.execute("CREATE INDEX IF NOT EXISTS llm_cache_accessed_at ON llm_cache(accessed_at)")
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get_with_time(self, key: str) -> Optional[Tuple[str, float]]:
+        try:
+            row = self._conn().execute(
+                "SELECT value, stored_at, accessed_at FROM llm_cache WHERE key = ?", (key,)
+            ).fetchone()
+        except Exception as e:
+            logger.warning(f"SQLite cache read failed: {e}")
+            row = None
+        now = time.time()
+        if row is not None and self.ttl and (now - row[1]) > self.ttl:
+            self.delete(key)
+            row = None
+        if row is not None and now - (row[2] or 0) > self._TOUCH_EVERY:
+            self._touch(key, now)
+        self._count(row is not None)
+        return (row[0], row[1]) if row is not None else None
+
+    def get(self, key: str) -> Optional[str]:
+        item = self.get_with_time(key)
+        return item[0] if item is not None else None
+
+    def _touch(self, key: str, now: float) -> None:
+        try:
+            conn = self._conn()
+            with conn:
+                conn.execute("UPDATE llm_cache SET accessed_at = ? WHERE key = ?", (now, key))
+        except Exception as e:
+            logger.warning(f"SQLite cache touch failed: {e}")
+
+    def set(self, key: str, value: str) -> None:
+        now = time.time()
+        try:
+            conn = self._conn()
+            with conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO llm_cache (key, value, stored_at, accessed_at, size) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (key, value, now, now, len(value.encode("utf-8"))),
+                )
+                self._writes += 1
+                if self._writes % 100 == 0:
+                    self._trim(conn)
+        except Exception as e:
+            logger.warning(f"SQLite cache write failed: {e}")
+
+    def _trim(self, conn: sqlite3.Connection) -> None:
+        """Evict the least recently read rows beyond max_items or max_bytes."""
+        conn.execute(
+            "DELETE FROM llm_cache WHERE key IN (SELECT key FROM llm_cache "
+            "ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_items,),
+        )
+        conn.execute(
+            "DELETE FROM llm_cache WHERE key IN (SELECT key FROM ("
+            "SELECT key, SUM(size) OVER (ORDER BY accessed_at DESC, key) AS total FROM llm_cache"
+            ") WHERE total > ?)",
+            (self.max_bytes,),
+        )
+
+    def delete(self, key: str) -> None:
+        try:
+            conn = self._conn()
+            with conn:
+                conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+        except Exception as e:
+            logger.warning(f"SQLite cache delete failed: {e}")
+
+    def clear(self) -> None:
+        try:
+            conn = self._conn()
+            with conn:
+                conn.execute("DELETE FROM llm_cache")
+        except Exception as e:
+            logger.warning(f"SQLite cache clear failed: {e}")
+
+    def stats(self) -> Dict[str, object]:
+        out = super().stats()
+        try:
+            out["items"], out["bytes"] = self._conn().execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM llm_cache"
+            ).fetchone()
+        except Exception:
+            out["items"] = None
+        out["path"] = self.path
+        return out
+
+
+class TieredCache(BaseCache):
+    """Memory LRU in front of a persistent SQLite tier."""
+
+    def __init__(self, memory: MemoryCache, disk: SQLiteCache) -> None:
+        super().__init__()
+        self.memory = memory
+        self.disk = disk
+
+    def get(self, key: str) -> Optional[str]:
+        value = self.memory.get(key)
+        if value is None:
+            item = self.disk.get_with_time(key)
+            if item is not None:
+                value = item[0]
+                # Keep the original timestamp so TTL is measured from generation
+                self.memory.set(key, value, stored_at=item[1])
+        self._count(value is not None)
+        return value
+
+    def set(self, key: str, value: str) -> None:
+        self.memory.set(key, value)
+        self.disk.set(key, value)
+
+    def delete(self, key: str) -> None:
+        self.memory.delete(key)
+        self.disk.delete(key)
+
+    def clear(self) -> None:
+        self.memory.clear()
+        self.disk.clear()
+
+    def stats(self) -> Dict[str, object]:
+        out = super().stats()
+        out["memory"] = self.memory.stats()
+        out["disk"] = self.disk.stats()
+        return out
+
+
+_cache: Optional[BaseCache] = None
+_cache_lock = threading.Lock()
+
+
+def build_cache(backend: Optional[str] = None) -> BaseCache:
+    """Create a cache backend from environment configuration."""
+    backend = (backend or os.getenv("LLM_CACHE_BACKEND", "tiered")).lower()
+    ttl = float(os.getenv("LLM_CACHE_TTL", "0") or 0)
+    memory = MemoryCache(
+        max_items=int(os.getenv("LLM_CACHE_MAX_ITEMS", "2048")),
+        max_bytes=int(os.getenv("LLM_CACHE_MAX_BYTES", str(64 * 1024 * 1024))),
+        ttl=ttl,
+    )
+    if backend == "memory":
+        return memory
+    try:
+        disk = SQLiteCache(
+            os.getenv("LLM_CACHE_PATH", "./data/llm_cache.sqlite3"),
+            ttl=ttl,
+            max_items=int(os.getenv("LLM_CACHE_DISK_MAX_ITEMS", "100000")),
+            max_bytes=int(os.getenv("LLM_CACHE_DISK_MAX_BYTES", str(512 * 1024 * 1024))),
+        )
+    except Exception as e:
+        logger.warning(f"Persistent LLM cache unavailable, using memory only: {e}")
+        return memory
+    if backend == "sqlite":
+        return disk
+    return TieredCache(memory, disk)
+
+
+def get_cache() -> BaseCache:
+    """Return the process-wide LLM response cache, creating it on first use."""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = build_cache()
+    return _cache
+
+
+def _reset_after_fork() -> None:
+    # SQLite connections must not be shared with the parent process
+    global _cache
+    _cache = None
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
@@ -1,18 +1,48 @@
 """LLM client abstraction supporting cloud (OpenAI gpt-4o-mini) and local (Ollama).
 
-APP_MODE environment variable controls backend: 'cloud' | 'local'.
+APP_MODE environment variable controls the default backend: 'cloud' | 'local'.
+Per-call provider/model selection is passed as an LLMConfig.
+
+generate() is the blocking API; agenerate() is the coroutine API for async
+callers and astream() yields the completion incrementally as text chunks.
+Ollama requests go through pooled keep-alive HTTP clients (a shared
+requests.Session, and one httpx.AsyncClient per event loop) and Gemini model
+objects are configured once and reused. LLM_MAX_CONCURRENCY bounds in-flight
+async calls per event loop.
 """
 from __future__ import annotations
 
+import asyncio
 import hashlib
+import json
 import os
+import threading
 import time
-from typing import Optional
+import weakref
+from dataclasses import dataclass, replace
+from typing import Any, AsyncIterator, Dict, Optional, Tuple
 
 import requests
 
 
 MAX_TOKENS_APPROX = 800  # simple safety to avoid huge outputs in tests
+OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434").rstrip("/")
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "16"))
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "30"))
+
+_session: Optional[requests.Session] = None
+_session_lock = threading.Lock()
+
+# Per event loop: (httpx.AsyncClient or None, asyncio.Semaphore). Keyed by the
+# loop object itself: ids are reused once a loop is garbage collected
+_async_state: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Tuple[Any, asyncio.Semaphore]]" = (
+    weakref.WeakKeyDictionary()
+)
+_async_state_lock = threading.Lock()
+
+_gemini_models: Dict[Tuple[str, str], Any] = {}
+_gemini_configured_key: Optional[str] = None
+_gemini_lock = threading.Lock()
 
 
 def _truncate_prompt(text: str, max_chars: int = 6000) -> str:
@@ -23,72 +53,320 @@ def _retry_sleep(attempt: int) -> None:
     time.sleep(min(0.5 * (2 ** attempt), 4.0))
 
 
-def generate(prompt: str, sys_prompt: Optional[str] = None) -> str:
+async def _aretry_sleep(attempt: int) -> None:
+    await asyncio.sleep(min(0.5 * (2 ** attempt), 4.0))
+
+
+def _http_session() -> requests.Session:
+    """Shared keep-alive session for blocking Ollama calls."""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                s = requests.Session()
+                adapter = requests.adapters.HTTPAdapter(
+                    pool_connections=4, pool_maxsize=LLM_MAX_CONCURRENCY
+                )
+                s.mount("http://", adapter)
+                s.mount("https://", adapter)
+                _session = s
+    return _session
+
+
+def _async_http() -> Tuple[Any, asyncio.Semaphore]:
+    """Pooled async HTTP client and concurrency limiter for the running loop.
+
+    The client is None when httpx is not installed; callers then fall back to
+    the blocking client in a worker thread.
+    """
+    loop = asyncio.get_running_loop()
+    state = _async_state.get(loop)
+    if state is None:
+        with _async_state_lock:
+            # The semaphore keeps its loop alive, so entries of loops closed
+            # without aclose() (asyncio.run in scripts/tests) are dropped here
+            for old in [l for l in list(_async_state.keys()) if l.is_closed()]:
+                _async_state.pop(old, None)
+        try:
+            import httpx  # type: ignore
+
+            client = httpx.AsyncClient(
+                timeout=LLM_TIMEOUT,
+                limits=httpx.Limits(
+                    max_connections=LLM_MAX_CONCURRENCY,
+                    max_keepalive_connections=LLM_MAX_CONCURRENCY,
+                ),
+            )
+        except Exception:
+            client = None
+        state = (client, asyncio.Semaphore(LLM_MAX_CONCURRENCY))
+        with _async_state_lock:
+            _async_state[loop] = state
+    return state
+
+
+async def aclose() -> None:
+    """Close the async HTTP client of the running loop (call on app shutdown)."""
+    with _async_state_lock:
+        state = _async_state.pop(asyncio.get_running_loop(), None)
+    if state and state[0] is not None:
+        await state[0].aclose()
+
+
+@dataclass(frozen=True)
+class LLMConfig:
+    """Provider and model selection for one LLM call.
+
+    Passed explicitly through chains and the generate APIs so concurrent
+    requests never share mutable state; None means LLMConfig.from_env().
+    """
+
+    app_mode: str = "cloud"  # 'cloud' (Gemini) | 'local' (Ollama)
+    gemini_model: str = "gemini-1.5-flash"
+    ollama_model: str = "phi3:mini"
+
+    @classmethod
+    def from_env(cls) -> "LLMConfig":
+        return cls(
+            app_mode=os.getenv("APP_MODE", "cloud").lower(),
+            gemini_model=os.getenv("GEMINI_MODEL", "gemini-1.5-flash"),
+            ollama_model=os.getenv("OLLAMA_MODEL", "phi3:mini"),
+        )
+
+    @property
+    def model(self) -> str:
+        """The model used for the primary provider."""
+        return self.ollama_model if self.app_mode == "local" else self.gemini_model
+
+    def with_model(self, app_mode: str, model: Optional[str] = None) -> "LLMConfig":
+        """Copy with the given provider and (optionally) its model replaced."""
+        app_mode = app_mode.lower()
+        if not model:
+            return replace(self, app_mode=app_mode)
+        if app_mode == "local":
+            return replace(self, app_mode=app_mode, ollama_model=model)
+        return replace(self, app_mode=app_mode, gemini_model=model)
+
+
+def resolve_config(config: Optional[LLMConfig]) -> LLMConfig:
+    return config if config is not None else LLMConfig.from_env()
+
+
+def generate(prompt: str, sys_prompt: Optional[str] = None, config: Optional[LLMConfig] = None) -> str:
     """Generate completion using configured backend (Gemini for cloud, Ollama for local)."""
-    app_mode = os.getenv("APP_MODE", "cloud").lower()
-    if app_mode == "local":
-        return _generate_ollama(prompt, sys_prompt)
+    config = resolve_config(config)
+    if config.app_mode == "local":
+        return _generate_ollama(prompt, sys_prompt, config.ollama_model)
     # Only Gemini supported for cloud
-    out = _generate_gemini(prompt, sys_prompt)
-    fallback_enabled = os.getenv("CLOUD_FALLBACK_TO_LOCAL", "1").lower() in {"1", "true", "yes"}
-    gemini_failed = out.startswith("[gemini-error]") if isinstance(out, str) else False
-    if fallback_enabled and (not out or gemini_failed):
-        local_out = _generate_ollama(prompt, sys_prompt)
+    out = _generate_gemini(prompt, sys_prompt, config.gemini_model)
+    if _should_fallback(out):
+        local_out = _generate_ollama(prompt, sys_prompt, config.ollama_model)
         return local_out or out
     return out
 
 
-def _generate_gemini(prompt: str, sys_prompt: Optional[str]) -> str:
+async def agenerate(prompt: str, sys_prompt: Optional[str] = None, config: Optional[LLMConfig] = None) -> str:
+    """Coroutine version of generate(); does not block the event loop."""
+    config = resolve_config(config)
+    if config.app_mode == "local":
+        return await _agenerate_ollama(prompt, sys_prompt, config.ollama_model)
+    out = await _agenerate_gemini(prompt, sys_prompt, config.gemini_model)
+    if _should_fallback(out):
+        local_out = await _agenerate_ollama(prompt, sys_prompt, config.ollama_model)
+        return local_out or out
+    return out
+
+
+async def astream(
+    prompt: str, sys_prompt: Optional[str] = None, config: Optional[LLMConfig] = None
+) -> AsyncIterator[str]:
+    """Stream a completion as text chunks (tokens as the provider emits them).
+
+    Joining the chunks gives the same text agenerate() would return. In cloud
+    mode, a Gemini failure before the first chunk falls back to local Ollama.
+    """
+    config = resolve_config(config)
+    if config.app_mode == "local":
+        async for chunk in _astream_ollama(prompt, sys_prompt, config.ollama_model):
+            yield chunk
+        return
+    emitted = False
+    failure = ""
+    async for chunk in _astream_gemini(prompt, sys_prompt, config.gemini_model):
+        if not emitted and (not chunk or chunk.startswith(("[gemini-error]", "[gemini-missing]"))):
+            failure = chunk
+            break
+        emitted = True
+        yield chunk
+    if emitted:
+        return
+    if _should_fallback(failure or ""):
+        async for chunk in _astream_ollama(prompt, sys_prompt, config.ollama_model):
+            yield chunk
+    elif failure:
+        yield failure
+
+
+def _should_fallback(out: str) -> bool:
+    fallback_enabled = os.getenv("CLOUD_FALLBACK_TO_LOCAL", "1").lower() in {"1", "true", "yes"}
+    gemini_failed = out.startswith("[gemini-error]") if isinstance(out, str) else False
+    return fallback_enabled and (not out or gemini_failed)
+
+
+def _gemini_api_key() -> str:
     # Support both GOOGLE_API_KEY (AI Studio) and GEMINI_API_KEY env names
-    api_key = os.getenv("GOOGLE_API_KEY", "") or os.getenv("GEMINI_API_KEY", "")
+    return os.getenv("GOOGLE_API_KEY", "") or os.getenv("GEMINI_API_KEY", "")
+
+
+def _gemini_model(api_key: str, model_name: str) -> Any:
+    """Return a cached GenerativeModel, configuring the SDK only when the key changes."""
+    global _gemini_configured_key
+    import google.generativeai as genai  # type: ignore
+
+    with _gemini_lock:
+        if _gemini_configured_key != api_key:
+            genai.configure(api_key=api_key)
+            _gemini_configured_key = api_key
+            _gemini_models.clear()
+        model = _gemini_models.get((api_key, model_name))
+        if model is None:
+            model = genai.GenerativeModel(model_name)
+            _gemini_models[(api_key, model_name)] = model
+        return model
+
+
+def _gemini_text(r: Any) -> Optional[str]:
+    txt = getattr(r, "text", None)
+    if not txt and hasattr(r, "parts"):
+        # older SDK styles
+        txt = "".join(getattr(p, "text", "") for p in getattr(r, "parts", [])).strip() or None
+    return txt
+
+
+def _gemini_err_log() -> str:
+    out_dir = os.path.abspath(os.path.join(os.getcwd(), "out"))
+    os.makedirs(out_dir, exist_ok=True)
+    return os.path.join(out_dir, "last_gemini_error.txt")
+
+
+def _write_err(err_log: str, text: str) -> None:
+    try:
+        with open(err_log, "w", encoding="utf-8") as f:
+            f.write(text)
+    except Exception:
+        pass
+
+
+def _generate_gemini(prompt: str, sys_prompt: Optional[str], model: Optional[str] = None) -> str:
+    api_key = _gemini_api_key()
     if not api_key:
         return "[gemini-error] Missing GOOGLE_API_KEY/GEMINI_API_KEY"
     try:
-        import google.generativeai as genai  # type: ignore
+        import google.generativeai as genai  # type: ignore  # noqa: F401
     except Exception:
         return "[gemini-missing] " + prompt[:80]
 
-    genai.configure(api_key=api_key)
-    model_name = os.getenv("GEMINI_MODEL", "gemini-1.5-flash")
+    model_name = model or os.getenv("GEMINI_MODEL", "gemini-1.5-flash")
     full_prompt = (sys_prompt + "\n\n" if sys_prompt else "") + _truncate_prompt(prompt)
-    out_dir = os.path.abspath(os.path.join(os.getcwd(), "out"))
-    os.makedirs(out_dir, exist_ok=True)
-    err_log = os.path.join(out_dir, "last_gemini_error.txt")
+    err_log = _gemini_err_log()
     for attempt in range(3):
         try:
-            model = genai.GenerativeModel(model_name)
-            r = model.generate_content(full_prompt)
-            txt = getattr(r, "text", None)
-            if not txt and hasattr(r, "parts"):
-                # older SDK styles
-                txt = "".join(getattr(p, "text", "") for p in getattr(r, "parts", [])).strip() or None
+            r = _gemini_model(api_key, model_name).generate_content(full_prompt)
+            txt = _gemini_text(r)
             if not txt:
                 # Log empty response too
-                with open(err_log, "w", encoding="utf-8") as f:
-                    f.write("[gemini-empty] No text in response. Raw repr:\n" + repr(r))
+                _write_err(err_log, "[gemini-empty] No text in response. Raw repr:\n" + repr(r))
             return (txt or "").strip()
         except Exception as e:
             # Write last error for debugging
-            try:
-                with open(err_log, "w", encoding="utf-8") as f:
-                    f.write(f"[gemini-exception attempt={attempt}] {type(e).__name__}: {e}\n")
-            except Exception:
-                pass
+            _write_err(err_log, f"[gemini-exception attempt={attempt}] {type(e).__name__}: {e}\n")
             _retry_sleep(attempt)
     return "[gemini-error] Unable to get response"
 
 
+async def _agenerate_gemini(prompt: str, sys_prompt: Optional[str], model: Optional[str] = None) -> str:
+    api_key = _gemini_api_key()
+    if not api_key:
+        return "[gemini-error] Missing GOOGLE_API_KEY/GEMINI_API_KEY"
+    try:
+        import google.generativeai as genai  # type: ignore  # noqa: F401
+    except Exception:
+        return "[gemini-missing] " + prompt[:80]
+
+    model_name = model or os.getenv("GEMINI_MODEL", "gemini-1.5-flash")
+    full_prompt = (sys_prompt + "\n\n" if sys_prompt else "") + _truncate_prompt(prompt)
+    err_log = _gemini_err_log()
+    _, limiter = _async_http()
+    for attempt in range(3):
+        try:
+            gm = _gemini_model(api_key, model_name)
+            async with limiter:
+                if hasattr(gm, "generate_content_async"):
+                    r = await gm.generate_content_async(full_prompt)
+                else:
+                    r = await asyncio.to_thread(gm.generate_content, full_prompt)
+            txt = _gemini_text(r)
+            if not txt:
+                _write_err(err_log, "[gemini-empty] No text in response. Raw repr:\n" + repr(r))
+            return (txt or "").strip()
+        except Exception as e:
+            _write_err(err_log, f"[gemini-exception attempt={attempt}] {type(e).__name__}: {e}\n")
+            await _aretry_sleep(attempt)
+    return "[gemini-error] Unable to get response"
+
+
+async def _astream_gemini(prompt: str, sys_prompt: Optional[str], model: Optional[str] = None) -> AsyncIterator[str]:
+    api_key = _gemini_api_key()
+    if not api_key:
+        yield "[gemini-error] Missing GOOGLE_API_KEY/GEMINI_API_KEY"
+        return
+    try:
+        import google.generativeai as genai  # type: ignore  # noqa: F401
+    except Exception:
+        yield "[gemini-missing] " + prompt[:80]
+        return
+
+    model_name = model or os.getenv("GEMINI_MODEL", "gemini-1.5-flash")
+    full_prompt = (sys_prompt + "\n\n" if sys_prompt else "") + _truncate_prompt(prompt)
+    gm = _gemini_model(api_key, model_name)
+    if not hasattr(gm, "generate_content_async"):
+        yield await _agenerate_gemini(prompt, sys_prompt, model)
+        return
+    _, limiter = _async_http()
+    emitted = False
+    try:
+        async with limiter:
+            response = await gm.generate_content_async(full_prompt, stream=True)
+            async for part in response:
+                txt = _gemini_text(part)
+                if txt:
+                    emitted = True
+                    yield txt
+    except Exception as e:
+        _write_err(_gemini_err_log(), f"[gemini-stream-exception] {type(e).__name__}: {e}\n")
+        if emitted:
+            # Part of the answer is already out; ending quietly would let the
+            # caller cache a truncated completion
+            raise
+        # Nothing sent yet: retry without streaming (has its own retries)
+        yield await _agenerate_gemini(prompt, sys_prompt, model)
+
+
     # OpenAI cloud support removed
 
 
-def _generate_ollama(prompt: str, sys_prompt: Optional[str]) -> str:
-    model = os.getenv("OLLAMA_MODEL", "phi3:mini")
-    url = "http://localhost:11434/api/generate"
+def _ollama_payload(prompt: str, sys_prompt: Optional[str], model: Optional[str]) -> Dict[str, Any]:
+    model = model or os.getenv("OLLAMA_MODEL", "phi3:mini")
     full_prompt = (sys_prompt + "\n\n" if sys_prompt else "") + prompt
-    payload = {"model": model, "prompt": _truncate_prompt(full_prompt), "stream": False}
+    return {"model": model, "prompt": _truncate_prompt(full_prompt), "stream": False}
+
+
+def _generate_ollama(prompt: str, sys_prompt: Optional[str], model: Optional[str] = None) -> str:
+    url = f"{OLLAMA_BASE_URL}/api/generate"
+    payload = _ollama_payload(prompt, sys_prompt, model)
     for attempt in range(3):
         try:
-            r = requests.post(url, json=payload, timeout=30)
+            r = _http_session().post(url, json=payload, timeout=LLM_TIMEOUT)
             if r.status_code == 200:
                 data = r.json()
                 return (data.get("response") or "").strip()
@@ -96,3 +374,73 @@ def _generate_ollama(prompt: str, sys_prompt: Optional[str]) -> str:
             _retry_sleep(attempt)
     # Test-friendly stub
     return "[ollama-stub] " + prompt[:80]
+
+
+async def _agenerate_ollama(prompt: str, sys_prompt: Optional[str], model: Optional[str] = None) -> str:
+    client, limiter = _async_http()
+    if client is None:
+        return await asyncio.to_thread(_generate_ollama, prompt, sys_prompt, model)
+    url = f"{OLLAMA_BASE_URL}/api/generate"
+    payload = _ollama_payload(prompt, sys_prompt, model)
+    for attempt in range(3):
+        try:
+            async with limiter:
+                r = await client.post(url, json=payload)
+            if r.status_code == 200:
+                data = r.json()
+                return (data.get("response") or "").strip()
+        except Exception:
+            await _aretry_sleep(attempt)
+    # Test-friendly stub
+    return "[ollama-stub] " + prompt[:80]
+
+
+async def _astream_ollama(prompt: str, sys_prompt: Optional[str], model: Optional[str] = None) -> AsyncIterator[str]:
+    client, limiter = _async_http()
+    if client is None:
+        yield await _agenerate_ollama(prompt, sys_prompt, model)
+        return
+    url = f"{OLLAMA_BASE_URL}/api/generate"
+    payload = dict(_ollama_payload(prompt, sys_prompt, model), stream=True)
+    emitted = False
+    done = False
+    try:
+        async with limiter:
+            async with client.stream("POST", url, json=payload) as r:
+                if r.status_code == 200:
+                    async for line in r.aiter_lines():
+                        if not line.strip():
+                            continue
+                        data = json.loads(line)
+                        chunk = data.get("response") or ""
+                        if chunk:
+                            # Match agenerate(), which strips the full completion
+                            if not emitted:
+                                chunk = chunk.lstrip()
+                            if chunk:
+                                emitted = True
+                                yield chunk
+                        if data.get("done"):
+                            done = True
+                            break
+    except Exception as e:
+        if emitted:
+            raise RuntimeError(f"Ollama stream interrupted: {e}") from e
+    if emitted and not done:
+        # Connection closed before Ollama's final "done" message
+        raise RuntimeError("Ollama stream ended before completion")
+    if not emitted:
+        yield await _agenerate_ollama(prompt, sys_prompt, model)
+
+
+def _reset_after_fork() -> None:
+    # Pooled sockets and gRPC channels belong to the parent process
+    global _session, _gemini_configured_key
+    _session = None
+    _async_state.clear()
+    _gemini_models.clear()
+    _gemini_configured_key = None
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
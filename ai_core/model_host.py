@@ -0,0 +1,428 @@
+"""Local model host: one long-lived process that owns the heavy models.
+
+Web workers normally load MiniLM, BLIP, EasyOCR and Whisper themselves. With
+MODEL_HOST set to a Unix socket path, embeddings, caption, ocr and stt switch
+to client mode and send their inference here instead, so workers stay small
+and quick to restart, model memory is paid once per host, and concurrent
+embedding and caption requests from different workers are merged into one
+batch.
+
+Run the host (before the web workers):
+    python -m ai_core.model_host --socket /tmp/ai-tutor-models.sock --preload embedder,caption,ocr
+
+  MODEL_HOST             socket path; set it for the web workers to enable client mode
+  MODEL_HOST_TIMEOUT     seconds a client waits for a reply (default 300)
+  MODEL_HOST_BATCH_WAIT  seconds the host waits to fill a batch (default 0.005)
+  MODEL_HOST_MAX_BATCH   texts/images merged into one batch (default 64)
+
+Wire format, both directions: 4-byte big-endian header length, a JSON header
+whose "blobs" lists the byte length of each binary part, then those parts.
+Images travel as raw pixels and audio/vectors as float32, so no pickle is
+involved; the socket is created with mode 0600.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import os
+import queue
+import signal
+import socket
+import socketserver
+import struct
+import threading
+import time
+from array import array
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger("ai_core.model_host")
+
+MODEL_HOST = os.getenv("MODEL_HOST", "")
+MODEL_HOST_TIMEOUT = float(os.getenv("MODEL_HOST_TIMEOUT", "300"))
+MODEL_HOST_BATCH_WAIT = float(os.getenv("MODEL_HOST_BATCH_WAIT", "0.005"))
+MODEL_HOST_MAX_BATCH = int(os.getenv("MODEL_HOST_MAX_BATCH", "64"))
+
+MODELS = ("embedder", "caption", "ocr", "stt")
+
+_serving = False  # True inside the host process, which runs models locally
+
+
+def enabled() -> bool:
+    """True when this process should send inference to the model host."""
+    return bool(MODEL_HOST) and not _serving
+
+
+# ---- framing ---------------------------------------------------------------
+
+def _recv_exact(sock: socket.socket, n: int) -> bytes:
+    buf = bytearray()
+    while len(buf) < n:
+        chunk = sock.recv(n - len(buf))
+        if not chunk:
+            raise ConnectionError("model host connection closed")
+        buf.extend(chunk)
+    return bytes(buf)
+
+
+def send_msg(sock: socket.socket, header: Dict[str, Any], blobs: Optional[List[bytes]] = None) -> None:
+    blobs = blobs or []
+    data = json.dumps(dict(header, blobs=[len(b) for b in blobs])).encode("utf-8")
+    sock.sendall(struct.pack("!I", len(data)) + data + b"".join(blobs))
+
+
+def recv_msg(sock: socket.socket) -> Tuple[Dict[str, Any], List[bytes]]:
+    (size,) = struct.unpack("!I", _recv_exact(sock, 4))
+    header = json.loads(_recv_exact(sock, size).decode("utf-8"))
+    blobs = [_recv_exact(sock, n) for n in header.pop("blobs", [])]
+    return header, blobs
+
+
+def _image_parts(images: List[Any]) -> Tuple[List[Dict[str, Any]], List[bytes]]:
+    meta, blobs = [], []
+    for img in images:
+        if img.mode not in ("RGB", "L", "RGBA"):
+            img = img.convert("RGB")
+        meta.append({"mode": img.mode, "size": list(img.size)})
+        blobs.append(img.tobytes())
+    return meta, blobs
+
+
+def _images_from(meta: List[Dict[str, Any]], blobs: List[bytes]) -> List[Any]:
+    from PIL import Image  # type: ignore
+
+    return [Image.frombytes(m["mode"], tuple(m["size"]), b) for m, b in zip(meta, blobs)]
+
+
+# ---- client ----------------------------------------------------------------
+
+class ModelHostClient:
+    """Blocking client; one connection per thread, reconnected on failure."""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._local = threading.local()
+
+    def _sock(self) -> socket.socket:
+        sock = getattr(self._local, "sock", None)
+        if sock is None:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(MODEL_HOST_TIMEOUT)
+            sock.connect(self.path)
+            self._local.sock = sock
+        return sock
+
+    def _drop(self) -> None:
+        sock = getattr(self._local, "sock", None)
+        self._local.sock = None
+        if sock is not None:
+            try:
+                sock.close()
+            except OSError:
+                pass
+
+    def call(self, op: str, header: Optional[Dict[str, Any]] = None,
+             blobs: Optional[List[bytes]] = None) -> Tuple[Dict[str, Any], List[bytes]]:
+        request = dict(header or {}, op=op)
+        for attempt in range(2):
+            try:
+                sock = self._sock()
+                send_msg(sock, request, blobs)
+            except OSError as e:
+                # A stale pooled connection (host restarted): retry once on a new one
+                self._drop()
+                if attempt:
+                    raise RuntimeError(f"model host at {self.path} unavailable: {e}") from e
+                continue
+            try:
+                reply, out = recv_msg(sock)
+                break
+            except OSError as e:
+                # The host has the request (a timeout means it is still working
+                # on it); sending it again would only double its load
+                self._drop()
+                raise RuntimeError(f"model host {op} got no reply: {e}") from e
+        if reply.get("error"):
+            raise RuntimeError(f"model host {op} failed: {reply['error']}")
+        return reply, out
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        reply, blobs = self.call("embed", {"texts": list(texts)})
+        flat = array("f")
+        flat.frombytes(blobs[0])
+        dim = reply["dim"]
+        return [list(flat[i:i + dim]) for i in range(0, len(flat), dim)]
+
+    def caption(self, images: List[Any], batch_size: int, max_side: int) -> List[str]:
+        meta, blobs = _image_parts(images)
+        reply, _ = self.call("caption", {"images": meta, "batch_size": batch_size, "max_side": max_side}, blobs)
+        return reply["captions"]
+
+    def ocr(self, image: Any) -> str:
+        meta, blobs = _image_parts([image])
+        reply, _ = self.call("ocr", {"image": meta[0]}, blobs)
+        return reply["text"]
+
+    def transcribe(self, audio: Any) -> str:
+        """audio is a file path (readable by the host) or mono float32 samples."""
+        if isinstance(audio, str):
+            reply, _ = self.call("transcribe", {"path": os.path.abspath(audio)})
+        else:
+            import numpy as np  # type: ignore
+
+            reply, _ = self.call("transcribe", {}, [np.asarray(audio, dtype=np.float32).tobytes()])
+        return reply["text"]
+
+    def warmup(self, models: List[str]) -> Dict[str, bool]:
+        global _loaded_cache
+        loaded = self.call("warmup", {"models": list(models)})[0]["loaded"]
+        # The reply is the freshest load state; is_loaded() right after must see it
+        _loaded_cache = (time.monotonic(), loaded)
+        return loaded
+
+    def loaded(self) -> Dict[str, bool]:
+        return self.call("ping")[0]["loaded"]
+
+
+_client: Optional[ModelHostClient] = None
+_client_lock = threading.Lock()
+
+
+def client() -> ModelHostClient:
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = ModelHostClient(MODEL_HOST)
+    return _client
+
+
+# Last ping reply, shared by the per-model is_loaded() checks behind /ready
+_LOADED_TTL = 2.0
+_loaded_cache: Tuple[float, Dict[str, bool]] = (0.0, {})
+
+
+def remote_loaded(name: str) -> bool:
+    """Whether the host has model name warm (False if it cannot be reached).
+
+    One ping answers for every model for _LOADED_TTL seconds.
+    """
+    global _loaded_cache
+    checked_at, loaded = _loaded_cache
+    if time.monotonic() - checked_at > _LOADED_TTL:
+        try:
+            loaded = client().loaded()
+        except Exception:
+            loaded = {}
+        _loaded_cache = (time.monotonic(), loaded)
+    return bool(loaded.get(name))
+
+
+def _reset_after_fork() -> None:
+    # Connections belong to the parent; each worker opens its own
+    global _client, _loaded_cache
+    _client = None
+    _loaded_cache = (0.0, {})
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+# ---- host ------------------------------------------------------------------
+
+class _Batcher:
+    """Merges requests that arrive within MODEL_HOST_BATCH_WAIT into one call.
+
+    fn(key, items) -> results (one per item); requests with different keys
+    (e.g. caption max_side) are never mixed.
+    """
+
+    def __init__(self, name: str, fn: Callable[[Any, List[Any]], List[Any]]) -> None:
+        self.fn = fn
+        self._queue: "queue.Queue[Tuple[Any, List[Any], Future]]" = queue.Queue()
+        threading.Thread(target=self._run, name=f"batch-{name}", daemon=True).start()
+
+    def submit(self, key: Any, items: List[Any]) -> Future:
+        fut: Future = Future()
+        self._queue.put((key, items, fut))
+        return fut
+
+    def _run(self) -> None:
+        while True:
+            pending = [self._queue.get()]
+            size = len(pending[0][1])
+            deadline = time.monotonic() + MODEL_HOST_BATCH_WAIT
+            while size < MODEL_HOST_MAX_BATCH:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    pending.append(self._queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+                size += len(pending[-1][1])
+            groups: Dict[Any, List[Tuple[List[Any], Future]]] = {}
+            for key, items, fut in pending:
+                groups.setdefault(key, []).append((items, fut))
+            for key, reqs in groups.items():
+                merged = [item for items, _ in reqs for item in items]
+                try:
+                    results = self.fn(key, merged)
+                    if len(results) != len(merged):
+                        # Slicing by position would hand out other requests' answers
+                        raise RuntimeError(f"batch returned {len(results)} results for {len(merged)} inputs")
+                except Exception as e:
+                    for _, fut in reqs:
+                        fut.set_exception(e)
+                    continue
+                start = 0
+                for items, fut in reqs:
+                    fut.set_result(results[start:start + len(items)])
+                    start += len(items)
+
+
+class _Host:
+    def __init__(self) -> None:
+        from . import caption, embeddings
+
+        self._embed = _Batcher("embed", lambda _key, texts: embeddings.embed_documents(texts))
+        self._caption = _Batcher(
+            "caption", lambda key, images: caption._generate_captions(images, key[0], key[1])
+        )
+        self._ocr_lock = threading.Lock()  # EasyOCR readers are not thread-safe
+
+    @staticmethod
+    def loaded() -> Dict[str, bool]:
+        from . import caption, embeddings, ocr, stt
+
+        return {"embedder": embeddings.is_loaded(), "caption": caption.is_loaded(),
+                "ocr": ocr.is_loaded(), "stt": stt.is_loaded()}
+
+    @staticmethod
+    def warm(models: List[str]) -> None:
+        from . import caption, embeddings, ocr, stt
+
+        loaders = {"embedder": embeddings.warmup, "caption": caption.warmup,
+                   "ocr": ocr.warmup, "stt": stt.preload}
+        for name in models:
+            if name not in loaders:
+                logger.warning(f"Unknown model: {name}")
+                continue
+            t0 = time.perf_counter()
+            try:
+                loaders[name]()
+                logger.info(f"Loaded {name} in {time.perf_counter() - t0:.1f}s")
+            except Exception as e:
+                logger.warning(f"Loading {name} failed: {e}")
+
+    def handle(self, header: Dict[str, Any], blobs: List[bytes]) -> Tuple[Dict[str, Any], List[bytes]]:
+        op = header.get("op")
+        if op == "ping":
+            return {"loaded": self.loaded()}, []
+        if op == "warmup":
+            self.warm(header.get("models") or list(MODELS))
+            return {"loaded": self.loaded()}, []
+        if op == "embed":
+            vectors = self._embed.submit(None, header["texts"]).result()
+            flat = array("f", [x for v in vectors for x in v])
+            return {"dim": len(vectors[0]) if vectors else 0}, [flat.tobytes()]
+        if op == "caption":
+            images = _images_from(header["images"], blobs)
+            key = (int(header["batch_size"]), int(header["max_side"]))
+            return {"captions": self._caption.submit(key, images).result()}, []
+        if op == "ocr":
+            from .ocr import extract_text
+
+            image = _images_from([header["image"]], blobs)[0]
+            with self._ocr_lock:
+                return {"text": extract_text(image)}, []
+        if op == "transcribe":
+            from .stt import transcribe_local, transcribe_samples
+
+            if header.get("path"):
+                return {"text": transcribe_local(header["path"])}, []
+            import numpy as np  # type: ignore
+
+            return {"text": transcribe_samples(np.frombuffer(blobs[0], dtype=np.float32))}, []
+        return {"error": f"unknown op: {op}"}, []
+
+
+class _Handler(socketserver.BaseRequestHandler):
+    def handle(self) -> None:
+        host: _Host = self.server.host  # type: ignore[attr-defined]
+        while True:
+            try:
+                header, blobs = recv_msg(self.request)
+            except (ConnectionError, OSError):
+                return
+            try:
+                reply, out = host.handle(header, blobs)
+            except Exception as e:
+                logger.warning(f"{header.get('op')} failed: {e}")
+                reply, out = {"error": str(e)}, []
+            try:
+                send_msg(self.request, reply, out)
+            except OSError:
+                return
+
+
+class _Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def serve(path: str, preload: Optional[List[str]] = None) -> None:
+    """Run the model host on a Unix socket until SIGINT/SIGTERM."""
+    global _serving
+    _serving = True
+    if os.path.exists(path):
+        os.remove(path)  # stale socket from a previous run
+    host = _Host()
+    if preload:
+        host.warm(preload)
+    old_umask = os.umask(0o177)  # socket file created as 0600
+    try:
+        server = _Server(path, _Handler)
+    finally:
+        os.umask(old_umask)
+    server.host = host  # type: ignore[attr-defined]
+
+    def stop(signum, frame):
+        threading.Thread(target=server.shutdown, daemon=True).start()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    logger.info(f"Model host listening on {path}")
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        if os.path.exists(path):
+            os.remove(path)
+        logger.info("Model host stopped")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Local model host for AI Tutor web workers")
+    parser.add_argument("--socket", default=MODEL_HOST or "/tmp/ai-tutor-models.sock")
+    parser.add_argument("--preload", default="embedder,caption,ocr",
+                        help="models to load at startup (embedder, caption, ocr, stt; 'none')")
+    parser.add_argument("--threads", type=int, default=0, help="torch threads (0 = library default)")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    if args.threads > 0:
+        os.environ.setdefault("OMP_NUM_THREADS", str(args.threads))
+        os.environ.setdefault("STT_THREADS", str(args.threads))
+    names = [] if args.preload.strip().lower() in {"", "none"} else [
+        n.strip().lower() for n in args.preload.split(",") if n.strip()
+    ]
+    serve(args.socket, names)
+
+
+if __name__ == "__main__":
+    # Run through the package module: caption/embeddings/ocr/stt import
+    # ai_core.model_host, not __main__, and must see _serving set there
+    from ai_core import model_host as _module
+
+    _module.main()
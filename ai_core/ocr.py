@@ -5,25 +5,46 @@ when OCR isn't needed.
 """
 from __future__ import annotations
 
-from typing import Optional
+import threading
+from typing import TYPE_CHECKING, Optional
 
-from PIL import Image
+from . import model_host
+
+if TYPE_CHECKING:  # PIL is imported where images are actually handled
+    from PIL import Image
 
 _reader = None  # type: ignore[var-annotated]
+_reader_lock = threading.Lock()
 
 
 def _get_reader():
     global _reader
     if _reader is None:
-        try:
-            import easyocr  # type: ignore
-        except Exception as e:  # pragma: no cover - import guard
-            raise RuntimeError("EasyOCR is not installed. Please install 'easyocr'.") from e
-        # English by default; allow numbers/symbols
-        _reader = easyocr.Reader(["en"], gpu=False)
+        with _reader_lock:
+            if _reader is None:
+                try:
+                    import easyocr  # type: ignore
+                except Exception as e:  # pragma: no cover - import guard
+                    raise RuntimeError("EasyOCR is not installed. Please install 'easyocr'.") from e
+                # English by default; allow numbers/symbols
+                _reader = easyocr.Reader(["en"], gpu=False)
     return _reader
 
 
+def warmup() -> None:
+    """Load the EasyOCR reader now instead of on the first scanned page."""
+    if model_host.enabled():
+        model_host.client().warmup(["ocr"])
+        return
+    _get_reader()
+
+
+def is_loaded() -> bool:
+    if model_host.enabled():
+        return model_host.remote_loaded("ocr")
+    return _reader is not None
+
+
 def extract_text(pil_image: Image.Image) -> str:
     """Run OCR on the provided PIL image.
 
@@ -32,6 +53,8 @@ def extract_text(pil_image: Image.Image) -> str:
     Returns:
         Extracted text string (may be empty).
     """
+    if model_host.enabled():
+        return model_host.client().ocr(pil_image)
     reader = _get_reader()
     result = reader.readtext(pil_image, detail=0, paragraph=True)
     # result is a list[str]
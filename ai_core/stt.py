@@ -1,12 +1,215 @@
 """Speech-to-Text backends.
 
-Local STT: prefer Whisper (small) if available; fallback to Vosk if installed.
+Local STT: prefer Whisper if available; fallback to Vosk if installed.
 Cloud STT: stub only.
+
+Whisper models are loaded once per process and kept warm in a small pool, so a
+voice question only pays for inference. Configuration:
+  STT_MODEL        tiny | base | small | ... (default small)
+  STT_POOL_SIZE    model instances for concurrent transcriptions (default 1)
+  STT_DEVICE       cpu | cuda (default cpu)
+  STT_COMPUTE_TYPE int8 | float16 | float32; int8 quantizes on CPU (default int8)
+  STT_THREADS      CPU threads per transcription, 0 = library default (default 0)
+  STT_PRELOAD      warm the pool at startup (same as adding "stt" to WARMUP_MODELS)
+
+StreamingRecognizer transcribes audio incrementally as it arrives (see
+STT_STREAM_* below), for live voice questions.
+
+faster-whisper is used when installed (native int8 via CTranslate2); otherwise
+openai-whisper, with int8 applied as dynamic quantization of its Linear layers.
 """
 from __future__ import annotations
 
+import logging
 import os
-from typing import Optional
+import queue
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Iterator, List, Optional, Tuple
+
+from . import model_host
+
+logger = logging.getLogger("ai_core.stt")
+
+STT_MODEL = os.getenv("STT_MODEL", "small")
+STT_POOL_SIZE = max(1, int(os.getenv("STT_POOL_SIZE", "1")))
+STT_DEVICE = os.getenv("STT_DEVICE", "cpu")
+STT_COMPUTE_TYPE = os.getenv("STT_COMPUTE_TYPE", "int8")
+STT_THREADS = int(os.getenv("STT_THREADS", "0"))
+STT_PRELOAD = os.getenv("STT_PRELOAD", "false").lower() in {"1", "true", "yes"}
+STT_STREAM_ENGINE = os.getenv("STT_STREAM_ENGINE", "auto")  # auto | whisper | vosk
+STT_STREAM_STEP = float(os.getenv("STT_STREAM_STEP", "1.0"))
+STT_STREAM_WINDOW = float(os.getenv("STT_STREAM_WINDOW", "10.0"))
+
+
+def _ensure_ffmpeg_on_path() -> None:
+    """Add the project-local ffmpeg build to PATH if it exists."""
+    project_root = Path(__file__).parent.parent
+    ffmpeg_bin = project_root / "ffmpeg-8.0-essentials_build" / "bin"
+    if ffmpeg_bin.exists():
+        ffmpeg_bin_str = str(ffmpeg_bin)
+        if ffmpeg_bin_str not in os.environ.get("PATH", ""):
+            os.environ["PATH"] = ffmpeg_bin_str + os.pathsep + os.environ.get("PATH", "")
+            logger.debug(f"Added ffmpeg to PATH: {ffmpeg_bin_str}")
+
+
+def _load_whisper(name: str) -> Tuple[str, Any]:
+    """Load one Whisper instance; returns (engine, model)."""
+    try:
+        from faster_whisper import WhisperModel  # type: ignore
+
+        model = WhisperModel(
+            name, device=STT_DEVICE, compute_type=STT_COMPUTE_TYPE, cpu_threads=STT_THREADS
+        )
+        return "faster", model
+    except ImportError:
+        pass
+
+    import whisper  # type: ignore
+
+    model = whisper.load_model(name, device=STT_DEVICE)
+    if STT_DEVICE == "cpu":
+        import torch  # type: ignore
+
+        if STT_THREADS > 0:
+            torch.set_num_threads(STT_THREADS)
+        if STT_COMPUTE_TYPE == "int8":
+            model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    return "openai", model
+
+
+class WhisperPool:
+    """Bounded pool of warm Whisper instances.
+
+    Instances are created lazily up to size; callers block in acquire() while
+    all of them are busy instead of loading another copy.
+    """
+
+    def __init__(self, name: str, size: int) -> None:
+        self.name = name
+        self.size = max(1, int(size))
+        self._idle: "queue.Queue[Tuple[str, Any]]" = queue.Queue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def _grow(self) -> bool:
+        with self._lock:
+            if self._created >= self.size:
+                return False
+            self._created += 1
+        try:
+            logger.info(f"Loading Whisper model '{self.name}' ({self._created}/{self.size})...")
+            self._idle.put(_load_whisper(self.name))
+            return True
+        except Exception:
+            with self._lock:
+                self._created -= 1
+            raise
+
+    def preload(self) -> None:
+        while self._grow():
+            pass
+
+    @contextmanager
+    def acquire(self) -> Iterator[Tuple[str, Any]]:
+        try:
+            entry = self._idle.get_nowait()
+        except queue.Empty:
+            self._grow()
+            entry = self._idle.get()
+        try:
+            yield entry
+        finally:
+            self._idle.put(entry)
+
+    def stats(self) -> dict:
+        return {"model": self.name, "size": self.size, "loaded": self._created, "idle": self._idle.qsize()}
+
+
+_pool: Optional[WhisperPool] = None
+_pool_lock = threading.Lock()
+
+_vosk_model = None  # type: ignore[var-annotated]
+_vosk_lock = threading.Lock()
+
+
+def get_whisper_pool() -> WhisperPool:
+    """Return the process-wide Whisper pool (models load on first acquire)."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = WhisperPool(STT_MODEL, STT_POOL_SIZE)
+    return _pool
+
+
+def _get_vosk_model():
+    global _vosk_model
+    if _vosk_model is None:
+        with _vosk_lock:
+            if _vosk_model is None:
+                from vosk import Model  # type: ignore
+
+                _vosk_model = Model(lang="en-us")
+    return _vosk_model
+
+
+def preload() -> None:
+    """Load every Whisper instance of the pool now (e.g. at server startup)."""
+    if model_host.enabled():
+        try:
+            model_host.client().warmup(["stt"])
+        except Exception as e:
+            logger.warning(f"Whisper preload on the model host failed: {e}")
+        return
+    _ensure_ffmpeg_on_path()
+    try:
+        get_whisper_pool().preload()
+    except Exception as e:
+        logger.warning(f"Whisper preload failed: {e}")
+
+
+def is_loaded() -> bool:
+    """True once at least one Whisper instance is warm."""
+    if model_host.enabled():
+        return model_host.remote_loaded("stt")
+    return _pool is not None and _pool.stats()["loaded"] > 0
+
+
+def _whisper_transcribe(entry: Tuple[str, Any], audio: Any) -> str:
+    engine, model = entry
+    if engine == "faster":
+        segments, _ = model.transcribe(audio)
+        return "".join(seg.text for seg in segments).strip()
+    res = model.transcribe(audio, fp16=STT_DEVICE != "cpu")
+    logger.debug(f"Whisper raw result: {res}")
+    return (res.get("text") or "").strip()
+
+
+def _whisper(audio: Any) -> str:
+    """Transcribe a file path or float32 samples on a pooled Whisper (or the model host)."""
+    if model_host.enabled():
+        return model_host.client().transcribe(audio)
+    with get_whisper_pool().acquire() as entry:
+        return _whisper_transcribe(entry, audio)
+
+
+def _vosk_transcribe(frames: Iterator[bytes], sample_rate: int) -> str:
+    """Run Vosk over 16-bit mono PCM frames."""
+    import json
+    from vosk import KaldiRecognizer  # type: ignore
+
+    rec = KaldiRecognizer(_get_vosk_model(), sample_rate)
+    rec.SetWords(True)
+    text_parts: List[str] = []
+    for data in frames:
+        if rec.AcceptWaveform(data):
+            ans = rec.Result()
+            text_parts.append(json.loads(ans).get("text", ""))
+    final = rec.FinalResult()
+    text_parts.append(json.loads(final).get("text", ""))
+    return " ".join([t for t in text_parts if t]).strip()
 
 
 def transcribe_local(wav_path: str) -> str:
@@ -14,33 +217,14 @@ def transcribe_local(wav_path: str) -> str:
 
     Preference order: whisper (if installed) -> vosk (if installed) -> empty string.
     """
-    import logging
-    import sys
-    from pathlib import Path
-    logger = logging.getLogger("ai_core.stt")
-    
     if not os.path.exists(wav_path):
         raise FileNotFoundError(wav_path)
 
     # Try Whisper first
     try:  # pragma: no cover - environment dependent
-        import whisper  # type: ignore
-
-        # Add ffmpeg to PATH if it exists in project directory
-        project_root = Path(__file__).parent.parent
-        ffmpeg_bin = project_root / "ffmpeg-8.0-essentials_build" / "bin"
-        if ffmpeg_bin.exists():
-            ffmpeg_bin_str = str(ffmpeg_bin)
-            if ffmpeg_bin_str not in os.environ.get("PATH", ""):
-                os.environ["PATH"] = ffmpeg_bin_str + os.pathsep + os.environ.get("PATH", "")
-                logger.debug(f"Added ffmpeg to PATH: {ffmpeg_bin_str}")
-
-        logger.debug(f"Loading Whisper model 'small'...")
-        model = whisper.load_model("small")
+        _ensure_ffmpeg_on_path()
         logger.debug(f"Transcribing {wav_path}...")
-        res = model.transcribe(wav_path)
-        logger.debug(f"Whisper raw result: {res}")
-        text = (res.get("text") or "").strip()
+        text = _whisper(wav_path)
         logger.debug(f"Extracted text: '{text}'")
         return text
     except Exception as e:
@@ -51,33 +235,149 @@ def transcribe_local(wav_path: str) -> str:
     # Try Vosk next
     try:  # pragma: no cover - environment dependent
         import wave
-        import json
-        from vosk import Model, KaldiRecognizer  # type: ignore
 
         wf = wave.open(wav_path, "rb")
         if wf.getnchannels() != 1 or wf.getsampwidth() != 2 or wf.getframerate() not in [8000, 16000, 32000, 44100]:
             # For simplicity, we don't resample here
             return ""
-        model = Model(lang="en-us")
-        rec = KaldiRecognizer(model, wf.getframerate())
-        rec.SetWords(True)
-        text_parts = []
-        while True:
-            data = wf.readframes(4000)
-            if len(data) == 0:
-                break
-            if rec.AcceptWaveform(data):
-                ans = rec.Result()
-                text_parts.append(json.loads(ans).get("text", ""))
-        final = rec.FinalResult()
-        text_parts.append(json.loads(final).get("text", ""))
-        return " ".join([t for t in text_parts if t]).strip()
+        return _vosk_transcribe(iter(lambda: wf.readframes(4000), b""), wf.getframerate())
     except Exception:
         pass
 
     return ""
 
 
+def transcribe_samples(samples: Any, sample_rate: int = 16000) -> str:
+    """Transcribe an in-memory mono float32 buffer (16 kHz, see ai_core.audio).
+
+    Same preference order as transcribe_local, without any file round trip.
+    """
+    if samples is None or len(samples) == 0:
+        return ""
+
+    try:  # pragma: no cover - environment dependent
+        logger.debug(f"Transcribing {len(samples)} samples...")
+        text = _whisper(samples)
+        logger.debug(f"Extracted text: '{text}'")
+        return text
+    except Exception as e:
+        logger.error(f"Whisper failed: {e}")
+        logger.exception(e)
+        pass
+
+    try:  # pragma: no cover - environment dependent
+        import numpy as np  # type: ignore
+
+        pcm = (np.clip(samples, -1.0, 1.0) * 32767).astype(np.int16).tobytes()
+        step = 8000  # 4000 frames of 16-bit audio
+        return _vosk_transcribe((pcm[i:i + step] for i in range(0, len(pcm), step)), sample_rate)
+    except Exception:
+        pass
+
+    return ""
+
+
+class StreamingRecognizer:
+    """Incremental recognition over 16 kHz mono float32 chunks.
+
+    accept() returns a partial transcript whenever it changes and finish()
+    returns the final one. Two engines:
+      - vosk: KaldiRecognizer decodes frame by frame, partials are free
+      - whisper: sliding window; the uncommitted tail is re-transcribed every
+        STT_STREAM_STEP seconds of new audio and committed once it reaches
+        STT_STREAM_WINDOW seconds, so finish() only has the short tail left
+    STT_STREAM_ENGINE=auto prefers Whisper, like transcribe_local.
+    """
+
+    def __init__(self, sample_rate: int = 16000, engine: Optional[str] = None) -> None:
+        self.sample_rate = sample_rate
+        self.engine = self._pick_engine(engine or STT_STREAM_ENGINE)
+        self._committed: List[str] = []
+        self._partial = ""
+        self._tail: List[Any] = []
+        self._tail_len = 0
+        self._since_step = 0
+        self._rec = None
+        if self.engine == "vosk":
+            from vosk import KaldiRecognizer  # type: ignore
+
+            self._rec = KaldiRecognizer(_get_vosk_model(), sample_rate)
+
+    @staticmethod
+    def _pick_engine(engine: str) -> str:
+        engine = engine.lower()
+        if engine in {"whisper", "vosk"}:
+            return engine
+        if model_host.enabled():
+            return "whisper"
+        try:
+            import faster_whisper  # type: ignore  # noqa: F401
+            return "whisper"
+        except ImportError:
+            pass
+        try:
+            import whisper  # type: ignore  # noqa: F401
+            return "whisper"
+        except ImportError:
+            return "vosk"
+
+    def _text(self) -> str:
+        return " ".join(t for t in self._committed + [self._partial] if t).strip()
+
+    def accept(self, samples: Any) -> Optional[str]:
+        """Feed a chunk; returns the running transcript if it changed."""
+        if samples is None or len(samples) == 0:
+            return None
+        before = self._text()
+        if self.engine == "vosk":
+            self._accept_vosk(samples)
+        else:
+            self._accept_whisper(samples)
+        after = self._text()
+        return after if after != before else None
+
+    def finish(self) -> str:
+        """Flush the remaining audio and return the final transcript."""
+        import json
+
+        if self.engine == "vosk":
+            self._committed.append(json.loads(self._rec.FinalResult()).get("text", ""))
+        elif self._tail:
+            self._committed.append(self._transcribe_tail())
+        self._partial = ""
+        self._tail, self._tail_len = [], 0
+        return self._text()
+
+    def _accept_vosk(self, samples: Any) -> None:
+        import json
+        import numpy as np  # type: ignore
+
+        pcm = (np.clip(samples, -1.0, 1.0) * 32767).astype(np.int16).tobytes()
+        if self._rec.AcceptWaveform(pcm):
+            self._committed.append(json.loads(self._rec.Result()).get("text", ""))
+            self._partial = ""
+        else:
+            self._partial = json.loads(self._rec.PartialResult()).get("partial", "")
+
+    def _transcribe_tail(self) -> str:
+        import numpy as np  # type: ignore
+
+        audio = np.concatenate(self._tail).astype(np.float32)
+        return _whisper(audio)
+
+    def _accept_whisper(self, samples: Any) -> None:
+        self._tail.append(samples)
+        self._tail_len += len(samples)
+        self._since_step += len(samples)
+        if self._tail_len >= STT_STREAM_WINDOW * self.sample_rate:
+            self._committed.append(self._transcribe_tail())
+            self._partial = ""
+            self._tail, self._tail_len, self._since_step = [], 0, 0
+        elif self._since_step >= STT_STREAM_STEP * self.sample_rate:
+            self._partial = self._transcribe_tail()
+            self._since_step = 0
+
+
 def transcribe_cloud(wav_path: str) -> str:
     """Cloud STT stub (no implementation)."""
     # TODO: integrate cloud STT provider
@@ -1,11 +1,137 @@
 """Text-to-Speech backends.
 
 Local default uses pyttsx3. Cloud TTS is a stub for future integration.
+
+pyttsx3 engines are not reentrant, so all local synthesis runs on one worker
+thread that owns the engine. synthesize_cached() puts a content-addressed
+cache in front of it: audio is keyed by text + voice settings and kept in
+TTS_CACHE_DIR as a size-bounded LRU, so replaying an explanation is a file read.
+SegmentStream does the same per sentence for streaming playback, keeping only
+a few sentences queued ahead of the listener so one long text cannot hold the
+single engine for everyone else.
+  TTS_CACHE_DIR        cache directory (default ./audio/cache)
+  TTS_CACHE_MAX_BYTES  total size before least recently played files go (default 256 MiB)
+  TTS_VOICE            pyttsx3 voice id (default: engine default)
+  TTS_RATE             words per minute (default: engine default)
+  TTS_STREAM_AHEAD     sentences queued ahead of the one being played (default 2)
 """
 from __future__ import annotations
 
+import hashlib
+import importlib.util
+import json
+import logging
 import os
-from typing import Optional
+import queue
+import re
+import threading
+import uuid
+from concurrent.futures import Future
+from typing import Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger("ai_core.tts")
+
+TTS_CACHE_DIR = os.getenv("TTS_CACHE_DIR", "./audio/cache")
+TTS_CACHE_MAX_BYTES = int(os.getenv("TTS_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+TTS_VOICE = os.getenv("TTS_VOICE", "")
+TTS_RATE = int(os.getenv("TTS_RATE", "0"))
+TTS_STREAM_AHEAD = int(os.getenv("TTS_STREAM_AHEAD", "2"))
+AUDIO_EXT = ".wav"  # pyttsx3 drivers (SAPI5, espeak, nsss) write WAV/AIFF-style PCM
+
+
+def _write_placeholder(text: str, out_path: str) -> None:
+    # Fallback: write text content so tests can verify output exists
+    with open(out_path, "w", encoding="utf-8") as f:
+        f.write("[tts-fallback]\n" + text)
+
+
+class _TTSWorker:
+    """Single thread that owns the pyttsx3 engine and synthesizes jobs in order.
+
+    Job futures resolve to (out_path, engine) where engine is "pyttsx3", or
+    "placeholder" when a text placeholder was written instead of audio.
+    """
+
+    def __init__(self) -> None:
+        self._jobs: "queue.Queue[Tuple[str, str, Future]]" = queue.Queue()
+        # "pyttsx3" or "placeholder" once the thread has tried to start the engine
+        self.engine: Optional[str] = None
+        self._thread = threading.Thread(target=self._run, name="tts-worker", daemon=True)
+        self._thread.start()
+
+    def submit(self, text: str, out_path: str) -> Future:
+        fut: Future = Future()
+        self._jobs.put((text, out_path, fut))
+        return fut
+
+    def _init_engine(self):
+        try:
+            import pyttsx3  # type: ignore
+
+            engine = pyttsx3.init()
+            if TTS_VOICE:
+                engine.setProperty("voice", TTS_VOICE)
+            if TTS_RATE > 0:
+                engine.setProperty("rate", TTS_RATE)
+            return engine
+        except Exception as e:
+            logger.warning(f"pyttsx3 unavailable, writing placeholders: {e}")
+            return None
+
+    def _run(self) -> None:
+        engine = self._init_engine()
+        self.engine = "pyttsx3" if engine is not None else "placeholder"
+        while True:
+            text, out_path, fut = self._jobs.get()
+            if not fut.set_running_or_notify_cancel():
+                continue
+            try:
+                if engine is not None:
+                    engine.save_to_file(text, out_path)
+                    engine.runAndWait()
+                    fut.set_result((out_path, "pyttsx3"))
+                else:
+                    _write_placeholder(text, out_path)
+                    fut.set_result((out_path, "placeholder"))
+            except Exception as e:
+                logger.warning(f"TTS synthesis failed, writing placeholder: {e}")
+                try:
+                    _write_placeholder(text, out_path)
+                    fut.set_result((out_path, "placeholder"))
+                except Exception:
+                    fut.set_exception(e)
+
+
+_worker: Optional[_TTSWorker] = None
+_worker_lock = threading.Lock()
+
+class _Pending:
+    """A queued synthesis shared by every caller that asked for the same key."""
+
+    def __init__(self) -> None:
+        self.future: Future = Future()
+        self.job: Optional[Future] = None
+        self.waiters = 1
+
+
+_inflight: Dict[str, _Pending] = {}
+_inflight_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+
+def _bump(name: str) -> None:
+    # Counted from request threads, the TTS worker and trim calls alike
+    with _worker_lock:
+        _stats[name] += 1
+
+
+def _get_worker() -> _TTSWorker:
+    global _worker
+    if _worker is None:
+        with _worker_lock:
+            if _worker is None:
+                _worker = _TTSWorker()
+    return _worker
 
 
 def speak_local(text: str, out_path: str) -> str:
@@ -17,19 +143,260 @@ def speak_local(text: str, out_path: str) -> str:
         raise ValueError("text is empty")
     out_dir = os.path.dirname(out_path) or "."
     os.makedirs(out_dir, exist_ok=True)
+    return _get_worker().submit(text, out_path).result()[0]
+
+
+def _engine_name() -> str:
+    """Engine that will synthesize: known once the worker started, else a guess."""
+    worker = _worker
+    if worker is not None and worker.engine is not None:
+        return worker.engine
+    return "pyttsx3" if importlib.util.find_spec("pyttsx3") else "placeholder"
+
+
+def cache_key(text: str, engine: Optional[str] = None) -> str:
+    """Content address of the audio for text under the current voice settings."""
+    engine = engine or _engine_name()
+    spec = json.dumps(
+        {"text": text, "voice": TTS_VOICE, "rate": TTS_RATE, "engine": engine}, sort_keys=True
+    )
+    return hashlib.sha256(spec.encode("utf-8")).hexdigest()
+
+
+def cache_path(key: str) -> str:
+    return os.path.join(TTS_CACHE_DIR, key + AUDIO_EXT)
+
+
+def _trim_cache() -> None:
+    """Evict least recently played files until the cache fits TTS_CACHE_MAX_BYTES."""
+    try:
+        entries = []
+        total = 0
+        for name in os.listdir(TTS_CACHE_DIR):
+            if name.startswith(".") or not name.endswith(AUDIO_EXT):
+                continue  # skip in-progress temp files
+            st = os.stat(os.path.join(TTS_CACHE_DIR, name))
+            entries.append((st.st_mtime, st.st_size, name))
+            total += st.st_size
+        entries.sort()
+        for _, size, name in entries:
+            if total <= TTS_CACHE_MAX_BYTES:
+                break
+            try:
+                os.remove(os.path.join(TTS_CACHE_DIR, name))
+                total -= size
+                _bump("evictions")
+            except OSError:
+                pass
+    except Exception as e:
+        logger.warning(f"TTS cache trim failed: {e}")
+
+
+def submit_cached(text: str) -> Future:
+    """Future resolving to the cached audio file for text.
+
+    Hits resolve immediately; misses are queued on the TTS worker in call
+    order, so submitting several texts pipelines their synthesis. Concurrent
+    requests for the same text share one synthesis.
+    """
+    return _submit(text)[1]
+
+
+def _submit(text: str) -> Tuple[str, Future]:
+    """submit_cached() that also returns the cache key (for release())."""
+    if not text:
+        raise ValueError("text is empty")
+    os.makedirs(TTS_CACHE_DIR, exist_ok=True)
+    engine = _engine_name()
+    key = cache_key(text, engine)
+    path = cache_path(key)
+    if os.path.exists(path):
+        try:
+            os.utime(path)  # mark as recently played for LRU eviction
+        except OSError:
+            pass
+        _bump("hits")
+        done: Future = Future()
+        done.set_result(path)
+        return key, done
+
+    with _inflight_lock:
+        pending = _inflight.get(key)
+        if pending is not None:
+            pending.waiters += 1
+            return key, pending.future
+        pending = _inflight[key] = _Pending()
+    fut = pending.future
+    _bump("misses")
+
+    tmp = os.path.join(TTS_CACHE_DIR, f".{key}.{uuid.uuid4().hex}{AUDIO_EXT}")
+
+    def _finish(job: Future) -> None:
+        try:
+            if job.cancelled():
+                fut.cancel()
+                return
+            _, used = job.result()
+            target = path
+            if used != engine:
+                # The engine did not start or this synthesis failed; file the
+                # placeholder under its own key, never under the audio key
+                target = cache_path(cache_key(text, used))
+            os.replace(tmp, target)
+            _trim_cache()
+            fut.set_result(target)
+        except Exception as e:
+            fut.set_exception(e)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            with _inflight_lock:
+                _inflight.pop(key, None)
+
+    job = _get_worker().submit(text, tmp)
+    with _inflight_lock:
+        pending.job = job
+    job.add_done_callback(_finish)
+    return key, fut
+
+
+def release(key: str) -> None:
+    """Drop one caller's interest in a queued synthesis.
+
+    When nobody else is waiting for it and the worker has not started it yet,
+    the job is cancelled; a job already being synthesized still finishes and
+    is cached.
+    """
+    with _inflight_lock:
+        pending = _inflight.get(key)
+        if pending is None:
+            return
+        pending.waiters -= 1
+        if pending.waiters > 0 or pending.job is None:
+            return
+        job = pending.job
+    job.cancel()
+
+
+def synthesize_cached(text: str) -> str:
+    """Return a cached audio file for text, synthesizing it on a miss."""
+    return submit_cached(text).result()
+
+
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+|\n{2,}|\n(?=\s*(?:[-*\u2022]|\d+[.)])\s)")
+
+
+def split_sentences(text: str, min_chars: int = 40, max_chars: int = 400) -> List[str]:
+    """Split text into speakable segments, roughly one sentence each.
+
+    Fragments shorter than min_chars (headings, "e.g.") are joined to the next
+    one; very long sentences are cut at commas/spaces to stay under max_chars.
+    """
+    pieces = [p.strip() for p in _SENTENCE_END.split(text or "") if p and p.strip()]
+    segments: List[str] = []
+    buf = ""
+    for piece in pieces:
+        buf = f"{buf} {piece}".strip() if buf else piece
+        if len(buf) >= min_chars:
+            segments.extend(_cut_long(buf, max_chars))
+            buf = ""
+    if buf:
+        if segments and len(segments[-1]) + len(buf) < max_chars:
+            segments[-1] = f"{segments[-1]} {buf}"
+        else:
+            segments.append(buf)
+    return segments
+
+
+def _cut_long(text: str, max_chars: int) -> List[str]:
+    out: List[str] = []
+    while len(text) > max_chars:
+        cut = text.rfind(", ", 0, max_chars)
+        if cut <= 0:
+            cut = text.rfind(" ", 0, max_chars)
+        if cut <= 0:
+            cut = max_chars
+        out.append(text[:cut + 1].strip())
+        text = text[cut + 1:].strip()
+    if text:
+        out.append(text)
+    return out
+
+
+class SegmentStream:
+    """Sentences of a text, synthesized (and cached) one by one as they are read.
+
+    Iterating yields (sentence, future) pairs in reading order. Only the
+    sentence being read and the next `ahead` ones are queued on the TTS
+    worker, so other requests get the engine in between. Each sentence is
+    cached on its own, so a regenerated explanation only synthesizes the
+    sentences that changed. close() releases sentences queued but not yet
+    synthesized, e.g. when the listener disconnects.
+    """
+
+    def __init__(self, text: str, ahead: int = TTS_STREAM_AHEAD) -> None:
+        self.sentences = split_sentences(text)
+        self.ahead = max(0, ahead)
+        self._queued: List[Tuple[str, Future]] = []
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def __len__(self) -> int:
+        return len(self.sentences)
+
+    def _fill(self, upto: int) -> None:
+        with self._lock:
+            while not self._closed and len(self._queued) <= min(upto, len(self.sentences) - 1):
+                self._queued.append(_submit(self.sentences[len(self._queued)]))
+
+    def __iter__(self) -> Iterator[Tuple[str, Future]]:
+        for index, sentence in enumerate(self.sentences):
+            self._fill(index + self.ahead)
+            if self._closed:
+                return
+            yield sentence, self._queued[index][1]
+
+    def close(self) -> None:
+        with self._lock:
+            self._closed = True
+            queued, self._queued = self._queued, []
+        for key, fut in queued:
+            if not fut.done():
+                release(key)
+
+
+def submit_segments(text: str) -> SegmentStream:
+    """Split text into sentences for lazily queued synthesis (see SegmentStream)."""
+    return SegmentStream(text)
+
+
+def cache_stats() -> Dict[str, object]:
+    with _worker_lock:
+        out: Dict[str, object] = dict(_stats)
     try:
-        import pyttsx3  # type: ignore
-        engine = pyttsx3.init()
-        engine.save_to_file(text, out_path)
-        engine.runAndWait()
-    except Exception:
-        # Fallback: write text content so tests can verify output exists
-        with open(out_path, "w", encoding="utf-8") as f:
-            f.write("[tts-fallback]\n" + text)
-    return out_path
+        sizes = [
+            os.path.getsize(os.path.join(TTS_CACHE_DIR, n))
+            for n in os.listdir(TTS_CACHE_DIR)
+            if n.endswith(AUDIO_EXT) and not n.startswith(".")
+        ]
+        out.update({"files": len(sizes), "bytes": sum(sizes)})
+    except OSError:
+        out.update({"files": 0, "bytes": 0})
+    return out
 
 
 def speak_cloud(text: str, out_path: Optional[str] = None) -> str:
     """Cloud TTS stub (no implementation)."""
     # TODO: Implement cloud TTS provider
     return ""
+
+
+def _reset_after_fork() -> None:
+    # The worker thread does not exist in a forked child
+    global _worker
+    _worker = None
+    _inflight.clear()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
@@ -2,6 +2,7 @@ from fastapi import FastAPI, Request, status
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 from backend.routers import ingest, pages, qa, study_aids, media
+import asyncio
 import os
 import logging
 import time
@@ -76,11 +77,32 @@ async def startup_event():
     logger.info(f"   Environment: {os.getenv('ENV', 'development')}")
     logger.info(f"   CORS Origins: {origins}")
     logger.info("   Routers registered: ingest, pages, qa, study_aids, media")
+    try:
+        from backend.services import ingest_jobs
+        ingest_jobs.start()
+    except Exception as e:
+        logger.warning(f"   Could not resume ingest jobs: {e}")
+    try:
+        from backend.services import warmup
+        # Models load on a background thread; /ready reports when they are warm
+        warmup.start()
+    except Exception as e:
+        logger.warning(f"   Model warmup skipped: {e}")
 
 # Shutdown event
 @app.on_event("shutdown")
 async def shutdown_event():
     logger.info("🛑 AI Tutor Backend API shutting down...")
+    try:
+        from ai_core import llm_client
+        await llm_client.aclose()
+    except Exception as e:
+        logger.warning(f"   Failed to close LLM HTTP client: {e}")
+    try:
+        from ai_core import doc_pool
+        doc_pool.close_all()
+    except Exception as e:
+        logger.warning(f"   Failed to close PDF handles: {e}")
 
 # Health check
 @app.get("/", tags=["Health"])
@@ -95,9 +117,21 @@ async def root():
 
 @app.get("/health", tags=["Health"])
 async def health_check():
+    """Liveness: the process is up and serving requests."""
     logger.debug("Health check endpoint called")
     return {"status": "ok"}
 
+@app.get("/ready", tags=["Health"])
+async def readiness_check():
+    """Readiness: 200 once the configured models are warm; 503 while they load
+    ("warming") or if one of them failed to load ("degraded")."""
+    from backend.services import warmup
+    # Off the event loop: in model-host client mode this pings the host socket
+    report = await asyncio.to_thread(warmup.status)
+    code = status.HTTP_200_OK if report["ready"] else status.HTTP_503_SERVICE_UNAVAILABLE
+    state = "ready" if report["ready"] else "degraded" if report["failed"] else "warming"
+    return JSONResponse(status_code=code, content=dict(report, status=state))
+
 # Include routers
 logger.info("Registering routers...")
 app.include_router(ingest.router, prefix="/ingest", tags=["Ingest"])
@@ -6,12 +6,27 @@ class UploadResp(BaseModel):
     doc_id: str
     name: str
     page_count: int
+    status: str = "done"  # queued | running | done | failed
+
+class IngestStatusResp(BaseModel):
+    doc_id: str
+    name: Optional[str] = None
+    status: str
+    stage: Optional[str] = None
+    done: int = 0
+    total: int = 0
+    page_count: int = 0
+    ready: int = 0  # pages already usable
+    percent: float = 0.0
+    error: Optional[str] = None
 
 class PageInfo(BaseModel):
     page_id: int
+    status: str = "ready"  # ready | pending (still being ingested)
 
 class PagesResp(BaseModel):
     pages: List[PageInfo]
+    status: str = "ready"  # document status: ingesting | ready | failed
 
 class ExplainResp(BaseModel):
     page_id: int
@@ -1,8 +1,13 @@
 from fastapi import APIRouter, UploadFile, File, Form, HTTPException
+from fastapi.responses import StreamingResponse
 from backend.services.doc_store import DocStore
-from backend.services.ai_adapter import ingest_pdf, build_index
-from backend.models.schemas import UploadResp
-from backend.utils.files import save_upload
+from backend.services import ingest_jobs
+from backend.models.schemas import UploadResp, IngestStatusResp
+from backend.utils.files import save_upload, file_sha256
+from backend.utils.sse import sse_event, SSE_HEADERS
+from ai_core.doc_pool import page_count as count_pages
+from pathlib import Path
+import asyncio
 import uuid
 import logging
 
@@ -11,36 +16,118 @@ router = APIRouter()
 
 doc_store = DocStore()
 
+def _reuse_existing(content_hash: str, name: str, path: str):
+    """Return an upload response reusing a stored document with identical bytes.
+
+    The stored page contexts and vector collection are shared; if the new upload
+    carries a different name, a new doc_id alias pointing at them is issued.
+    """
+    orig_id = doc_store.find_by_hash(content_hash)
+    orig = doc_store.get(orig_id) if orig_id else None
+    if not orig:
+        return None
+    orig_pdf = orig.get("pdf_path")
+    if orig_pdf and Path(orig_pdf).exists() and Path(orig_pdf) != Path(path):
+        # The bytes are already on disk; drop the duplicate copy
+        try:
+            Path(path).unlink()
+        except Exception:
+            pass
+    else:
+        orig_pdf = str(path)
+        doc_store.update(orig_id, pdf_path=orig_pdf)
+
+    page_contexts = orig["page_contexts"]
+    if orig.get("name") == name:
+        doc_id = orig_id
+    else:
+        doc_id = str(uuid.uuid4())
+        doc_store.save(doc_id, page_contexts, orig.get("index"), name, orig_pdf,
+                       content_hash=content_hash, index_id=orig_id)
+        logger.info(f"✅ Issued alias doc_id={doc_id} for doc_id={orig_id}")
+    return {"doc_id": doc_id, "name": name, "page_count": len(page_contexts)}
+
 @router.post("/upload", response_model=UploadResp)
 async def upload(file: UploadFile = File(...), name: str = Form(None)):
+    """Save the PDF and queue its ingestion; returns the doc_id immediately.
+
+    Poll `/ingest/{doc_id}/status` (or stream it) for progress.
+    """
     try:
         logger.info(f"📥 Upload request: filename={file.filename}, name={name}")
         
         # Save uploaded file
         logger.debug("Saving uploaded file...")
-        path = save_upload(file)
+        path = await asyncio.to_thread(save_upload, file)
         logger.info(f"✅ File saved to: {path}")
         
-        # Ingest PDF
-        logger.debug("Starting PDF ingestion...")
-        page_contexts = ingest_pdf(path)
-        logger.info(f"✅ PDF ingested: {len(page_contexts)} pages")
+        # Reuse a previous ingest of the same bytes if we have one
+        content_hash = await asyncio.to_thread(file_sha256, path)
+        existing = _reuse_existing(content_hash, name or file.filename, path)
+        if existing:
+            logger.info(f"📤 Upload deduplicated: {existing}")
+            return existing
         
-        # Build index
-        logger.debug("Building vector index...")
-        index = build_index(page_contexts)
-        logger.info(f"✅ Vector index built")
+        # Same bytes already being ingested: report that job instead of starting another
+        active = ingest_jobs.find_active(content_hash)
+        if active:
+            try:
+                Path(path).unlink()
+            except Exception:
+                pass
+            logger.info(f"📤 Upload joins running job: doc_id={active['doc_id']}")
+            return {"doc_id": active["doc_id"], "name": active["name"],
+                    "page_count": active["page_count"], "status": active["status"]}
         
-        # Store document with PDF path
-        doc_id = str(uuid.uuid4())
-        doc_store.save(doc_id, page_contexts, index, name or file.filename, str(path))
-        logger.info(f"✅ Document stored: doc_id={doc_id}")
+        # Queue ingestion (OCR, captions, embeddings) on the background workers
+        page_count = await asyncio.to_thread(count_pages, str(path))
+        doc_id = ingest_jobs.submit(name or file.filename, str(path), content_hash, page_count)
         
-        result = {"doc_id": doc_id, "name": name or file.filename, "page_count": len(page_contexts)}
-        logger.info(f"📤 Upload complete: {result}")
+        result = {"doc_id": doc_id, "name": name or file.filename, "page_count": page_count, "status": "queued"}
+        logger.info(f"📤 Upload queued: {result}")
         return result
         
     except Exception as e:
         logger.error(f"❌ Upload failed: {str(e)}")
         logger.exception(e)
         raise HTTPException(status_code=500, detail=f"Upload failed: {str(e)}")
+
+def _status(doc_id: str):
+    job = ingest_jobs.get_job_store().get(doc_id)
+    if job:
+        return ingest_jobs.job_status(job)
+    # Documents stored before jobs existed, or deduplicated aliases
+    doc = doc_store.get(doc_id)
+    if doc:
+        pages = len(doc.get("page_contexts") or [])
+        return {"doc_id": doc_id, "name": doc.get("name"), "status": "done", "stage": "done",
+                "done": pages, "total": pages, "page_count": pages, "ready": pages, "percent": 100.0,
+                "error": None}
+    return None
+
+@router.get("/{doc_id}/status", response_model=IngestStatusResp)
+async def ingest_status(doc_id: str):
+    status = _status(doc_id)
+    if not status:
+        raise HTTPException(status_code=404, detail="Document not found")
+    return status
+
+@router.get("/{doc_id}/status/stream")
+async def ingest_status_stream(doc_id: str):
+    """Server-Sent Events with the job status on every change, until done/failed."""
+    if not _status(doc_id):
+        raise HTTPException(status_code=404, detail="Document not found")
+
+    async def events():
+        last = None
+        while True:
+            status = _status(doc_id)
+            if status != last:
+                yield sse_event(status)
+                last = status
+            if not status or status["status"] in ("done", "failed"):
+                yield sse_event(status, event="done")
+                return
+            await asyncio.sleep(0.5)
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers=SSE_HEADERS)
@@ -1,117 +1,124 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException
-from fastapi.responses import FileResponse
-from backend.services.ai_adapter import text_to_speech, speech_to_text
-from backend.utils.files import save_upload
+from fastapi import APIRouter, UploadFile, File, HTTPException, WebSocket, WebSocketDisconnect
+from fastapi.responses import FileResponse, StreamingResponse
+from backend.services.ai_adapter import text_to_speech_cached, text_to_speech_segments, tts_cache_file
+from backend.services.ai_adapter import speech_to_text_bytes, SpeechStream
+from backend.utils.sse import sse_event, SSE_HEADERS
 from pydantic import BaseModel
+import asyncio
+import logging
 import os
-import uuid
-from pathlib import Path
-import subprocess
-import shutil
 
 router = APIRouter()
-
-AUDIO_DIR = Path("./audio")
-AUDIO_DIR.mkdir(exist_ok=True, parents=True)
-
-def temp_audio_path():
-    return str(AUDIO_DIR / f"{uuid.uuid4()}.mp3")
+logger = logging.getLogger("backend.routers.media")
 
 class TTSRequest(BaseModel):
     text: str
 
 @router.post("/tts")
 async def tts(request: TTSRequest):
-    out_path = temp_audio_path()
-    text_to_speech(request.text, out_path)
-    return FileResponse(out_path, media_type="audio/mpeg", filename=os.path.basename(out_path))
+    if not request.text:
+        raise HTTPException(status_code=400, detail="text is empty")
+    # Cached by text + voice settings; synthesis runs on the TTS worker thread
+    out_path = await asyncio.to_thread(text_to_speech_cached, request.text)
+    media_type = "audio/mpeg" if out_path.endswith(".mp3") else "audio/wav"
+    return FileResponse(out_path, media_type=media_type, filename=os.path.basename(out_path))
 
+@router.post("/tts/stream")
+async def tts_stream(request: TTSRequest):
+    """Speak long text sentence by sentence as Server-Sent Events.
 
-import logging
-import shutil
-logger = logging.getLogger("backend.routers.media")
+    Each event carries {"index", "text", "url"} for one synthesized sentence,
+    in reading order, as soon as it is ready; the client plays the URLs in
+    sequence. Sentences are queued on the TTS worker a few at a time as the
+    stream advances and cached individually. Ends with `event: done`; if the
+    client disconnects, sentences not yet synthesized are dropped.
+    """
+    if not request.text:
+        raise HTTPException(status_code=400, detail="text is empty")
+    segments = await asyncio.to_thread(text_to_speech_segments, request.text)
+
+    async def events():
+        try:
+            # Each step queues at most the next sentence ahead on the worker
+            for index, (sentence, fut) in enumerate(segments):
+                path = await asyncio.wrap_future(fut)
+                name = os.path.basename(path)
+                yield sse_event({"index": index, "text": sentence, "url": f"/media/tts/audio/{name}"})
+            yield sse_event({"segments": len(segments)}, event="done")
+        except Exception as e:
+            logger.error(f"[TTS] Stream failed: {e}")
+            yield sse_event({"detail": str(e)}, event="error")
+        finally:
+            segments.close()
 
-def find_ffmpeg():
-    """Find ffmpeg executable in common locations."""
-    # Check project-local ffmpeg first
-    project_ffmpeg = Path(__file__).parent.parent.parent / "ffmpeg-8.0-essentials_build" / "bin" / "ffmpeg.exe"
-    if project_ffmpeg.exists():
-        return str(project_ffmpeg)
-    
-    # Check if ffmpeg is in PATH
-    ffmpeg_path = shutil.which('ffmpeg')
-    if ffmpeg_path:
-        return ffmpeg_path
-    
-    # Check common Windows installation locations
-    common_paths = [
-        r"C:\Program Files\ffmpeg\bin\ffmpeg.exe",
-        r"C:\ffmpeg\bin\ffmpeg.exe",
-        r"C:\Program Files (x86)\ffmpeg\bin\ffmpeg.exe",
-    ]
-    for path in common_paths:
-        if os.path.exists(path):
-            return path
-    
-    return None
+    return StreamingResponse(events(), media_type="text/event-stream", headers=SSE_HEADERS)
+
+@router.get("/tts/audio/{name}")
+async def tts_audio(name: str):
+    path = tts_cache_file(name)
+    if not path:
+        raise HTTPException(status_code=404, detail="Audio segment not found")
+    return FileResponse(path, media_type="audio/wav", headers={"Cache-Control": "public, max-age=31536000, immutable"})
 
 @router.post("/stt")
 async def stt(audio: UploadFile = File(...)):
-    path = save_upload(audio)
-    logger.info(f"[STT] Saved audio to: {path}")
+    data = await audio.read()
+    logger.info(f"[STT] Received audio: {audio.filename} ({len(data)} bytes)")
 
-    # Convert webm to wav if needed
-    wav_path = None
-    if path.lower().endswith('.webm'):
-        wav_path = path[:-5] + '.wav'
-        
-        # Find ffmpeg
-        ffmpeg_exe = find_ffmpeg()
-        if not ffmpeg_exe:
-            logger.error("[STT] ffmpeg not found in PATH or common locations")
-            return {"text": ""}
-        
-        logger.info(f"[STT] Using ffmpeg: {ffmpeg_exe}")
-        
-        try:
-            # Use subprocess to run ffmpeg directly
-            cmd = [
-                ffmpeg_exe,
-                '-i', path,
-                '-f', 'wav',
-                '-acodec', 'pcm_s16le',
-                '-ac', '1',
-                '-ar', '16000',
-                '-y',  # Overwrite output
-                wav_path
-            ]
-            result = subprocess.run(cmd, capture_output=True, text=True)
-            if result.returncode != 0:
-                logger.error(f"[STT] ffmpeg failed: {result.stderr}")
-                return {"text": ""}
-            
-            # Log WAV file info
-            wav_size = os.path.getsize(wav_path)
-            logger.info(f"[STT] Converted to WAV: {wav_path} ({wav_size} bytes)")
-            
-            # Get audio duration using ffmpeg
-            probe_cmd = [ffmpeg_exe, '-i', wav_path, '-f', 'null', '-']
-            probe_result = subprocess.run(probe_cmd, capture_output=True, text=True)
-            # Duration is in stderr output
-            import re
-            duration_match = re.search(r'Duration: (\d{2}):(\d{2}):(\d{2}\.\d{2})', probe_result.stderr)
-            if duration_match:
-                h, m, s = duration_match.groups()
-                duration_sec = int(h) * 3600 + int(m) * 60 + float(s)
-                logger.info(f"[STT] Audio duration: {duration_sec:.2f} seconds")
-            else:
-                logger.warning(f"[STT] Could not determine audio duration")
-        except Exception as e:
-            logger.error(f"[STT] ffmpeg conversion failed: {e}")
-            return {"text": ""}
-    else:
-        wav_path = path
+    # One ffmpeg pass decodes straight to a 16 kHz float32 buffer in memory
+    try:
+        text, duration_sec = await asyncio.to_thread(speech_to_text_bytes, data)
+    except Exception as e:
+        logger.error(f"[STT] Decoding/transcription failed: {e}")
+        return {"text": ""}
 
-    text = speech_to_text(wav_path)
+    logger.info(f"[STT] Audio duration: {duration_sec:.2f} seconds")
     logger.info(f"[STT] Transcription result: '{text}'")
     return {"text": text}
+
+
+@router.websocket("/stt/stream")
+async def stt_stream(websocket: WebSocket, format: str = "pcm16"):
+    """Live transcription while the student speaks.
+
+    Client sends binary audio chunks (raw 16 kHz mono s16le by default, or
+    ?format=webm for MediaRecorder chunks) and the text "end" when done.
+    Server replies {"type": "partial", "text"} as the transcript changes and a
+    single {"type": "final", "text"} after "end".
+    """
+    await websocket.accept()
+    try:
+        stream = await asyncio.to_thread(SpeechStream, format)
+    except Exception as e:
+        logger.error(f"[STT] Could not start stream: {e}")
+        await websocket.send_json({"type": "error", "detail": str(e)})
+        await websocket.close()
+        return
+
+    logger.info(f"[STT] Stream opened (format={format}, engine={stream.recognizer.engine})")
+    try:
+        while True:
+            message = await websocket.receive()
+            if message.get("type") == "websocket.disconnect":
+                raise WebSocketDisconnect(message.get("code", 1000))
+            if message.get("bytes"):
+                partial = await asyncio.to_thread(stream.feed, message["bytes"])
+                if partial is not None:
+                    await websocket.send_json({"type": "partial", "text": partial})
+            elif (message.get("text") or "").strip().lower() == "end":
+                text = await asyncio.to_thread(stream.finish)
+                logger.info(f"[STT] Stream transcription result: '{text}'")
+                await websocket.send_json({"type": "final", "text": text})
+                await websocket.close()
+                return
+    except WebSocketDisconnect:
+        logger.info("[STT] Stream client disconnected")
+        await asyncio.to_thread(stream.abort)
+    except Exception as e:
+        logger.error(f"[STT] Stream failed: {e}")
+        await asyncio.to_thread(stream.abort)
+        try:
+            await websocket.send_json({"type": "error", "detail": str(e)})
+            await websocket.close()
+        except Exception:
+            pass
@@ -1,11 +1,14 @@
-from fastapi import APIRouter, HTTPException
-from fastapi.responses import Response
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import Response, StreamingResponse
 from backend.services.doc_store import DocStore
-from backend.services.ai_adapter import generate_explanation, build_index
+from backend.services.ai_adapter import agenerate_explanation, astream_explanation, get_or_build_index, open_index
 from backend.models.schemas import PagesResp, ExplainResp
+from backend.services.page_render import get_page_image as render_page_image
+from backend.services.page_render import normalize_format, render_key, DEFAULT_ZOOM, MEDIA_TYPES
+from backend.services.page_render import RENDER_MAX_WIDTH, RENDER_THUMB_WIDTH
+from backend.utils.sse import sse_event, SSE_HEADERS
+import asyncio
 import logging
-import fitz  # PyMuPDF
-import io
 
 logger = logging.getLogger("backend.pages")
 router = APIRouter()
@@ -19,9 +22,12 @@ async def list_pages(doc_id: str):
         if not doc:
             logger.warning(f"⚠️ Document not found: {doc_id}")
             raise HTTPException(status_code=404, detail="Document not found")
-        pages = [{"page_id": i} for i in range(len(doc["page_contexts"]))]
-        logger.info(f"✅ Found {len(pages)} pages")
-        return {"pages": pages}
+        # Pages still being ingested are listed as pending
+        ready = len(doc["page_contexts"])
+        total = max(ready, doc.get("page_count") or 0)
+        pages = [{"page_id": i, "status": "ready" if i < ready else "pending"} for i in range(total)]
+        logger.info(f"✅ Found {len(pages)} pages ({ready} ready)")
+        return {"pages": pages, "status": doc.get("status") or "ready"}
     except HTTPException:
         raise
     except Exception as e:
@@ -29,33 +35,52 @@ async def list_pages(doc_id: str):
         logger.exception(e)
         raise HTTPException(status_code=500, detail=str(e))
 
+def _page_text(doc_id: str, page_id: int) -> str:
+    """Return the merged text of one page.
+
+    Raises 404 for an unknown doc/page and 202 (status "pending") for a page
+    that ingestion has not reached yet. Blocking (reopening an index may
+    re-embed the whole document), so async handlers run it in a thread.
+    """
+    doc = doc_store.get(doc_id)
+    if not doc:
+        logger.warning(f"⚠️ Document not found: {doc_id}")
+        raise HTTPException(status_code=404, detail="Document not found")
+    
+    page_contexts = doc["page_contexts"]
+    # Reopen the persisted index lazily if missing (e.g., after server restart);
+    # while ingesting, open whatever the job has indexed so far, never rebuild
+    if not doc.get("index") and doc.get("status", "ready") == "ingesting":
+        idx = open_index(doc.get("index_id") or doc_id)
+        if idx is not None:
+            doc["index"] = idx
+    elif not doc.get("index"):
+        logger.info("ℹ️ Index handle missing for doc; reopening persisted collection...")
+        try:
+            idx = get_or_build_index(doc.get("index_id") or doc_id, page_contexts)
+            doc["index"] = idx
+        except Exception as e:
+            logger.warning(f"⚠️ Failed to rebuild index: {e}")
+    state = doc_store.page_state(doc, page_id)
+    if state == "pending":
+        logger.info(f"⏳ Page {page_id} of {doc_id} is still being ingested")
+        raise HTTPException(status_code=202, detail={"page_id": page_id, "status": "pending"},
+                            headers={"Retry-After": "2"})
+    if state is None:
+        logger.warning(f"⚠️ Invalid page_id: {page_id} (total pages: {len(page_contexts)})")
+        raise HTTPException(status_code=404, detail="Page not found")
+    
+    page_context = page_contexts[page_id]
+    # our ingest uses 'page_context' field for combined text
+    return page_context.get('page_context') or page_context.get('text', '')
+
 @router.get("/{doc_id}/pages/{page_id}/explain", response_model=ExplainResp)
 async def explain_page(doc_id: str, page_id: int, model: str = None):
     try:
         logger.info(f"💡 Explain page request: doc_id={doc_id}, page_id={page_id}, model={model}")
-        doc = doc_store.get(doc_id)
-        if not doc:
-            logger.warning(f"⚠️ Document not found: {doc_id}")
-            raise HTTPException(status_code=404, detail="Document not found")
-        
-        page_contexts = doc["page_contexts"]
-        # Rebuild index lazily if missing (e.g., after server restart)
-        if not doc.get("index"):
-            logger.info("ℹ️ Index missing for doc; rebuilding now...")
-            try:
-                idx = build_index(page_contexts)
-                doc["index"] = idx
-            except Exception as e:
-                logger.warning(f"⚠️ Failed to rebuild index: {e}")
-        if page_id < 0 or page_id >= len(page_contexts):
-            logger.warning(f"⚠️ Invalid page_id: {page_id} (total pages: {len(page_contexts)})")
-            raise HTTPException(status_code=404, detail="Page not found")
-        
-        page_context = page_contexts[page_id]
+        base_text = await asyncio.to_thread(_page_text, doc_id, page_id)
         logger.debug(f"Generating explanation for page {page_id}...")
-        # our ingest uses 'page_context' field for combined text
-        base_text = page_context.get('page_context') or page_context.get('text', '')
-        explanation = generate_explanation(base_text, model)
+        explanation = await agenerate_explanation(base_text, model)
         logger.info(f"✅ Explanation generated: {len(explanation)} chars")
         
         return {"page_id": page_id, "explanation": explanation}
@@ -66,11 +91,52 @@ async def explain_page(doc_id: str, page_id: int, model: str = None):
         logger.exception(e)
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.get("/{doc_id}/pages/{page_id}/explain/stream")
+async def explain_page_stream(doc_id: str, page_id: int, model: str = None):
+    """Stream the explanation as Server-Sent Events.
+
+    Emits `data: {"delta": "..."}` per chunk, then `event: done` with the page_id
+    (or `event: error`). The completed text is cached like the JSON endpoint.
+    """
+    logger.info(f"💡 Explain stream request: doc_id={doc_id}, page_id={page_id}, model={model}")
+    base_text = await asyncio.to_thread(_page_text, doc_id, page_id)
+
+    async def events():
+        size = 0
+        try:
+            async for chunk in astream_explanation(base_text, model):
+                size += len(chunk)
+                yield sse_event({"delta": chunk})
+            logger.info(f"✅ Explanation streamed: {size} chars")
+            yield sse_event({"page_id": page_id}, event="done")
+        except Exception as e:
+            logger.error(f"❌ Explain stream failed: {str(e)}")
+            logger.exception(e)
+            yield sse_event({"detail": str(e)}, event="error")
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers=SSE_HEADERS)
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    """True if an If-None-Match header lists etag (weak or strong) or is "*"."""
+    for tag in (if_none_match or "").split(","):
+        tag = tag.strip()
+        if tag.startswith("W/"):
+            tag = tag[2:]
+        if tag == "*" or tag.strip('"') == etag:
+            return True
+    return False
+
 @router.get("/{doc_id}/pages/{page_id}/image")
-async def get_page_image(doc_id: str, page_id: int):
-    """Render a PDF page as PNG image"""
+async def get_page_image(request: Request, doc_id: str, page_id: int, format: str = "png",
+                         zoom: float = DEFAULT_ZOOM, width: int = None, thumb: bool = False):
+    """Render a PDF page as an image (png, webp or jpeg), served from the render cache.
+
+    `thumb=true` returns a RENDER_THUMB_WIDTH-wide thumbnail; `width` sets an
+    explicit pixel width instead of `zoom`. Responses carry an ETag, and a
+    matching If-None-Match gets 304.
+    """
     try:
-        logger.info(f"🖼️ Get page image request: doc_id={doc_id}, page_id={page_id}")
+        logger.info(f"🖼️ Get page image request: doc_id={doc_id}, page_id={page_id}, format={format}")
         doc = doc_store.get(doc_id)
         if not doc:
             logger.warning(f"⚠️ Document not found: {doc_id}")
@@ -82,26 +148,34 @@ async def get_page_image(doc_id: str, page_id: int):
             logger.error(f"❌ PDF path not found in document metadata")
             raise HTTPException(status_code=500, detail="PDF path not found")
         
-        # Open the PDF and render the page
-        pdf_doc = fitz.open(pdf_path)
+        try:
+            fmt = normalize_format(format)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        if thumb:
+            width = RENDER_THUMB_WIDTH
+        if width is not None and not (16 <= width <= RENDER_MAX_WIDTH):
+            raise HTTPException(status_code=400, detail=f"width must be in [16, {RENDER_MAX_WIDTH}]")
+        if not width and not (0 < zoom <= 8):
+            raise HTTPException(status_code=400, detail="zoom must be in (0, 8]")
         
-        if page_id < 0 or page_id >= len(pdf_doc):
-            logger.warning(f"⚠️ Invalid page_id: {page_id} (total pages: {len(pdf_doc)})")
+        # Aliases of the same upload share renders through the content hash
+        doc_key = doc.get("content_hash") or doc.get("index_id") or doc_id
+        # The ETag is the render cache key, so a revalidation needs no render
+        etag = render_key(doc_key, page_id, zoom, width, fmt)
+        headers = {"ETag": f'"{etag}"', "Cache-Control": "public, max-age=86400"}
+        if _etag_matches(request.headers.get("if-none-match"), etag):
+            return Response(status_code=304, headers=headers)
+        try:
+            img_bytes, _ = await asyncio.to_thread(
+                render_page_image, pdf_path, doc_key, page_id, zoom, width, fmt
+            )
+        except IndexError:
+            logger.warning(f"⚠️ Invalid page_id: {page_id}")
             raise HTTPException(status_code=404, detail="Page not found")
         
-        # Get the page and render it as an image
-        page = pdf_doc[page_id]
-        # Render at 2x resolution for better quality
-        mat = fitz.Matrix(2, 2)
-        pix = page.get_pixmap(matrix=mat)
-        
-        # Convert to PNG bytes
-        img_bytes = pix.tobytes("png")
-        pdf_doc.close()
-        
-        logger.info(f"✅ Page image rendered: {len(img_bytes)} bytes")
-        
-        return Response(content=img_bytes, media_type="image/png")
+        logger.info(f"✅ Page image ready: {len(img_bytes)} bytes")
+        return Response(content=img_bytes, media_type=MEDIA_TYPES[fmt], headers=headers)
         
     except HTTPException:
         raise
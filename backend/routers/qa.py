@@ -1,110 +1,141 @@
 from fastapi import APIRouter, HTTPException
+from fastapi.responses import StreamingResponse
 from backend.services.doc_store import DocStore
-from backend.services.ai_adapter import query_index, answer_question_from_context, build_index
+from backend.services.ai_adapter import (
+    query_index,
+    aanswer_question_from_context,
+    astream_answer_from_context,
+    get_or_build_index,
+    open_index,
+)
 from backend.models.schemas import QAReq, QAResp
+from backend.utils.sse import sse_event, SSE_HEADERS
+import asyncio
 import logging
+import re
 
 logger = logging.getLogger("backend.qa")
 router = APIRouter()
 doc_store = DocStore()
 
+def _get_doc(doc_id: str):
+    doc = doc_store.get(doc_id)
+    if not doc:
+        logger.warning(f"⚠️ Document not found: {doc_id}")
+        raise HTTPException(status_code=404, detail="Document not found")
+    return doc
+
+def _build_context(doc_id: str, doc, req: QAReq):
+    """Collect the current page and retrieved pages into the LLM context.
+
+    Returns (context, used_contexts, total_pages). Blocking (index reopen and
+    the query embedding), so async handlers run it in a thread.
+    """
+    used_contexts = []
+    citations = []
+
+    # Build context: if page_id provided, prioritize that page's context
+    pcs = doc.get("page_contexts", [])
+    page_context = ""
+    if req.page_id is not None and 0 <= req.page_id < len(pcs):
+        page_context = pcs[req.page_id].get("page_context") or pcs[req.page_id].get("text") or ""
+        if page_context and len(page_context.strip()) > 20:
+            # Include more context from the current page
+            used_contexts.append(f"[Current Slide {req.page_id + 1}]: {page_context[:500]}")
+            citations.append({"page_id": req.page_id})
+
+    # If no page context or to enrich, query vector index
+    logger.debug(f"Querying vector index with k={req.k}...")
+    index = doc.get("index")
+    if not index and doc.get("status", "ready") == "ingesting":
+        # Another worker (or a run before a restart) owns the job; search the
+        # windows it has indexed so far without rebuilding anything
+        index = open_index(doc.get("index_id") or doc_id)
+        if index is not None:
+            doc["index"] = index
+    elif not index:
+        try:
+            logger.info("ℹ️ Index handle missing for doc; reopening persisted collection...")
+            index = get_or_build_index(doc.get("index_id") or doc_id, pcs)
+            doc["index"] = index
+        except Exception as e:
+            logger.warning(f"⚠️ Failed to rebuild index: {e}")
+    results = query_index(index, req.question, k=req.k)
+    logger.debug(f"Found {len(results)} relevant chunks")
+
+    # Merge context from results and build better citations
+    total_pages = len(pcs)
+    for r in results:
+        txt = r.get('text', '') or r.get('page_context', '')
+        if txt and len(txt.strip()) > 20:  # Only include substantial content
+            pid = r.get('page_id')
+            if pid is not None:
+                try:
+                    # page_id from vector index is 1-based from ingest.py
+                    # Convert to 0-based for frontend, but validate it's in range
+                    normalized_pid = int(pid) - 1
+
+                    # Validate page_id is within valid range
+                    if 0 <= normalized_pid < total_pages:
+                        # Format context with slide number for better LLM understanding
+                        formatted_context = f"[Slide {normalized_pid + 1}]: {txt[:500]}"
+                        used_contexts.append(formatted_context)
+                        citations.append({"page_id": normalized_pid})
+                    else:
+                        logger.warning(f"Invalid page_id {pid} (normalized: {normalized_pid}) - doc has {total_pages} pages")
+                except Exception as e:
+                    logger.warning(f"Failed to process page_id {pid}: {e}")
+                    used_contexts.append(txt[:500])  # fallback without slide number
+
+    # Deduplicate citations while preserving order and limit to top 5 most relevant
+    seen = set()
+    dedup_citations = []
+    for c in citations[:5]:  # Limit to top 5 most relevant slides
+        pid = c.get("page_id")
+        if pid not in seen and pid is not None:
+            dedup_citations.append(c)
+            seen.add(pid)
+
+    # Build final context string
+    if used_contexts:
+        context = "\n\n".join(used_contexts)
+    else:
+        # Fallback to concatenated page contexts
+        context = "\n\n".join([(pc.get('page_context') or pc.get('text') or '') for pc in pcs])
+
+    return context, used_contexts, total_pages
+
+def _extract_citations(answer: str, total_pages: int):
+    # Extract actual citations from the LLM's answer (parse [Slide X] references)
+    actual_citations = []
+    citation_pattern = re.compile(r'\[Slide\s+(\d+)\]', re.IGNORECASE)
+    cited_slides = set()
+
+    for match in citation_pattern.finditer(answer):
+        slide_num = int(match.group(1))
+        # Convert 1-based slide number to 0-based page_id
+        page_id = slide_num - 1
+        # Validate it's within range
+        if 0 <= page_id < total_pages and page_id not in cited_slides:
+            actual_citations.append({"page_id": page_id})
+            cited_slides.add(page_id)
+
+    logger.debug(f"Extracted {len(actual_citations)} citations from LLM answer")
+    return actual_citations
+
 @router.post("/{doc_id}/qa", response_model=QAResp)
 async def qa(doc_id: str, req: QAReq):
     try:
         logger.info(f"❓ Q&A request: doc_id={doc_id}, question={req.question}, k={req.k}, page_id={req.page_id}, model={req.model}")
-        doc = doc_store.get(doc_id)
-        if not doc:
-            logger.warning(f"⚠️ Document not found: {doc_id}")
-            raise HTTPException(status_code=404, detail="Document not found")
-        
-        used_contexts = []
-        citations = []
-
-        # Build context: if page_id provided, prioritize that page's context
-        pcs = doc.get("page_contexts", [])
-        page_context = ""
-        if req.page_id is not None and 0 <= req.page_id < len(pcs):
-            page_context = pcs[req.page_id].get("page_context") or pcs[req.page_id].get("text") or ""
-            if page_context and len(page_context.strip()) > 20:
-                # Include more context from the current page
-                used_contexts.append(f"[Current Slide {req.page_id + 1}]: {page_context[:500]}")
-                citations.append({"page_id": req.page_id})
-
-        # If no page context or to enrich, query vector index
-        logger.debug(f"Querying vector index with k={req.k}...")
-        index = doc.get("index")
-        if not index:
-            try:
-                logger.info("ℹ️ Index missing for doc; rebuilding now...")
-                index = build_index(pcs)
-                doc["index"] = index
-            except Exception as e:
-                logger.warning(f"⚠️ Failed to rebuild index: {e}")
-        results = query_index(index, req.question, k=req.k)
-        logger.debug(f"Found {len(results)} relevant chunks")
-
-        # Merge context from results and build better citations
-        total_pages = len(pcs)
-        for r in results:
-            txt = r.get('text', '') or r.get('page_context', '')
-            if txt and len(txt.strip()) > 20:  # Only include substantial content
-                pid = r.get('page_id')
-                if pid is not None:
-                    try:
-                        # page_id from vector index is 1-based from ingest.py
-                        # Convert to 0-based for frontend, but validate it's in range
-                        normalized_pid = int(pid) - 1
-                        
-                        # Validate page_id is within valid range
-                        if 0 <= normalized_pid < total_pages:
-                            # Format context with slide number for better LLM understanding
-                            formatted_context = f"[Slide {normalized_pid + 1}]: {txt[:500]}"
-                            used_contexts.append(formatted_context)
-                            citations.append({"page_id": normalized_pid})
-                        else:
-                            logger.warning(f"Invalid page_id {pid} (normalized: {normalized_pid}) - doc has {total_pages} pages")
-                    except Exception as e:
-                        logger.warning(f"Failed to process page_id {pid}: {e}")
-                        used_contexts.append(txt[:500])  # fallback without slide number
-
-        # Deduplicate citations while preserving order and limit to top 5 most relevant
-        seen = set()
-        dedup_citations = []
-        for c in citations[:5]:  # Limit to top 5 most relevant slides
-            pid = c.get("page_id")
-            if pid not in seen and pid is not None:
-                dedup_citations.append(c)
-                seen.add(pid)
-
-        # Build final context string
-        if used_contexts:
-            context = "\n\n".join(used_contexts)
-        else:
-            # Fallback to concatenated page contexts
-            context = "\n\n".join([(pc.get('page_context') or pc.get('text') or '') for pc in pcs])
+        doc = _get_doc(doc_id)
+        context, used_contexts, total_pages = await asyncio.to_thread(_build_context, doc_id, doc, req)
 
         # Generate answer
         logger.debug("Generating answer...")
-        answer = answer_question_from_context(context, req.question, req.model)
+        answer = await aanswer_question_from_context(context, req.question, req.model)
         logger.info(f"✅ Answer generated: {len(answer)} chars")
         
-        # Extract actual citations from the LLM's answer (parse [Slide X] references)
-        import re
-        actual_citations = []
-        citation_pattern = re.compile(r'\[Slide\s+(\d+)\]', re.IGNORECASE)
-        cited_slides = set()
-        
-        for match in citation_pattern.finditer(answer):
-            slide_num = int(match.group(1))
-            # Convert 1-based slide number to 0-based page_id
-            page_id = slide_num - 1
-            # Validate it's within range
-            if 0 <= page_id < total_pages and page_id not in cited_slides:
-                actual_citations.append({"page_id": page_id})
-                cited_slides.add(page_id)
-        
-        logger.debug(f"Extracted {len(actual_citations)} citations from LLM answer")
-        
+        actual_citations = _extract_citations(answer, total_pages)
         return {"answer": answer, "citations": actual_citations, "used_contexts": used_contexts}
     except HTTPException:
         raise
@@ -112,3 +143,38 @@ async def qa(doc_id: str, req: QAReq):
         logger.error(f"❌ Q&A failed: {str(e)}")
         logger.exception(e)
         raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/{doc_id}/qa/stream")
+async def qa_stream(doc_id: str, req: QAReq):
+    """Stream the answer as Server-Sent Events.
+
+    Emits `data: {"delta": "..."}` per chunk, then an `event: done` message with
+    the same citations/used_contexts as the JSON endpoint (or `event: error`).
+    """
+    logger.info(f"❓ Q&A stream request: doc_id={doc_id}, question={req.question}, k={req.k}, page_id={req.page_id}, model={req.model}")
+    doc = _get_doc(doc_id)
+    try:
+        context, used_contexts, total_pages = await asyncio.to_thread(_build_context, doc_id, doc, req)
+    except Exception as e:
+        logger.error(f"❌ Q&A stream failed: {str(e)}")
+        logger.exception(e)
+        raise HTTPException(status_code=500, detail=str(e))
+
+    async def events():
+        parts = []
+        try:
+            async for chunk in astream_answer_from_context(context, req.question, req.model):
+                parts.append(chunk)
+                yield sse_event({"delta": chunk})
+            answer = "".join(parts)
+            logger.info(f"✅ Answer streamed: {len(answer)} chars")
+            yield sse_event(
+                {"citations": _extract_citations(answer, total_pages), "used_contexts": used_contexts},
+                event="done",
+            )
+        except Exception as e:
+            logger.error(f"❌ Q&A stream failed: {str(e)}")
+            logger.exception(e)
+            yield sse_event({"detail": str(e)}, event="error")
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers=SSE_HEADERS)
@@ -1,6 +1,6 @@
 from fastapi import APIRouter, HTTPException
 from backend.services.doc_store import DocStore
-from backend.services.ai_adapter import generate_flashcards, generate_quiz, generate_cheatsheet
+from backend.services.ai_adapter import agenerate_flashcards, agenerate_quiz, agenerate_cheatsheet
 from backend.models.schemas import FlashcardsResp, QuizResp, CheatsheetResp
 import logging
 
@@ -18,13 +18,18 @@ async def flashcards(doc_id: str, page_id: int, model: str = None):
             raise HTTPException(status_code=404, detail="Document not found")
         
         page_contexts = doc["page_contexts"]
-        if page_id < 0 or page_id >= len(page_contexts):
+        state = doc_store.page_state(doc, page_id)
+        if state == "pending":
+            logger.info(f"⏳ Page {page_id} of {doc_id} is still being ingested")
+            raise HTTPException(status_code=202, detail={"page_id": page_id, "status": "pending"},
+                                headers={"Retry-After": "2"})
+        if state is None:
             logger.warning(f"⚠️ Invalid page_id: {page_id}")
             raise HTTPException(status_code=404, detail="Page not found")
         
         page_text = page_contexts[page_id].get('page_context', '')
         logger.debug(f"Generating flashcards for page {page_id}...")
-        items = generate_flashcards(page_text, model)
+        items = await agenerate_flashcards(page_text, model)
         logger.info(f"✅ Generated {len(items)} flashcards")
         return {"items": items}
     except HTTPException:
@@ -44,13 +49,18 @@ async def quiz(doc_id: str, page_id: int, model: str = None):
             raise HTTPException(status_code=404, detail="Document not found")
         
         page_contexts = doc["page_contexts"]
-        if page_id < 0 or page_id >= len(page_contexts):
+        state = doc_store.page_state(doc, page_id)
+        if state == "pending":
+            logger.info(f"⏳ Page {page_id} of {doc_id} is still being ingested")
+            raise HTTPException(status_code=202, detail={"page_id": page_id, "status": "pending"},
+                                headers={"Retry-After": "2"})
+        if state is None:
             logger.warning(f"⚠️ Invalid page_id: {page_id}")
             raise HTTPException(status_code=404, detail="Page not found")
         
         page_text = page_contexts[page_id].get('page_context', '')
         logger.debug(f"Generating quiz for page {page_id}...")
-        items = generate_quiz(page_text, model)
+        items = await agenerate_quiz(page_text, model)
         logger.info(f"✅ Generated {len(items)} quiz questions")
         return {"items": items}
     except HTTPException:
@@ -70,13 +80,18 @@ async def cheatsheet(doc_id: str, page_id: int, model: str = None):
             raise HTTPException(status_code=404, detail="Document not found")
         
         page_contexts = doc["page_contexts"]
-        if page_id < 0 or page_id >= len(page_contexts):
+        state = doc_store.page_state(doc, page_id)
+        if state == "pending":
+            logger.info(f"⏳ Page {page_id} of {doc_id} is still being ingested")
+            raise HTTPException(status_code=202, detail={"page_id": page_id, "status": "pending"},
+                                headers={"Retry-After": "2"})
+        if state is None:
             logger.warning(f"⚠️ Invalid page_id: {page_id}")
             raise HTTPException(status_code=404, detail="Page not found")
         
         page_text = page_contexts[page_id].get('page_context', '')
         logger.debug(f"Generating cheatsheet for page {page_id}...")
-        content = generate_cheatsheet(page_text, model)
+        content = await agenerate_cheatsheet(page_text, model)
         logger.info(f"✅ Cheatsheet generated: {len(content)} chars")
         return {"content": content}
     except HTTPException:
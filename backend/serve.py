@@ -0,0 +1,179 @@
+# Pre-fork server entry point for AI Tutor backend
+# Loads the read-only model weights (MiniLM, BLIP, EasyOCR) once in a master
+# process, then forks the uvicorn workers so they share those pages
+# copy-on-write instead of each loading a private copy. The master only
+# supervises: it restarts workers that die and stops them on SIGINT/SIGTERM.
+#
+#   python -m backend.serve --workers 4 --port 8001
+#
+#   SERVE_WORKERS  worker processes (default 2)
+#   SERVE_PRELOAD  models loaded before forking: embedder, caption, ocr, stt
+#                  (default "embedder,caption,ocr"; "none" to skip)
+#   SERVE_THREADS  inference threads per worker (default cpu_count // workers)
+#
+# Whisper is only shared when it runs on openai-whisper; faster-whisper
+# (CTranslate2) starts threads while loading, which a fork does not carry over,
+# so with it installed "stt" is skipped here and each worker loads its own.
+# POSIX only; on Windows run uvicorn directly.
+
+import argparse
+import gc
+import importlib.util
+import logging
+import os
+import signal
+import socket
+import sys
+import time
+
+logger = logging.getLogger("backend.serve")
+
+
+def _thread_env(threads: int):
+    """Cap native thread pools before torch/numpy are imported (inherited by workers)."""
+    for var in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS", "STT_THREADS"):
+        os.environ.setdefault(var, str(threads))
+    # HF tokenizers warn and disable themselves after a fork if they already ran threads
+    os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")
+
+
+def _preload(names):
+    """Load weights without running inference (OpenMP pools must not exist before fork)."""
+    for name in names:
+        t0 = time.perf_counter()
+        try:
+            if name == "embedder":
+                from ai_core import embeddings
+                embeddings.warmup(encode=False)
+            elif name == "caption":
+                from ai_core import caption
+                caption.warmup()
+            elif name == "ocr":
+                from ai_core import ocr
+                ocr.warmup()
+            elif name == "stt":
+                if importlib.util.find_spec("faster_whisper"):
+                    logger.warning("⚠️ Not preloading Whisper: faster-whisper cannot be shared across fork")
+                    continue
+                from ai_core import stt
+                stt.preload()
+            else:
+                logger.warning(f"⚠️ Unknown SERVE_PRELOAD entry: {name}")
+                continue
+            logger.info(f"✅ Preloaded {name} in {time.perf_counter() - t0:.1f}s")
+        except Exception as e:
+            logger.warning(f"⚠️ Preload of {name} failed, workers will load it on demand: {e}")
+
+
+def _bind(host: str, port: int) -> socket.socket:
+    sock = socket.socket(socket.AF_INET6 if ":" in host else socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+
+def _run_worker(app, sock: socket.socket, threads: int, log_level: str):
+    import uvicorn
+
+    # Fork-reset hooks in the services have already dropped the parent's
+    # connections and threads; pin this worker's share of the CPU
+    if "torch" in sys.modules:
+        try:
+            sys.modules["torch"].set_num_threads(threads)
+        except Exception as e:
+            logger.warning(f"⚠️ Could not set torch threads: {e}")
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    config = uvicorn.Config(app, log_level=log_level, lifespan="on")
+    uvicorn.Server(config).run(sockets=[sock])
+
+
+def _spawn(app, sock: socket.socket, threads: int, log_level: str) -> int:
+    pid = os.fork()
+    if pid == 0:
+        code = 0
+        try:
+            _run_worker(app, sock, threads, log_level)
+        except BaseException as e:
+            logger.error(f"❌ Worker {os.getpid()} crashed: {e}")
+            code = 1
+        finally:
+            os._exit(code)
+    logger.info(f"🚀 Started worker pid={pid}")
+    return pid
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pre-fork AI Tutor server (shared model weights)")
+    parser.add_argument("--host", default=os.getenv("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "8001")))
+    parser.add_argument("--workers", type=int, default=int(os.getenv("SERVE_WORKERS", "2")))
+    parser.add_argument("--threads", type=int, default=int(os.getenv("SERVE_THREADS", "0")),
+                        help="inference threads per worker (0 = cpu_count // workers)")
+    parser.add_argument("--preload", default=os.getenv("SERVE_PRELOAD", "embedder,caption,ocr"))
+    parser.add_argument("--log-level", default="info")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    if not hasattr(os, "fork"):
+        sys.exit("backend.serve needs os.fork(); on this platform run: uvicorn backend.main:app")
+
+    workers = max(1, args.workers)
+    threads = args.threads or max(1, (os.cpu_count() or 1) // workers)
+    _thread_env(threads)
+
+    from backend.main import app
+
+    names = [] if args.preload.strip().lower() in {"", "none"} else [
+        n.strip().lower() for n in args.preload.split(",") if n.strip()
+    ]
+    from ai_core import model_host
+    if model_host.enabled():
+        logger.info(f"   Models are served by the model host at {model_host.MODEL_HOST}; nothing to preload")
+    else:
+        _preload(names)
+    # Move everything loaded so far out of the GC's reach so collections in the
+    # workers do not write to (and un-share) those pages
+    gc.collect()
+    gc.freeze()
+
+    sock = _bind(args.host, args.port)
+    logger.info(f"🚀 Serving on {args.host}:{args.port} with {workers} workers x {threads} threads")
+
+    children = set()
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+    for _ in range(workers):
+        children.add(_spawn(app, sock, threads, args.log_level))
+
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        children.discard(pid)
+        if not stopping:
+            logger.warning(f"⚠️ Worker pid={pid} exited with status {status}; restarting")
+            time.sleep(1)
+            children.add(_spawn(app, sock, threads, args.log_level))
+    sock.close()
+    logger.info("🛑 All workers stopped")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,22 @@
 # AI Adapter Service - wraps ai_core module for backend
 # Provides clean interface for PDF ingestion, embeddings, LLM chains, TTS/STT
 
-from ai_core.ingest import load_pdf
-from ai_core.embeddings import build_index as build_chroma_index, query_index as query_chroma_index
+from ai_core.ingest import load_pdf, iter_pages
+from ai_core.embeddings import (
+    build_index as build_chroma_index,
+    query_index as query_chroma_index,
+    open_index as open_chroma_index,
+    drop_index as drop_chroma_index,
+    list_indexes as list_chroma_indexes,
+)
 from ai_core.chains import explain_page, answer_question, make_flashcards, make_quiz, make_cheatsheet
-from ai_core.tts import speak_local, speak_cloud
-from ai_core.stt import transcribe_local, transcribe_cloud
-from typing import List, Dict, Any, Optional
+from ai_core.chains import aexplain_page, aanswer_question, amake_flashcards, amake_quiz, amake_cheatsheet
+from ai_core.chains import astream_explain_page, astream_answer_question
+from ai_core.llm_client import LLMConfig
+from ai_core.tts import speak_local, speak_cloud, synthesize_cached, submit_segments, SegmentStream, TTS_CACHE_DIR
+from ai_core.stt import transcribe_local, transcribe_cloud, transcribe_samples, StreamingRecognizer
+from ai_core.audio import decode_audio, duration_seconds, pcm16_to_float, StreamDecoder
+from typing import AsyncIterator, Callable, Iterator, List, Dict, Any, Optional, Tuple
 import logging
 import os
 
@@ -17,23 +27,44 @@ USE_CLOUD_TTS = os.getenv("USE_CLOUD_TTS", "false").lower() == "true"
 USE_CLOUD_STT = os.getenv("USE_CLOUD_STT", "false").lower() == "true"
 INDEX_DIR = os.getenv("VECTOR_STORE_DIR", "./data/chroma")
 
-def ingest_pdf(pdf_path: str) -> List[Dict[str, Any]]:
-    """Ingest a PDF and return page contexts with text and images."""
+def ingest_pdf(pdf_path: str, progress: Optional[Callable[[str, int, int], None]] = None) -> List[Dict[str, Any]]:
+    """Ingest a PDF and return page contexts with text and images.
+
+    progress(stage, done, total) is called as pages finish each stage.
+    """
     try:
         logger.info(f"Ingesting PDF: {pdf_path}")
-        page_contexts = load_pdf(pdf_path)
-        logger.info(f"PDF ingested successfully: {len(page_contexts)} pages")
+        timings: Dict[str, float] = {}
+        page_contexts = load_pdf(pdf_path, timings=timings, progress=progress)
+        logger.info(
+            f"PDF ingested successfully: {len(page_contexts)} pages "
+            f"({', '.join(f'{k}={v:.2f}s' for k, v in timings.items())})"
+        )
         return page_contexts
     except Exception as e:
         logger.error(f"Error ingesting PDF: {e}")
         logger.exception(e)
         raise
 
-def build_index(page_contexts: List[Dict[str, Any]]) -> Any:
-    """Build vector index from page contexts."""
+def ingest_pdf_pages(pdf_path: str, first_page: int = 0,
+                     progress: Optional[Callable[[str, int, int], None]] = None) -> Iterator[Dict[str, Any]]:
+    """Ingest a PDF incrementally, yielding each page context as soon as it is ready."""
+    logger.info(f"Ingesting PDF incrementally: {pdf_path} (from page {first_page})")
+    timings: Dict[str, float] = {}
+    count = 0
+    for page in iter_pages(pdf_path, first_page=first_page, timings=timings, progress=progress):
+        count += 1
+        yield page
+    logger.info(
+        f"PDF ingested successfully: {count} pages "
+        f"({', '.join(f'{k}={v:.2f}s' for k, v in timings.items())})"
+    )
+
+def build_index(page_contexts: List[Dict[str, Any]], doc_id: Optional[str] = None) -> Any:
+    """Build vector index from page contexts into the document's own collection."""
     try:
-        logger.info(f"Building vector index for {len(page_contexts)} pages")
-        index = build_chroma_index(page_contexts, INDEX_DIR)
+        logger.info(f"Building vector index for {len(page_contexts)} pages (doc_id={doc_id})")
+        index = build_chroma_index(page_contexts, INDEX_DIR, doc_id=doc_id)
         logger.info("Vector index built successfully")
         return index
     except Exception as e:
@@ -41,6 +72,36 @@ def build_index(page_contexts: List[Dict[str, Any]]) -> Any:
         logger.exception(e)
         raise
 
+def open_index(doc_id: str) -> Any:
+    """Reopen the persisted vector index for a document, or None if it has none."""
+    try:
+        index = open_chroma_index(doc_id, INDEX_DIR)
+        logger.debug(f"Open index for doc_id={doc_id}: {'hit' if index is not None else 'miss'}")
+        return index
+    except Exception as e:
+        logger.warning(f"Error opening index for doc_id={doc_id}: {e}")
+        return None
+
+def get_or_build_index(doc_id: str, page_contexts: List[Dict[str, Any]]) -> Any:
+    """Reopen a document's persisted index, re-embedding its pages only if none exists."""
+    index = open_index(doc_id)
+    if index is None:
+        logger.info(f"No persisted index for doc_id={doc_id}; rebuilding")
+        index = build_index(page_contexts, doc_id)
+    return index
+
+def drop_index(doc_id: str) -> bool:
+    """Remove a document's vector index."""
+    try:
+        return drop_chroma_index(doc_id, INDEX_DIR)
+    except Exception as e:
+        logger.warning(f"Error dropping index for doc_id={doc_id}: {e}")
+        return False
+
+def list_indexes() -> List[str]:
+    """List doc_ids that have a persisted vector index."""
+    return list_chroma_indexes(INDEX_DIR)
+
 def query_index(index: Any, query: str, k: int = 3) -> List[Dict[str, Any]]:
     """Query the vector index and return top k results."""
     try:
@@ -53,33 +114,104 @@ def query_index(index: Any, query: str, k: int = 3) -> List[Dict[str, Any]]:
         logger.exception(e)
         raise
 
+def _llm_config(model: Optional[str]) -> LLMConfig:
+    """Build the per-request LLM config; a requested model picks Ollama or Gemini.
+
+    The config is passed down explicitly instead of mutating os.environ, so
+    concurrent requests (threads or coroutines) never see each other's model.
+    """
+    config = LLMConfig.from_env()
+    if not model:
+        return config
+    if ":" in model or model.lower() in {"llama3", "llama3.1", "llama3.2", "phi3", "phi3:mini"}:
+        return config.with_model("local", model)
+    return config.with_model("cloud", model)
+
+async def agenerate_explanation(page_text: str, model: Optional[str] = None) -> str:
+    """Generate detailed explanation for a page without blocking the event loop."""
+    try:
+        logger.debug(f"Generating explanation (async) for {len(page_text)} chars, model={model}")
+        config = _llm_config(model)
+        result = await aexplain_page(page_text, config=config)
+        logger.debug(f"Explanation generated: {len(result)} chars")
+        return result
+    except Exception as e:
+        logger.error(f"Error generating explanation: {e}")
+        logger.exception(e)
+        raise
+
+async def aanswer_question_from_context(context: str, question: str, model: Optional[str] = None) -> str:
+    """Answer a question based on context without blocking the event loop."""
+    try:
+        logger.debug(f"Answering question (async): '{question}' model={model}")
+        config = _llm_config(model)
+        result = await aanswer_question(question, [context], config=config)
+        logger.debug(f"Answer generated: {len(result)} chars")
+        return result
+    except Exception as e:
+        logger.error(f"Error answering question: {e}")
+        logger.exception(e)
+        raise
+
+async def astream_explanation(page_text: str, model: Optional[str] = None) -> AsyncIterator[str]:
+    """Stream an explanation for a page as text chunks."""
+    logger.debug(f"Streaming explanation for {len(page_text)} chars, model={model}")
+    config = _llm_config(model)
+    async for chunk in astream_explain_page(page_text, config=config):
+        yield chunk
+
+async def astream_answer_from_context(context: str, question: str, model: Optional[str] = None) -> AsyncIterator[str]:
+    """Stream an answer to a question as text chunks."""
+    logger.debug(f"Streaming answer: '{question}' model={model}")
+    config = _llm_config(model)
+    async for chunk in astream_answer_question(question, [context], config=config):
+        yield chunk
+
+async def agenerate_flashcards(page_text: str, model: Optional[str] = None) -> List[Dict]:
+    """Generate flashcards from page text without blocking the event loop."""
+    try:
+        logger.debug(f"Generating flashcards (async) for {len(page_text)} chars, model={model}")
+        config = _llm_config(model)
+        result = await amake_flashcards(page_text, config=config)
+        logger.debug(f"Generated {len(result)} flashcards")
+        return result
+    except Exception as e:
+        logger.error(f"Error generating flashcards: {e}")
+        logger.exception(e)
+        raise
+
+async def agenerate_quiz(page_text: str, model: Optional[str] = None) -> List[Dict]:
+    """Generate quiz questions from page text without blocking the event loop."""
+    try:
+        logger.debug(f"Generating quiz (async) for {len(page_text)} chars, model={model}")
+        config = _llm_config(model)
+        result = await amake_quiz(page_text, config=config)
+        logger.debug(f"Generated {len(result)} quiz questions")
+        return result
+    except Exception as e:
+        logger.error(f"Error generating quiz: {e}")
+        logger.exception(e)
+        raise
+
+async def agenerate_cheatsheet(page_text: str, model: Optional[str] = None) -> str:
+    """Generate cheatsheet from page text without blocking the event loop."""
+    try:
+        logger.debug(f"Generating cheatsheet (async) for {len(page_text)} chars, model={model}")
+        config = _llm_config(model)
+        result = await amake_cheatsheet(page_text, config=config)
+        logger.debug(f"Cheatsheet generated: {len(result)} chars")
+        return result
+    except Exception as e:
+        logger.error(f"Error generating cheatsheet: {e}")
+        logger.exception(e)
+        raise
+
 def generate_explanation(page_text: str, model: Optional[str] = None) -> str:
     """Generate detailed explanation for a page."""
     try:
         logger.debug(f"Generating explanation for {len(page_text)} chars, model={model}")
-        # Temporarily override model/app mode for this call if requested
-        prev = {
-            "APP_MODE": os.getenv("APP_MODE"),
-            "GEMINI_MODEL": os.getenv("GEMINI_MODEL"),
-            "OLLAMA_MODEL": os.getenv("OLLAMA_MODEL"),
-        }
-        try:
-            if model:
-                if ":" in model or model.lower() in {"llama3", "llama3.1", "llama3.2", "phi3", "phi3:mini"}:
-                    os.environ["APP_MODE"] = "local"
-                    os.environ["OLLAMA_MODEL"] = model
-                else:
-                    os.environ["APP_MODE"] = "cloud"
-                    os.environ["GEMINI_MODEL"] = model
-            result = explain_page(page_text)
-        finally:
-            # Restore env
-            for k, v in prev.items():
-                if v is None:
-                    if k in os.environ:
-                        del os.environ[k]
-                else:
-                    os.environ[k] = v
+        config = _llm_config(model)
+        result = explain_page(page_text, config=config)
         logger.debug(f"Explanation generated: {len(result)} chars")
         return result
     except Exception as e:
@@ -91,31 +223,10 @@ def answer_question_from_context(context: str, question: str, model: Optional[st
     """Answer a question based on context, with optional model override (Gemini or Ollama)."""
     try:
         logger.debug(f"Answering question: '{question}' model={model}")
-        # Temporarily override model/app mode for this call if requested
-        prev = {
-            "APP_MODE": os.getenv("APP_MODE"),
-            "GEMINI_MODEL": os.getenv("GEMINI_MODEL"),
-            "OLLAMA_MODEL": os.getenv("OLLAMA_MODEL"),
-        }
-        try:
-            if model:
-                if ":" in model or model.lower() in {"llama3", "llama3.1", "llama3.2", "phi3", "phi3:mini"}:
-                    os.environ["APP_MODE"] = "local"
-                    os.environ["OLLAMA_MODEL"] = model
-                else:
-                    os.environ["APP_MODE"] = "cloud"
-                    os.environ["GEMINI_MODEL"] = model
-
-            # answer_question from chains expects question first, then context list
-            result = answer_question(question, [context])
-        finally:
-            # Restore env
-            for k, v in prev.items():
-                if v is None:
-                    if k in os.environ:
-                        del os.environ[k]
-                else:
-                    os.environ[k] = v
+        config = _llm_config(model)
+
+        # answer_question from chains expects question first, then context list
+        result = answer_question(question, [context], config=config)
         logger.debug(f"Answer generated: {len(result)} chars")
         return result
     except Exception as e:
@@ -127,29 +238,8 @@ def generate_flashcards(page_text: str, model: Optional[str] = None) -> List[Dic
     """Generate flashcards from page text."""
     try:
         logger.debug(f"Generating flashcards for {len(page_text)} chars, model={model}")
-        # Temporarily override model/app mode for this call if requested
-        prev = {
-            "APP_MODE": os.getenv("APP_MODE"),
-            "GEMINI_MODEL": os.getenv("GEMINI_MODEL"),
-            "OLLAMA_MODEL": os.getenv("OLLAMA_MODEL"),
-        }
-        try:
-            if model:
-                if ":" in model or model.lower() in {"llama3", "llama3.1", "llama3.2", "phi3", "phi3:mini"}:
-                    os.environ["APP_MODE"] = "local"
-                    os.environ["OLLAMA_MODEL"] = model
-                else:
-                    os.environ["APP_MODE"] = "cloud"
-                    os.environ["GEMINI_MODEL"] = model
-            result = make_flashcards(page_text)
-        finally:
-            # Restore env
-            for k, v in prev.items():
-                if v is None:
-                    if k in os.environ:
-                        del os.environ[k]
-                else:
-                    os.environ[k] = v
+        config = _llm_config(model)
+        result = make_flashcards(page_text, config=config)
         logger.debug(f"Generated {len(result)} flashcards")
         return result
     except Exception as e:
@@ -161,29 +251,8 @@ def generate_quiz(page_text: str, model: Optional[str] = None) -> List[Dict]:
     """Generate quiz questions from page text."""
     try:
         logger.debug(f"Generating quiz for {len(page_text)} chars, model={model}")
-        # Temporarily override model/app mode for this call if requested
-        prev = {
-            "APP_MODE": os.getenv("APP_MODE"),
-            "GEMINI_MODEL": os.getenv("GEMINI_MODEL"),
-            "OLLAMA_MODEL": os.getenv("OLLAMA_MODEL"),
-        }
-        try:
-            if model:
-                if ":" in model or model.lower() in {"llama3", "llama3.1", "llama3.2", "phi3", "phi3:mini"}:
-                    os.environ["APP_MODE"] = "local"
-                    os.environ["OLLAMA_MODEL"] = model
-                else:
-                    os.environ["APP_MODE"] = "cloud"
-                    os.environ["GEMINI_MODEL"] = model
-            result = make_quiz(page_text)
-        finally:
-            # Restore env
-            for k, v in prev.items():
-                if v is None:
-                    if k in os.environ:
-                        del os.environ[k]
-                else:
-                    os.environ[k] = v
+        config = _llm_config(model)
+        result = make_quiz(page_text, config=config)
         logger.debug(f"Generated {len(result)} quiz questions")
         return result
     except Exception as e:
@@ -195,29 +264,8 @@ def generate_cheatsheet(page_text: str, model: Optional[str] = None) -> str:
     """Generate cheatsheet from page text."""
     try:
         logger.debug(f"Generating cheatsheet for {len(page_text)} chars, model={model}")
-        # Temporarily override model/app mode for this call if requested
-        prev = {
-            "APP_MODE": os.getenv("APP_MODE"),
-            "GEMINI_MODEL": os.getenv("GEMINI_MODEL"),
-            "OLLAMA_MODEL": os.getenv("OLLAMA_MODEL"),
-        }
-        try:
-            if model:
-                if ":" in model or model.lower() in {"llama3", "llama3.1", "llama3.2", "phi3", "phi3:mini"}:
-                    os.environ["APP_MODE"] = "local"
-                    os.environ["OLLAMA_MODEL"] = model
-                else:
-                    os.environ["APP_MODE"] = "cloud"
-                    os.environ["GEMINI_MODEL"] = model
-            result = make_cheatsheet(page_text)
-        finally:
-            # Restore env
-            for k, v in prev.items():
-                if v is None:
-                    if k in os.environ:
-                        del os.environ[k]
-                else:
-                    os.environ[k] = v
+        config = _llm_config(model)
+        result = make_cheatsheet(page_text, config=config)
         logger.debug(f"Cheatsheet generated: {len(result)} chars")
         return result
     except Exception as e:
@@ -240,6 +288,46 @@ def text_to_speech(text: str, output_path: str) -> str:
         logger.exception(e)
         raise
 
+def text_to_speech_cached(text: str) -> str:
+    """Return an audio file for text, reusing earlier synthesis of the same text.
+
+    Local TTS goes through the content-addressed cache in ai_core.tts.
+    """
+    try:
+        logger.debug(f"Converting text to speech (cached): {len(text)} chars")
+        if USE_CLOUD_TTS:
+            import uuid
+            out_dir = os.path.join(".", "audio")
+            os.makedirs(out_dir, exist_ok=True)
+            return speak_cloud(text, os.path.join(out_dir, f"{uuid.uuid4()}.mp3"))
+        result = synthesize_cached(text)
+        logger.debug(f"Audio ready: {result}")
+        return result
+    except Exception as e:
+        logger.error(f"Error in TTS: {e}")
+        logger.exception(e)
+        raise
+
+def text_to_speech_segments(text: str) -> SegmentStream:
+    """Sentence-by-sentence synthesis; iterate for (sentence, Future[path]) in order
+    and close() the stream when the listener goes away."""
+    try:
+        segments = submit_segments(text)
+        logger.debug(f"Streaming TTS for {len(segments)} sentences ({len(text)} chars)")
+        return segments
+    except Exception as e:
+        logger.error(f"Error in TTS: {e}")
+        logger.exception(e)
+        raise
+
+def tts_cache_file(name: str) -> Optional[str]:
+    """Resolve a cached TTS segment file name (as handed out by the stream) to a path."""
+    import re
+    if not re.fullmatch(r"[0-9a-f]{64}\.wav", name):
+        return None
+    path = os.path.join(TTS_CACHE_DIR, name)
+    return path if os.path.exists(path) else None
+
 def speech_to_text(audio_path: str) -> str:
     """Convert speech to text."""
     try:
@@ -264,3 +352,65 @@ def speech_to_text(audio_path: str) -> str:
         logger.error(f"Error in STT: {e}")
         logger.exception(e)
         raise
+
+def speech_to_text_bytes(data: bytes) -> Tuple[str, float]:
+    """Decode uploaded audio in memory and transcribe it.
+
+    Returns (text, duration_seconds); the duration comes from the sample count.
+    """
+    try:
+        samples = decode_audio(data)
+        duration = duration_seconds(samples)
+        logger.debug(f"Decoded audio: {len(data)} bytes -> {duration:.2f}s")
+        if USE_CLOUD_STT:
+            # The cloud stub is file based; keep that contract for it
+            import tempfile
+            with tempfile.NamedTemporaryFile(suffix=".audio", delete=False) as f:
+                f.write(data)
+            try:
+                result = transcribe_cloud(f.name)
+            finally:
+                os.remove(f.name)
+        else:
+            result = transcribe_samples(samples)
+        logger.debug(f"Transcribed: {len(result)} chars - Result: '{result}'")
+        return result, duration
+    except Exception as e:
+        logger.error(f"Error in STT: {e}")
+        logger.exception(e)
+        raise
+
+class SpeechStream:
+    """One live voice question: audio chunks in, running transcript out.
+
+    fmt "pcm16" takes raw 16 kHz mono s16le frames; any other value (e.g.
+    "webm") is decoded on the fly by a streaming ffmpeg process.
+    """
+
+    def __init__(self, fmt: str = "pcm16") -> None:
+        self.decoder = None if fmt == "pcm16" else StreamDecoder()
+        self.recognizer = StreamingRecognizer()
+        self._odd = b""
+        logger.debug(f"Speech stream opened: format={fmt}, engine={self.recognizer.engine}")
+
+    def feed(self, data: bytes) -> Optional[str]:
+        """Add a chunk; returns the updated partial transcript, if any."""
+        if self.decoder is not None:
+            self.decoder.feed(data)
+            samples = self.decoder.read()
+        else:
+            data = self._odd + data
+            cut = len(data) - (len(data) % 2)
+            self._odd = data[cut:]
+            samples = pcm16_to_float(data[:cut])
+        return self.recognizer.accept(samples)
+
+    def finish(self) -> str:
+        """Flush buffered audio and return the final transcript."""
+        if self.decoder is not None:
+            self.recognizer.accept(self.decoder.close())
+        return self.recognizer.finish()
+
+    def abort(self) -> None:
+        if self.decoder is not None:
+            self.decoder.kill()
@@ -1,95 +1,290 @@
 # Document store service for AI Tutor backend
-# Handles in-memory and disk-based document storage, retrieval, and deletion
+# Documents live in the shared registry (backend.services.registry, SQLite WAL
+# by default): one metadata record per document and one record per page, so a
+# page can be appended or rewritten without touching the rest. Metadata is read
+# on first use and page text is fetched on demand through a small LRU; nothing
+# is scanned at startup. Cached entries are dropped when another worker's write
+# shows up in the registry's change feed, together with their index handles.
+# Legacy data/docs/*.json files are imported once and renamed to *.json.migrated.
 
-from typing import Dict, Any, Optional
+from collections import OrderedDict
+from collections.abc import Sequence
+from typing import Dict, Any, Iterable, Optional
+import json
+import logging
+import os
 import threading
+import time
 from pathlib import Path
-import json
 
+from backend.services.registry import META_FIELDS, get_registry, origin
+
+logger = logging.getLogger("backend.doc_store")
 
 DOCS_DIR = Path("./data/docs")
-DOCS_DIR.mkdir(parents=True, exist_ok=True)
+# Decoded page records kept in memory across all documents
+DOCS_PAGE_CACHE = int(os.getenv("DOCS_PAGE_CACHE", "256"))
+# Seconds between change feed polls (other workers' writes become visible after this)
+DOCS_SYNC_INTERVAL = float(os.getenv("DOCS_SYNC_INTERVAL", "0.5"))
+
+
+class PageRecords(Sequence):
+    """Read-only, lazily loaded view of a document's page records.
+
+    Behaves like the list routers used to get: len(), indexing, slicing and
+    iteration all work, but records are read from the registry only when touched.
+    """
+
+    def __init__(self, store: "DocStore", pages_id: str):
+        self._store = store
+        self.pages_id = pages_id
+
+    def __len__(self) -> int:
+        return get_registry().page_total(self.pages_id)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        page = self._store.get_page(self.pages_id, i)
+        if page is None:
+            raise IndexError(f"page {i} out of range")
+        return page
+
+    def __iter__(self):
+        return get_registry().iter_pages(self.pages_id)
+
 
 class DocStore:
-    # Process-wide shared storage so multiple instances across modules share state
-    _store: Dict[str, Dict[str, Any]] = {}
+    # Process-wide caches so instances across routers share them
+    _meta: Dict[str, Dict[str, Any]] = {}
+    _pages: "OrderedDict[tuple, Dict[str, Any]]" = OrderedDict()
     _lock: threading.Lock = threading.Lock()
-    _loaded_from_disk: bool = False
+    _seq: Optional[int] = None
+    _synced_at: float = 0.0
+    _ready: bool = False
 
     def __init__(self):
-        # Load any persisted docs on first instantiation only
-        if not DocStore._loaded_from_disk:
-            self._load_from_disk()
-            DocStore._loaded_from_disk = True
+        if not DocStore._ready:
+            with DocStore._lock:
+                if not DocStore._ready:
+                    registry = get_registry()
+                    self._migrate_json()
+                    DocStore._seq = registry.latest()
+                    DocStore._ready = True
+
+    def _migrate_json(self):
+        """Import documents written by the old one-JSON-file-per-doc store."""
+        if not DOCS_DIR.is_dir():
+            return
+        moved = 0
+        for f in DOCS_DIR.glob("*.json"):
+            try:
+                obj = json.loads(f.read_text(encoding="utf-8"))
+                doc_id = obj.get('doc_id') or f.stem
+                pages = obj.get('page_contexts') or []
+                index_id = obj.get('index_id') or doc_id
+                get_registry().put_doc(doc_id, {
+                    'name': obj.get('name', 'Untitled'),
+                    'pdf_path': obj.get('pdf_path'),
+                    'content_hash': obj.get('content_hash'),
+                    'index_id': index_id,
+                    'page_count': obj.get('page_count') or len(pages),
+                    'status': obj.get('status') or 'ready',
+                }, pages if index_id == doc_id else None, origin())
+                f.rename(f.with_name(f.name + ".migrated"))
+                moved += 1
+            except Exception as e:
+                logger.warning(f"⚠️ Could not migrate {f.name}: {e}")
+        if moved:
+            logger.info(f"✅ Migrated {moved} document(s) from {DOCS_DIR} into the registry")
+
+    # ---- cache invalidation ----------------------------------------------
+
+    def _invalidate(self, doc_id: str):
+        with DocStore._lock:
+            # Dropping the metadata also drops its cached index handle
+            DocStore._meta.pop(doc_id, None)
+            for key in [k for k in DocStore._pages if k[0] == doc_id]:
+                del DocStore._pages[key]
+
+    def sync(self, force: bool = False):
+        """Apply other workers' writes from the change feed to the local caches."""
+        now = time.monotonic()
+        if not force and now - DocStore._synced_at < DOCS_SYNC_INTERVAL:
+            return
+        DocStore._synced_at = now
+        try:
+            seq, changes, gap = get_registry().changes(DocStore._seq or 0)
+        except Exception as e:
+            logger.warning(f"⚠️ Registry change feed unavailable: {e}")
+            return
+        DocStore._seq = max(seq, DocStore._seq or 0)
+        if gap:
+            # Fell behind the pruned history: some invalidations are lost, so
+            # drop every cached document (and its index handle) instead
+            logger.info("ℹ️ Doc change feed was pruned past this worker; clearing caches")
+            with DocStore._lock:
+                DocStore._meta.clear()
+                DocStore._pages.clear()
+            return
+        for doc_id in {d for d, source in changes if source != origin()}:
+            self._invalidate(doc_id)
+
+    # ---- public API ------------------------------------------------------
 
-    def save(self, doc_id: str, page_contexts: Any, index: Any, name: str, pdf_path: str = None):
+    def save(self, doc_id: str, page_contexts: Any, index: Any, name: str, pdf_path: str = None,
+             content_hash: str = None, index_id: str = None, page_count: int = None,
+             status: str = "ready"):
+        index_id = index_id or doc_id
+        meta = {
+            'name': name,
+            'pdf_path': pdf_path,
+            'content_hash': content_hash,
+            # doc_id whose vector collection and page records this document reads
+            # (itself unless an alias)
+            'index_id': index_id,
+            # While ingesting, only the first pages are stored yet (see page_state)
+            'page_count': page_count if page_count is not None else len(page_contexts or []),
+            'status': status,
+        }
+        # Aliases share the original's page records instead of copying them
+        pages = list(page_contexts or []) if index_id == doc_id else None
+        self._invalidate(doc_id)
+        get_registry().put_doc(doc_id, meta, pages, origin())
+        with DocStore._lock:
+            DocStore._meta[doc_id] = dict(meta, index=index, page_contexts=PageRecords(self, index_id))
+
+    def append_pages(self, doc_id: str, pages: Iterable[Dict[str, Any]]) -> int:
+        """Store records after the document's last page; returns the new page total."""
+        return get_registry().append_pages(doc_id, list(pages), origin())
+
+    def update_page(self, doc_id: str, page_idx: int, page: Dict[str, Any]):
+        """Rewrite a single page record."""
+        get_registry().put_page(doc_id, page_idx, page, origin())
         with DocStore._lock:
-            DocStore._store[doc_id] = {
-                'page_contexts': page_contexts,
-                'index': index,
-                'name': name,
-                'pdf_path': pdf_path
-            }
-            self._save_to_disk(doc_id)
+            DocStore._pages.pop((doc_id, page_idx), None)
+
+    def get_page(self, doc_id: str, page_idx: int) -> Optional[Dict[str, Any]]:
+        """One page record by index (doc_id is the document that owns the records)."""
+        key = (doc_id, page_idx)
+        with DocStore._lock:
+            page = DocStore._pages.get(key)
+            if page is not None:
+                DocStore._pages.move_to_end(key)
+                return page
+        page = get_registry().get_page(doc_id, page_idx)
+        if page is None:
+            return None
+        with DocStore._lock:
+            DocStore._pages[key] = page
+            while len(DocStore._pages) > DOCS_PAGE_CACHE:
+                DocStore._pages.popitem(last=False)
+        return page
+
+    def find_by_hash(self, content_hash: str) -> Optional[str]:
+        """Return the doc_id of a stored document with the same PDF content hash."""
+        if not content_hash:
+            return None
+        return get_registry().find_by_hash(content_hash)
 
     def get(self, doc_id: str) -> Optional[Any]:
+        """Metadata dict for a document; page_contexts is a lazy PageRecords view.
+
+        The same dict is returned until the document changes, so callers may
+        cache the open index handle on it (doc["index"] = ...).
+        """
+        self.sync()
         with DocStore._lock:
-            return DocStore._store.get(doc_id)
+            doc = DocStore._meta.get(doc_id)
+        if doc is not None:
+            return doc
+        meta = get_registry().get_doc(doc_id)
+        if meta is None:
+            return None
+        meta['index_id'] = meta.get('index_id') or doc_id
+        meta['status'] = meta.get('status') or 'ready'
+        with DocStore._lock:
+            doc = DocStore._meta.setdefault(
+                doc_id, dict(meta, index=None, page_contexts=PageRecords(self, meta['index_id']))
+            )
+        return doc
+
+    @staticmethod
+    def page_state(doc: Dict[str, Any], page_id: int) -> Optional[str]:
+        """'ready' if the page can be used, 'pending' if ingestion has not reached it yet,
+        None if the document has no such page."""
+        ready = len(doc.get('page_contexts') or [])
+        if 0 <= page_id < ready:
+            return 'ready'
+        if doc.get('status') == 'ingesting' and ready <= page_id < (doc.get('page_count') or 0):
+            return 'pending'
+        return None
 
     def delete(self, doc_id: str):
-        with DocStore._lock:
-            if doc_id in DocStore._store:
-                del DocStore._store[doc_id]
-            f = DOCS_DIR / f"{doc_id}.json"
-            if f.exists():
-                try:
-                    f.unlink()
-                except Exception:
-                    pass
+        data = self.get(doc_id) or {}
+        index_id = data.get('index_id') or doc_id
+        pdf_path = data.get('pdf_path')
+        registry = get_registry()
+        registry.delete_doc(doc_id, origin())
+        self._invalidate(doc_id)
+        # Aliases of the same upload share one collection and page records; keep them while any remain
+        index_in_use = registry.refs('index_id', index_id) > 0
+        pdf_in_use = pdf_path is not None and registry.refs('pdf_path', pdf_path) > 0
+        if not index_in_use:
+            registry.delete_pages(index_id, origin())
+            self._invalidate(index_id)
+        # Close the pooled PyMuPDF handle once no document points at the file
+        if pdf_path and not pdf_in_use:
+            try:
+                from ai_core.doc_pool import close_document
+                close_document(pdf_path)
+            except Exception:
+                pass
+        # Drop the document's vector collection as well
+        if not index_in_use:
+            try:
+                from backend.services.ai_adapter import drop_index
+                drop_index(index_id)
+            except Exception:
+                pass
 
     def list_ids(self):
-        with DocStore._lock:
-            return list(DocStore._store.keys())
+        return get_registry().list_ids()
 
     def update(self, doc_id: str, **kwargs):
-        """Update fields for a document and persist to disk."""
-        with DocStore._lock:
-            if doc_id not in DocStore._store:
-                return
-            DocStore._store[doc_id].update({k: v for k, v in kwargs.items() if v is not None})
-            self._save_to_disk(doc_id)
-
-    def _save_to_disk(self, doc_id: str):
-        data = DocStore._store.get(doc_id)
-        if not data:
+        """Update fields for a document and persist them.
+
+        Metadata fields are written in place; page_contexts, if given, replaces
+        the page records (prefer append_pages/update_page); index stays in memory.
+        """
+        kwargs = {k: v for k, v in kwargs.items() if v is not None}
+        doc = self.get(doc_id)
+        if doc is None:
             return
-        # Persist only what we can serialize easily
-        serializable = {
-            'doc_id': doc_id,
-            'name': data.get('name'),
-            'page_contexts': data.get('page_contexts'),
-            # Do not attempt to store the index (rebuild on demand)
-        }
-        try:
-            out_path = DOCS_DIR / f"{doc_id}.json"
-            out_path.write_text(json.dumps(serializable, ensure_ascii=False))
-        except Exception:
-            # Non-fatal
-            pass
+        registry = get_registry()
+        fields = {k: v for k, v in kwargs.items() if k in META_FIELDS}
+        if fields:
+            registry.update_doc(doc_id, fields, origin())
+        pages = kwargs.get('page_contexts')
+        if pages is not None and not isinstance(pages, PageRecords):
+            registry.delete_pages(doc_id, origin())
+            registry.append_pages(doc_id, list(pages), origin())
+            with DocStore._lock:
+                for key in [k for k in DocStore._pages if k[0] == doc_id]:
+                    del DocStore._pages[key]
+        with DocStore._lock:
+            doc.update(fields)
+            if 'index' in kwargs:
+                doc['index'] = kwargs['index']
 
-    def _load_from_disk(self):
-        try:
-            for f in DOCS_DIR.glob("*.json"):
-                try:
-                    obj = json.loads(f.read_text(encoding="utf-8"))
-                    doc_id = obj.get('doc_id') or f.stem
-                    DocStore._store[doc_id] = {
-                        'name': obj.get('name', 'Untitled'),
-                        'page_contexts': obj.get('page_contexts', []),
-                        'index': None,  # build lazily when needed
-                    }
-                except Exception:
-                    continue
-        except Exception:
-            # Non-fatal
-            pass
+
+def _reset_after_fork():
+    # Cached index handles belong to the parent's Chroma client
+    DocStore._meta.clear()
+    DocStore._pages.clear()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
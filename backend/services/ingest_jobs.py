@@ -0,0 +1,346 @@
+# Background ingestion jobs for AI Tutor backend
+# Uploads are queued here instead of being processed inside the HTTP request.
+# Job state lives in SQLite (WAL) so it survives restarts and is visible to every
+# worker process; a job left "running" by a dead worker is picked up again once
+# its heartbeat goes stale. Pages are published to DocStore and the vector index
+# window by window while the job runs, so early pages are usable right away.
+
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+logger = logging.getLogger("backend.ingest_jobs")
+
+INGEST_JOBS_DB = os.getenv("INGEST_JOBS_DB", "./data/ingest_jobs.sqlite3")
+INGEST_JOB_WORKERS = int(os.getenv("INGEST_JOB_WORKERS", "1"))
+# Seconds without a heartbeat before a running job is considered abandoned
+INGEST_JOB_STALE = float(os.getenv("INGEST_JOB_STALE", "120"))
+
+# Progress stages in order; overall percent is spread evenly across them
+STAGES = ["queued", "extract", "ocr", "caption", "merge", "index", "done"]
+
+_FIELDS = ["doc_id", "name", "pdf_path", "content_hash", "status", "stage", "done", "total",
+           "page_count", "ready", "error", "created_at", "updated_at"]
+
+
+class JobStore:
+    """SQLite table of ingestion jobs, one row per doc_id."""
+
+    def __init__(self, path: str = INGEST_JOBS_DB):
+        self.path = path
+        self._local = threading.local()
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "doc_id TEXT PRIMARY KEY, name TEXT, pdf_path TEXT, content_hash TEXT, "
+                "status TEXT NOT NULL, stage TEXT, done INTEGER DEFAULT 0, total INTEGER DEFAULT 0, "
+                "page_count INTEGER DEFAULT 0, error TEXT, owner TEXT, heartbeat REAL, "
+                "created_at REAL, updated_at REAL)"
+            )
+            # Pages published so far (column added after the first release of this table)
+            cols = [r[1] for r in conn.execute("PRAGMA table_info(jobs)").fetchall()]
+            if "ready" not in cols:
+                conn.execute("ALTER TABLE jobs ADD COLUMN ready INTEGER DEFAULT 0")
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def create(self, doc_id: str, name: str, pdf_path: str, content_hash: str, page_count: int):
+        now = time.time()
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO jobs (doc_id, name, pdf_path, content_hash, status, stage, "
+                "done, total, page_count, created_at, updated_at) VALUES (?, ?, ?, ?, 'queued', 'queued', 0, ?, ?, ?, ?)",
+                (doc_id, name, pdf_path, content_hash, page_count, page_count, now, now),
+            )
+
+    def get(self, doc_id: str) -> Optional[Dict[str, Any]]:
+        row = self._conn().execute(
+            f"SELECT {', '.join(_FIELDS)} FROM jobs WHERE doc_id = ?", (doc_id,)
+        ).fetchone()
+        return dict(zip(_FIELDS, row)) if row else None
+
+    def claim(self, doc_id: str, owner: str) -> bool:
+        """Atomically take a queued (or abandoned) job; False if another worker has it."""
+        now = time.time()
+        conn = self._conn()
+        with conn:
+            cur = conn.execute(
+                "UPDATE jobs SET status = 'running', owner = ?, heartbeat = ?, updated_at = ? "
+                "WHERE doc_id = ? AND (status = 'queued' OR (status = 'running' AND heartbeat < ?))",
+                (owner, now, now, doc_id, now - INGEST_JOB_STALE),
+            )
+        return cur.rowcount == 1
+
+    def progress(self, doc_id: str, stage: str, done: int, total: int):
+        now = time.time()
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                "UPDATE jobs SET stage = ?, done = ?, total = ?, heartbeat = ?, updated_at = ? WHERE doc_id = ?",
+                (stage, done, total, now, now, doc_id),
+            )
+
+    def pages_ready(self, doc_id: str, ready: int):
+        now = time.time()
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                "UPDATE jobs SET ready = ?, heartbeat = ?, updated_at = ? WHERE doc_id = ?",
+                (ready, now, now, doc_id),
+            )
+
+    def heartbeat(self, doc_id: str):
+        conn = self._conn()
+        with conn:
+            conn.execute("UPDATE jobs SET heartbeat = ? WHERE doc_id = ?", (time.time(), doc_id))
+
+    def find_active(self, content_hash: str) -> Optional[Dict[str, Any]]:
+        row = self._conn().execute(
+            "SELECT doc_id FROM jobs WHERE content_hash = ? AND status IN ('queued', 'running') "
+            "ORDER BY created_at LIMIT 1",
+            (content_hash,),
+        ).fetchone()
+        return self.get(row[0]) if row else None
+
+    def finish(self, doc_id: str, error: Optional[str] = None):
+        now = time.time()
+        status = "failed" if error else "done"
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                "UPDATE jobs SET status = ?, stage = ?, error = ?, owner = NULL, updated_at = ? WHERE doc_id = ?",
+                (status, status, error, now, doc_id),
+            )
+
+    def pending(self) -> List[str]:
+        """doc_ids of jobs that are queued or whose worker stopped heartbeating."""
+        rows = self._conn().execute(
+            "SELECT doc_id FROM jobs WHERE status = 'queued' OR (status = 'running' AND heartbeat < ?) "
+            "ORDER BY created_at",
+            (time.time() - INGEST_JOB_STALE,),
+        ).fetchall()
+        return [r[0] for r in rows]
+
+
+_jobs: Optional[JobStore] = None
+_jobs_lock = threading.Lock()
+_executor: Optional[ThreadPoolExecutor] = None
+# doc_ids waiting in or running on this process's executor
+_submitted: set = set()
+_owner = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+
+
+def get_job_store() -> JobStore:
+    global _jobs
+    if _jobs is None:
+        with _jobs_lock:
+            if _jobs is None:
+                _jobs = JobStore()
+    return _jobs
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        with _jobs_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=max(1, INGEST_JOB_WORKERS), thread_name_prefix="ingest-job"
+                )
+    return _executor
+
+
+def job_status(job: Dict[str, Any]) -> Dict[str, Any]:
+    """Public view of a job row, with an overall percentage."""
+    stage = job.get("stage") or job["status"]
+    ready = job.get("ready") or 0
+    if job["status"] == "done":
+        percent = 100.0
+    elif job.get("page_count"):
+        # Pages are published window by window; progress is the share already usable
+        percent = min(99.0, 100.0 * ready / job["page_count"])
+    else:
+        idx = STAGES.index(stage) if stage in STAGES else 0
+        frac = (job["done"] / job["total"]) if job.get("total") else 0.0
+        percent = min(99.0, 100.0 * (max(0, idx - 1) + frac) / (len(STAGES) - 1))
+    return {
+        "doc_id": job["doc_id"],
+        "name": job["name"],
+        "status": job["status"],
+        "stage": stage,
+        "done": job["done"],
+        "total": job["total"],
+        "page_count": job["page_count"],
+        "ready": ready,
+        "percent": round(percent, 1),
+        "error": job["error"],
+    }
+
+
+def _enqueue(doc_id: str) -> bool:
+    """Hand a job to the local executor unless it is already queued here."""
+    with _jobs_lock:
+        if doc_id in _submitted:
+            return False
+        _submitted.add(doc_id)
+
+    def run():
+        try:
+            _run_job(doc_id)
+        finally:
+            with _jobs_lock:
+                _submitted.discard(doc_id)
+
+    _get_executor().submit(run)
+    return True
+
+
+def _run_job(doc_id: str):
+    from ai_core.doc_pool import page_count as count_pages
+    from ai_core.ingest import INGEST_WINDOW
+    from backend.services.ai_adapter import ingest_pdf_pages, build_index
+    from backend.services.doc_store import DocStore
+    from backend.services.page_render import schedule_prerender
+
+    jobs = get_job_store()
+    if not jobs.claim(doc_id, _owner):
+        return
+    job = jobs.get(doc_id)
+    logger.info(f"⚙️ Ingest job started: doc_id={doc_id}, file={job['pdf_path']}")
+    # Keep the claim alive through long stages (model loads, big caption batches)
+    stop = threading.Event()
+
+    def beat():
+        while not stop.wait(INGEST_JOB_STALE / 4):
+            try:
+                jobs.heartbeat(doc_id)
+            except Exception:
+                pass
+
+    threading.Thread(target=beat, name=f"ingest-heartbeat-{doc_id[:8]}", daemon=True).start()
+    try:
+        store = DocStore()
+        # A restarted job keeps the pages an earlier run already published
+        prior = store.get(doc_id)
+        total = job["page_count"] or count_pages(job["pdf_path"])
+        index = None
+        if prior and prior.get("status") == "ingesting":
+            ready = len(prior["page_contexts"])
+            store.update(doc_id, page_count=total)
+        else:
+            ready = 0
+            store.save(doc_id, [], index, job["name"], job["pdf_path"],
+                       content_hash=job["content_hash"], page_count=total, status="ingesting")
+        window: List[Dict[str, Any]] = []
+
+        def publish():
+            nonlocal index, ready
+            # Index first so a page is searchable by the time readers see it
+            index = build_index(window, doc_id)
+            ready = store.append_pages(doc_id, window)
+            store.update(doc_id, index=index)
+            jobs.pages_ready(doc_id, ready)
+            window.clear()
+
+        for page in ingest_pdf_pages(
+            job["pdf_path"], first_page=ready,
+            progress=lambda stage, done, total: jobs.progress(doc_id, stage, done, total),
+        ):
+            window.append(page)
+            if len(window) >= INGEST_WINDOW:
+                publish()
+        if window:
+            publish()
+        store.update(doc_id, status="ready", page_count=ready)
+        jobs.finish(doc_id)
+        logger.info(f"✅ Ingest job done: doc_id={doc_id}, {ready} pages")
+        schedule_prerender(job["pdf_path"], job["content_hash"])
+    except Exception as e:
+        logger.error(f"❌ Ingest job failed: doc_id={doc_id}: {e}")
+        logger.exception(e)
+        jobs.finish(doc_id, error=str(e))
+        try:
+            # Keep what was published usable; the remaining pages will not arrive
+            DocStore().update(doc_id, status="failed")
+        except Exception:
+            pass
+    finally:
+        stop.set()
+
+
+def submit(name: str, pdf_path: str, content_hash: str, page_count: int, doc_id: Optional[str] = None) -> str:
+    """Queue ingestion of a saved PDF and return its doc_id."""
+    doc_id = doc_id or str(uuid.uuid4())
+    get_job_store().create(doc_id, name, pdf_path, content_hash, page_count)
+    _enqueue(doc_id)
+    return doc_id
+
+
+def find_active(content_hash: str) -> Optional[Dict[str, Any]]:
+    """A queued/running job for the same PDF bytes, so re-uploads join it."""
+    return get_job_store().find_active(content_hash)
+
+
+def resume_pending() -> int:
+    """Re-queue jobs interrupted by a restart; returns how many were submitted.
+
+    Jobs already waiting on this process's executor are not queued again.
+    """
+    ids = [doc_id for doc_id in get_job_store().pending() if _enqueue(doc_id)]
+    if ids:
+        logger.info(f"🔁 Resuming {len(ids)} ingest job(s)")
+    return len(ids)
+
+
+_sweeper: Optional[threading.Thread] = None
+
+
+def start():
+    """Resume interrupted jobs now, then keep adopting abandoned ones in the background.
+
+    Called at startup; jobs a crashed worker was running become claimable once
+    their heartbeat is INGEST_JOB_STALE seconds old.
+    """
+    global _sweeper
+    resume_pending()
+    if _sweeper is None:
+        def sweep():
+            while True:
+                time.sleep(INGEST_JOB_STALE)
+                try:
+                    resume_pending()
+                except Exception as e:
+                    logger.warning(f"⚠️ Ingest job sweep failed: {e}")
+
+        _sweeper = threading.Thread(target=sweep, name="ingest-job-sweeper", daemon=True)
+        _sweeper.start()
+
+
+def _reset_after_fork():
+    # Threads and SQLite connections do not survive fork; each worker starts its own
+    global _jobs, _executor, _sweeper, _owner
+    _jobs = None
+    _executor = None
+    _sweeper = None
+    _submitted.clear()
+    _owner = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
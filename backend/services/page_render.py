@@ -0,0 +1,246 @@
+# Page image rendering service for AI Tutor backend
+# Renders PDF pages with PyMuPDF behind a two-tier cache: an in-memory LRU of
+# encoded images in front of an on-disk LRU, keyed by (document content, page,
+# scale, format). Uploads pre-render their pages in the background. Documents
+# are borrowed from the ai_core.doc_pool handle pool rather than reopened.
+
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Optional, Tuple
+import hashlib
+import io
+import logging
+import os
+import threading
+
+from ai_core.doc_pool import document, page_count
+
+logger = logging.getLogger("backend.page_render")
+
+RENDER_CACHE_DIR = Path(os.getenv("RENDER_CACHE_DIR", "./data/renders"))
+RENDER_CACHE_MAX_BYTES = int(os.getenv("RENDER_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+RENDER_MEMORY_MAX_BYTES = int(os.getenv("RENDER_MEMORY_MAX_BYTES", str(64 * 1024 * 1024)))
+RENDER_JPEG_QUALITY = int(os.getenv("RENDER_JPEG_QUALITY", "85"))
+RENDER_THUMB_WIDTH = int(os.getenv("RENDER_THUMB_WIDTH", "240"))
+# Widest image a request may ask for with ?width= (pixels)
+RENDER_MAX_WIDTH = int(os.getenv("RENDER_MAX_WIDTH", "4096"))
+# Variants rendered after upload: "<format>@<zoom>" for full pages, "<format>@thumb" for thumbnails
+RENDER_PRERENDER = os.getenv("RENDER_PRERENDER", "png@2,webp@thumb")
+
+DEFAULT_ZOOM = 2.0
+MEDIA_TYPES = {"png": "image/png", "jpeg": "image/jpeg", "webp": "image/webp"}
+
+
+class _MemoryTier:
+    """Byte-bounded LRU of encoded images."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._data: "OrderedDict[str, bytes]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            data = self._data.get(key)
+            if data is not None:
+                self._data.move_to_end(key)
+            return data
+
+    def put(self, key: str, data: bytes):
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self._bytes -= len(old)
+            self._data[key] = data
+            self._bytes += len(data)
+            while self._bytes > self.max_bytes:
+                _, evicted = self._data.popitem(last=False)
+                self._bytes -= len(evicted)
+
+
+_memory = _MemoryTier(RENDER_MEMORY_MAX_BYTES)
+_prerender_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="prerender")
+_disk_writes = 0
+_disk_lock = threading.Lock()
+
+
+def normalize_format(fmt: Optional[str]) -> str:
+    fmt = (fmt or "png").lower()
+    if fmt == "jpg":
+        fmt = "jpeg"
+    if fmt not in MEDIA_TYPES:
+        raise ValueError(f"Unsupported image format: {fmt}")
+    return fmt
+
+
+def render_key(doc_key: str, page_id: int, zoom: float, width: Optional[int], fmt: str) -> str:
+    """Cache key (also the ETag) for one rendered variant of a page."""
+    scale = f"w{int(width)}" if width else f"z{float(zoom):g}"
+    quality = RENDER_JPEG_QUALITY if fmt != "png" else 0
+    raw = f"{doc_key}:{page_id}:{scale}:{fmt}:{quality}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:32]
+
+
+def _disk_path(key: str, fmt: str) -> Path:
+    return RENDER_CACHE_DIR / f"{key}.{fmt}"
+
+
+def _read_disk(key: str, fmt: str) -> Optional[bytes]:
+    path = _disk_path(key, fmt)
+    try:
+        data = path.read_bytes()
+    except OSError:
+        return None
+    try:
+        os.utime(path)  # recently viewed, keep it longest
+    except OSError:
+        pass
+    return data
+
+
+def _write_disk(key: str, fmt: str, data: bytes):
+    global _disk_writes
+    try:
+        RENDER_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        path = _disk_path(key, fmt)
+        tmp = path.with_name(f".{path.name}.{threading.get_ident()}.tmp")
+        tmp.write_bytes(data)
+        os.replace(tmp, path)
+    except OSError as e:
+        logger.warning(f"⚠️ Render cache write failed: {e}")
+        return
+    with _disk_lock:
+        _disk_writes += 1
+        trim = _disk_writes % 50 == 0
+    if trim:
+        _trim_disk()
+
+
+def _trim_disk():
+    """Evict least recently viewed renders until the directory fits RENDER_CACHE_MAX_BYTES."""
+    try:
+        entries = []
+        total = 0
+        for p in RENDER_CACHE_DIR.iterdir():
+            if p.name.startswith("."):
+                continue
+            st = p.stat()
+            entries.append((st.st_mtime, st.st_size, p))
+            total += st.st_size
+        entries.sort()
+        for _, size, p in entries:
+            if total <= RENDER_CACHE_MAX_BYTES:
+                break
+            try:
+                p.unlink()
+                total -= size
+            except OSError:
+                pass
+    except Exception as e:
+        logger.warning(f"⚠️ Render cache trim failed: {e}")
+
+
+def _encode(pix, fmt: str) -> bytes:
+    if fmt == "png":
+        return pix.tobytes("png")
+    from PIL import Image  # PyMuPDF has no WebP encoder
+
+    mode = "RGBA" if pix.alpha else "RGB"
+    img = Image.frombytes(mode, (pix.width, pix.height), pix.samples)
+    if mode == "RGBA" and fmt == "jpeg":
+        img = img.convert("RGB")
+    buf = io.BytesIO()
+    img.save(buf, format=fmt.upper(), quality=RENDER_JPEG_QUALITY)
+    return buf.getvalue()
+
+
+def _render(page, zoom: float, width: Optional[int], fmt: str) -> bytes:
+    import fitz  # PyMuPDF
+
+    if width:
+        zoom = float(width) / max(1.0, page.rect.width)
+    pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), alpha=False)
+    return _encode(pix, fmt)
+
+
+def get_page_image(pdf_path: str, doc_key: str, page_id: int, zoom: float = DEFAULT_ZOOM,
+                   width: Optional[int] = None, fmt: str = "png") -> Tuple[bytes, str]:
+    """Return (image bytes, etag) for a page, rendering only on a cache miss.
+
+    doc_key identifies the PDF bytes (content hash, or doc_id for legacy docs).
+    Raises IndexError for a page outside the document.
+    """
+    fmt = normalize_format(fmt)
+    key = render_key(doc_key, page_id, zoom, width, fmt)
+    data = _memory.get(key)
+    if data is None:
+        data = _read_disk(key, fmt)
+        if data is not None:
+            _memory.put(key, data)
+    if data is not None:
+        return data, key
+
+    with document(pdf_path) as pdf_doc:
+        if page_id < 0 or page_id >= len(pdf_doc):
+            raise IndexError(f"page {page_id} out of range ({len(pdf_doc)} pages)")
+        data = _render(pdf_doc[page_id], zoom, width, fmt)
+    _memory.put(key, data)
+    _write_disk(key, fmt, data)
+    return data, key
+
+
+def _prerender_variants():
+    out = []
+    for spec in RENDER_PRERENDER.split(","):
+        spec = spec.strip()
+        if not spec:
+            continue
+        fmt, _, scale = spec.partition("@")
+        try:
+            fmt = normalize_format(fmt)
+            if scale == "thumb":
+                out.append((fmt, DEFAULT_ZOOM, RENDER_THUMB_WIDTH))
+            else:
+                out.append((fmt, float(scale or DEFAULT_ZOOM), None))
+        except ValueError:
+            logger.warning(f"⚠️ Ignoring RENDER_PRERENDER entry: {spec}")
+    return out
+
+
+def _prerender(pdf_path: str, doc_key: str):
+    variants = _prerender_variants()
+    rendered = 0
+    try:
+        for page_id in range(page_count(pdf_path)):
+            # Borrow the pooled handle per page so live views are not held up
+            with document(pdf_path) as pdf_doc:
+                page = pdf_doc[page_id]
+                for fmt, zoom, width in variants:
+                    key = render_key(doc_key, page_id, zoom, width, fmt)
+                    if _disk_path(key, fmt).exists():
+                        continue
+                    _write_disk(key, fmt, _render(page, zoom, width, fmt))
+                    rendered += 1
+        logger.info(f"✅ Pre-rendered {rendered} page images for {doc_key[:12]}")
+    except Exception as e:
+        logger.warning(f"⚠️ Pre-render failed for {pdf_path}: {e}")
+
+
+def schedule_prerender(pdf_path: str, doc_key: str):
+    """Render the RENDER_PRERENDER variants of every page in the background."""
+    if not RENDER_PRERENDER.strip():
+        return None
+    return _prerender_pool.submit(_prerender, pdf_path, doc_key)
+
+
+def _reset_after_fork():
+    global _prerender_pool
+    _prerender_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="prerender")
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
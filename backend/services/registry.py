@@ -0,0 +1,309 @@
+# Document registry backends for AI Tutor backend
+# The registry is the storage behind DocStore that every worker process (and
+# host) reads, so an upload handled by one worker is visible to all of them.
+# Every write also appends to a change feed; DocStore polls it to drop cached
+# metadata and index handles that another worker made stale.
+#
+# DOCS_REGISTRY selects the backend: "sqlite" (default, WAL-mode file shared by
+# the workers on one host) or "package.module:ClassName" for any class that
+# implements RegistryBackend, e.g. one backed by a networked KV store.
+
+from abc import ABC, abstractmethod
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+import importlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from pathlib import Path
+
+logger = logging.getLogger("backend.registry")
+
+DOCS_REGISTRY = os.getenv("DOCS_REGISTRY", "sqlite")
+DOCS_DB = os.getenv("DOCS_DB", "./data/docs.sqlite3")
+# Seconds of change history kept for workers that poll late
+DOCS_CHANGES_KEEP = float(os.getenv("DOCS_CHANGES_KEEP", "3600"))
+# Writes between prunes of change history older than DOCS_CHANGES_KEEP
+_PRUNE_EVERY = 200
+
+META_FIELDS = ['name', 'pdf_path', 'content_hash', 'index_id', 'page_count', 'status']
+
+
+class RegistryBackend(ABC):
+    """Interface of a document registry.
+
+    Documents are a metadata dict (META_FIELDS) plus an ordered list of page
+    records. Writes take an origin token so a process can skip its own
+    entries when reading the change feed.
+    """
+
+    @abstractmethod
+    def get_doc(self, doc_id: str) -> Optional[Dict[str, Any]]:
+        ...
+
+    @abstractmethod
+    def put_doc(self, doc_id: str, meta: Dict[str, Any], pages: Optional[List[Dict[str, Any]]], origin: str):
+        """Insert or replace metadata; replace the page records too when pages is not None."""
+
+    @abstractmethod
+    def update_doc(self, doc_id: str, fields: Dict[str, Any], origin: str):
+        ...
+
+    @abstractmethod
+    def delete_doc(self, doc_id: str, origin: str):
+        ...
+
+    @abstractmethod
+    def list_ids(self) -> List[str]:
+        ...
+
+    @abstractmethod
+    def find_by_hash(self, content_hash: str) -> Optional[str]:
+        """doc_id of a ready, non-alias document with this content hash."""
+
+    @abstractmethod
+    def refs(self, field: str, value: Any) -> int:
+        """Number of documents whose field ('index_id' or 'pdf_path') equals value."""
+
+    @abstractmethod
+    def page_total(self, doc_id: str) -> int:
+        ...
+
+    @abstractmethod
+    def get_page(self, doc_id: str, page_idx: int) -> Optional[Dict[str, Any]]:
+        ...
+
+    @abstractmethod
+    def iter_pages(self, doc_id: str) -> Iterator[Dict[str, Any]]:
+        ...
+
+    @abstractmethod
+    def append_pages(self, doc_id: str, pages: Iterable[Dict[str, Any]], origin: str) -> int:
+        """Store records after the last page; returns the new page total."""
+
+    @abstractmethod
+    def put_page(self, doc_id: str, page_idx: int, page: Dict[str, Any], origin: str):
+        ...
+
+    @abstractmethod
+    def delete_pages(self, doc_id: str, origin: str):
+        ...
+
+    @abstractmethod
+    def changes(self, since: int) -> Tuple[int, List[Tuple[str, str]], bool]:
+        """(latest sequence number, [(doc_id, origin), ...] written after since, gap).
+
+        gap is True when entries after since were already pruned, so the list
+        is incomplete and the caller must drop everything it has cached.
+        """
+
+    @abstractmethod
+    def latest(self) -> int:
+        """Current sequence number of the change feed."""
+
+
+class SQLiteRegistry(RegistryBackend):
+    """Registry in one SQLite file (WAL), shared by all workers on a host."""
+
+    def __init__(self, path: str = DOCS_DB):
+        self.path = path
+        self._local = threading.local()
+        self._writes = 0
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS docs ("
+                "doc_id TEXT PRIMARY KEY, name TEXT, pdf_path TEXT, content_hash TEXT, "
+                "index_id TEXT, page_count INTEGER DEFAULT 0, status TEXT DEFAULT 'ready', "
+                "created_at REAL, updated_at REAL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS docs_hash ON docs (content_hash)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS pages ("
+                "doc_id TEXT NOT NULL, page_idx INTEGER NOT NULL, record TEXT NOT NULL, "
+                "PRIMARY KEY (doc_id, page_idx)) WITHOUT ROWID"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS changes ("
+                "seq INTEGER PRIMARY KEY AUTOINCREMENT, doc_id TEXT NOT NULL, origin TEXT, ts REAL)"
+            )
+            conn.execute("DELETE FROM changes WHERE ts < ?", (time.time() - DOCS_CHANGES_KEEP,))
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _changed(self, conn: sqlite3.Connection, doc_id: str, origin: str):
+        now = time.time()
+        conn.execute("INSERT INTO changes (doc_id, origin, ts) VALUES (?, ?, ?)", (doc_id, origin, now))
+        # Keep the feed bounded for long-running servers (a racy counter is fine)
+        self._writes += 1
+        if self._writes % _PRUNE_EVERY == 0:
+            conn.execute("DELETE FROM changes WHERE ts < ?", (now - DOCS_CHANGES_KEEP,))
+
+    @staticmethod
+    def _insert_pages(conn: sqlite3.Connection, doc_id: str, pages: Iterable[Dict[str, Any]], start: int = 0):
+        conn.executemany(
+            "INSERT OR REPLACE INTO pages (doc_id, page_idx, record) VALUES (?, ?, ?)",
+            [(doc_id, start + i, json.dumps(p, ensure_ascii=False)) for i, p in enumerate(pages)],
+        )
+
+    def get_doc(self, doc_id: str) -> Optional[Dict[str, Any]]:
+        row = self._conn().execute(
+            f"SELECT {', '.join(META_FIELDS)} FROM docs WHERE doc_id = ?", (doc_id,)
+        ).fetchone()
+        return dict(zip(META_FIELDS, row)) if row else None
+
+    def put_doc(self, doc_id: str, meta: Dict[str, Any], pages: Optional[List[Dict[str, Any]]], origin: str):
+        now = time.time()
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                "INSERT INTO docs (doc_id, name, pdf_path, content_hash, index_id, page_count, status, "
+                "created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(doc_id) DO UPDATE SET name = excluded.name, pdf_path = excluded.pdf_path, "
+                "content_hash = excluded.content_hash, index_id = excluded.index_id, "
+                "page_count = excluded.page_count, status = excluded.status, updated_at = excluded.updated_at",
+                (doc_id, *[meta.get(k) for k in META_FIELDS], now, now),
+            )
+            if pages is not None:
+                conn.execute("DELETE FROM pages WHERE doc_id = ?", (doc_id,))
+                self._insert_pages(conn, doc_id, pages)
+            self._changed(conn, doc_id, origin)
+
+    def update_doc(self, doc_id: str, fields: Dict[str, Any], origin: str):
+        fields = {k: v for k, v in fields.items() if k in META_FIELDS}
+        if not fields:
+            return
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                f"UPDATE docs SET {', '.join(f'{k} = ?' for k in fields)}, updated_at = ? WHERE doc_id = ?",
+                (*fields.values(), time.time(), doc_id),
+            )
+            self._changed(conn, doc_id, origin)
+
+    def delete_doc(self, doc_id: str, origin: str):
+        conn = self._conn()
+        with conn:
+            conn.execute("DELETE FROM docs WHERE doc_id = ?", (doc_id,))
+            self._changed(conn, doc_id, origin)
+
+    def list_ids(self) -> List[str]:
+        return [r[0] for r in self._conn().execute("SELECT doc_id FROM docs ORDER BY created_at").fetchall()]
+
+    def find_by_hash(self, content_hash: str) -> Optional[str]:
+        row = self._conn().execute(
+            "SELECT doc_id FROM docs WHERE content_hash = ? AND (index_id IS NULL OR index_id = doc_id) "
+            "AND COALESCE(status, 'ready') = 'ready' ORDER BY created_at LIMIT 1",
+            (content_hash,),
+        ).fetchone()
+        return row[0] if row else None
+
+    def refs(self, field: str, value: Any) -> int:
+        column = {"index_id": "COALESCE(index_id, doc_id)", "pdf_path": "pdf_path"}[field]
+        return self._conn().execute(f"SELECT COUNT(*) FROM docs WHERE {column} = ?", (value,)).fetchone()[0]
+
+    def page_total(self, doc_id: str) -> int:
+        return self._conn().execute("SELECT COUNT(*) FROM pages WHERE doc_id = ?", (doc_id,)).fetchone()[0]
+
+    def get_page(self, doc_id: str, page_idx: int) -> Optional[Dict[str, Any]]:
+        row = self._conn().execute(
+            "SELECT record FROM pages WHERE doc_id = ? AND page_idx = ?", (doc_id, page_idx)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def iter_pages(self, doc_id: str) -> Iterator[Dict[str, Any]]:
+        rows = self._conn().execute(
+            "SELECT record FROM pages WHERE doc_id = ? ORDER BY page_idx", (doc_id,)
+        ).fetchall()
+        for (record,) in rows:
+            yield json.loads(record)
+
+    def append_pages(self, doc_id: str, pages: Iterable[Dict[str, Any]], origin: str) -> int:
+        conn = self._conn()
+        with conn:
+            start = conn.execute(
+                "SELECT COALESCE(MAX(page_idx) + 1, 0) FROM pages WHERE doc_id = ?", (doc_id,)
+            ).fetchone()[0]
+            self._insert_pages(conn, doc_id, pages, start)
+            conn.execute("UPDATE docs SET updated_at = ? WHERE doc_id = ?", (time.time(), doc_id))
+            self._changed(conn, doc_id, origin)
+        return self.page_total(doc_id)
+
+    def put_page(self, doc_id: str, page_idx: int, page: Dict[str, Any], origin: str):
+        conn = self._conn()
+        with conn:
+            self._insert_pages(conn, doc_id, [page], page_idx)
+            self._changed(conn, doc_id, origin)
+
+    def delete_pages(self, doc_id: str, origin: str):
+        conn = self._conn()
+        with conn:
+            conn.execute("DELETE FROM pages WHERE doc_id = ?", (doc_id,))
+            self._changed(conn, doc_id, origin)
+
+    def changes(self, since: int) -> Tuple[int, List[Tuple[str, str]], bool]:
+        conn = self._conn()
+        rows = conn.execute(
+            "SELECT seq, doc_id, origin FROM changes WHERE seq > ? ORDER BY seq", (since,)
+        ).fetchall()
+        # Sequence numbers are consecutive, so a hole right after since means
+        # a prune removed entries this reader never saw
+        if rows:
+            return rows[-1][0], [(doc_id, origin) for _, doc_id, origin in rows], rows[0][0] > since + 1
+        latest = self.latest()
+        return max(latest, since), [], latest > since
+
+    def latest(self) -> int:
+        # sqlite_sequence keeps the last seq even after every row was pruned
+        row = self._conn().execute("SELECT seq FROM sqlite_sequence WHERE name = 'changes'").fetchone()
+        return row[0] if row else 0
+
+
+_registry: Optional[RegistryBackend] = None
+_registry_lock = threading.Lock()
+# Identifies this process's writes in the change feed
+_origin = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+
+
+def origin() -> str:
+    return _origin
+
+
+def _create_registry() -> RegistryBackend:
+    if DOCS_REGISTRY == "sqlite":
+        return SQLiteRegistry()
+    module_name, _, class_name = DOCS_REGISTRY.partition(":")
+    cls = getattr(importlib.import_module(module_name), class_name)
+    logger.info(f"✅ Using document registry {DOCS_REGISTRY}")
+    return cls()
+
+
+def get_registry() -> RegistryBackend:
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = _create_registry()
+    return _registry
+
+
+def _reset_after_fork():
+    # Forked workers need their own SQLite connections and change feed identity
+    global _registry, _origin
+    _registry = None
+    _origin = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
@@ -0,0 +1,129 @@
+# Model warmup service for AI Tutor backend
+# Imports stay lazy so the server binds quickly; the models listed in
+# WARMUP_MODELS are then loaded on a background thread, and /ready reports
+# which of them are warm. Models that are not listed still load on first use.
+#   WARMUP_MODELS  comma list of embedder, chroma, caption, ocr, stt
+#                  ("all" or "none"; default "embedder,chroma", plus stt if STT_PRELOAD)
+#   WARMUP_DELAY   seconds to wait after startup before loading (default 1)
+
+from typing import Dict, List, Optional, Tuple
+import importlib
+import logging
+import os
+import sys
+import threading
+import time
+
+logger = logging.getLogger("backend.warmup")
+
+WARMUP_DELAY = float(os.getenv("WARMUP_DELAY", "1"))
+INDEX_DIR = os.getenv("VECTOR_STORE_DIR", "./data/chroma")
+
+
+# name -> (module, load function, is-loaded function, args); imported only when used
+MODELS: Dict[str, Tuple[str, str, str, tuple]] = {
+    "embedder": ("ai_core.embeddings", "warmup", "is_loaded", ()),
+    "chroma": ("ai_core.embeddings", "warmup_store", "store_loaded", (INDEX_DIR,)),
+    "caption": ("ai_core.caption", "warmup", "is_loaded", ()),
+    "ocr": ("ai_core.ocr", "warmup", "is_loaded", ()),
+    "stt": ("ai_core.stt", "preload", "is_loaded", ()),
+}
+
+
+_state: Dict[str, Dict[str, object]] = {}
+_state_lock = threading.Lock()
+_thread: Optional[threading.Thread] = None
+
+
+def configured_models() -> List[str]:
+    raw = os.getenv("WARMUP_MODELS")
+    if raw is None:
+        names = ["embedder", "chroma"]
+        if os.getenv("STT_PRELOAD", "false").lower() in {"1", "true", "yes"}:
+            names.append("stt")
+        return names
+    raw = raw.strip().lower()
+    if raw in {"", "none"}:
+        return []
+    if raw == "all":
+        return list(MODELS)
+    names = [n.strip() for n in raw.split(",") if n.strip()]
+    for n in names:
+        if n not in MODELS:
+            logger.warning(f"⚠️ Unknown WARMUP_MODELS entry: {n}")
+    return [n for n in names if n in MODELS]
+
+
+def _set(name: str, **fields):
+    with _state_lock:
+        _state.setdefault(name, {}).update(fields)
+
+
+def warm(names: Optional[List[str]] = None):
+    """Load the given (default: configured) models in order, recording their state."""
+    names = configured_models() if names is None else names
+    for name in names:
+        _set(name, state="loading")
+        t0 = time.perf_counter()
+        try:
+            module, load, loaded, args = MODELS[name]
+            mod = importlib.import_module(module)
+            getattr(mod, load)(*args)
+            if not getattr(mod, loaded)(*args):
+                raise RuntimeError("loader returned without a model")
+            seconds = round(time.perf_counter() - t0, 2)
+            _set(name, state="warm", seconds=seconds)
+            logger.info(f"🔥 Warmed {name} in {seconds}s")
+        except Exception as e:
+            _set(name, state="failed", error=str(e))
+            logger.warning(f"⚠️ Warmup of {name} failed: {e}")
+
+
+def start():
+    """Warm the configured models on a background thread (called at startup)."""
+    global _thread
+    names = configured_models()
+    for name in names:
+        _set(name, state="pending")
+    if not names or _thread is not None:
+        return
+
+    def run():
+        time.sleep(WARMUP_DELAY)  # let the server finish binding first
+        warm(names)
+
+    _thread = threading.Thread(target=run, name="model-warmup", daemon=True)
+    _thread.start()
+    logger.info(f"   Warming models in background: {', '.join(names)}")
+
+
+def status() -> Dict[str, object]:
+    """Readiness report: every configured model and whether it is warm.
+
+    A configured model that failed to load keeps the worker not ready (it is
+    listed under "failed") so a load balancer does not route to it.
+    """
+    with _state_lock:
+        models = {name: dict(info) for name, info in _state.items()}
+    # Models a request loaded on demand count as warm too
+    for name, (module, _, loaded, args) in MODELS.items():
+        if models.get(name, {}).get("state") == "warm" or module not in sys.modules:
+            continue
+        try:
+            if getattr(sys.modules[module], loaded)(*args):
+                models.setdefault(name, {})["state"] = "warm"
+        except Exception:
+            continue
+    names = configured_models()
+    failed = [n for n in names if models.get(n, {}).get("state") == "failed"]
+    pending = [n for n in names if models.get(n, {}).get("state") not in {"warm", "failed"}]
+    return {"ready": not pending and not failed, "pending": pending, "failed": failed, "models": models}
+
+
+def _reset_after_fork():
+    global _thread
+    _thread = None
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
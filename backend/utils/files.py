@@ -1,4 +1,5 @@
 # File utilities for backend
+import hashlib
 import os
 from fastapi import UploadFile
 from pathlib import Path
@@ -27,3 +28,11 @@ def save_upload(file: UploadFile) -> str:
     except Exception as e:
         logger.error(f"Error saving upload: {e}")
         raise
+
+def file_sha256(path: str) -> str:
+    """Hash a saved file's bytes (used to recognise re-uploads of the same PDF)."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
@@ -0,0 +1,13 @@
+# Server-Sent Events helpers for streaming endpoints
+import json
+from typing import Any, Optional
+
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "X-Accel-Buffering": "no",  # disable proxy buffering so tokens flush immediately
+}
+
+def sse_event(data: Any, event: Optional[str] = None) -> str:
+    """Format one SSE message; data is JSON-encoded so newlines stay on one line."""
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data, ensure_ascii=False)}\n\n"
@@ -0,0 +1,87 @@
+"""
+Micro-benchmark: Q&A query latency before/after sharing the MiniLM embedder.
+
+"before" reproduces the old query path (index.query(query_texts=...)), which
+makes Chroma embed the question with its own default embedding function.
+"after" uses ai_core.embeddings.query_index, which encodes the question with
+the same cached MiniLM model used by build_index.
+
+Usage:
+    python benchmarks/bench_query_embeddings.py --pages 120 --queries 50
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from ai_core import embeddings  # noqa: E402
+
+QUESTIONS = [
+    "What is gradient descent?",
+    "Explain the difference between supervised and unsupervised learning",
+    "How does backpropagation compute gradients?",
+    "What does the loss curve show?",
+    "Why do we normalize input features?",
+]
+
+
+def _fake_pages(n: int):
+    return [
+        {
+            "page_id": i + 1,
+            "page_context": f"TEXT:\nSlide {i + 1} covers topic {i % 17} with example {i % 5}. "
+            + QUESTIONS[i % len(QUESTIONS)],
+        }
+        for i in range(n)
+    ]
+
+
+def _time_calls(fn, questions):
+    samples = []
+    for q in questions:
+        t0 = time.perf_counter()
+        fn(q)
+        samples.append((time.perf_counter() - t0) * 1000.0)
+    return samples
+
+
+def _report(label: str, samples):
+    print(
+        f"{label:<28} first={samples[0]:8.1f} ms  "
+        f"median={statistics.median(samples):7.2f} ms  "
+        f"p95={sorted(samples)[int(len(samples) * 0.95) - 1]:7.2f} ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", type=int, default=120)
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--k", type=int, default=3)
+    args = parser.parse_args()
+
+    questions = [QUESTIONS[i % len(QUESTIONS)] + f" ({i})" for i in range(args.queries)]
+    repeated = [QUESTIONS[i % len(QUESTIONS)] for i in range(args.queries)]
+
+    with tempfile.TemporaryDirectory() as index_dir:
+        t0 = time.perf_counter()
+        index = embeddings.build_index(_fake_pages(args.pages), index_dir, doc_id="bench")
+        print(f"build_index ({args.pages} pages): {(time.perf_counter() - t0) * 1000.0:.1f} ms")
+
+        before = _time_calls(lambda q: index.query(query_texts=[q], n_results=args.k), questions)
+        after = _time_calls(lambda q: embeddings.query_index(index, q, k=args.k), questions)
+        repeat = _time_calls(lambda q: embeddings.query_index(index, q, k=args.k), repeated)
+
+        print()
+        _report("before (chroma default EF)", before)
+        _report("after (shared MiniLM)", after)
+        _report("after, repeated questions", repeat)
+        print(f"query cache: {embeddings.query_cache_info()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""
+Startup benchmark: import time and time to the first successful request.
+
+Runs each measurement in a fresh interpreter so nothing is cached:
+  - import backend.main (what a uvicorn worker pays before it can bind), and
+    which heavy libraries (torch, chromadb, PyMuPDF, ...) that import pulled in
+  - time until /health answers (server bound and serving)
+  - time until /ready answers 200 (configured WARMUP_MODELS are warm)
+  - time until --path answers 2xx, e.g. a QA call that needs MiniLM
+
+Compare lazy warmup with the old on-first-request behaviour by running once
+with the defaults and once with WARMUP_MODELS=none.
+
+Usage:
+    python benchmarks/bench_startup.py --runs 3
+    python benchmarks/bench_startup.py --path /qa/<doc_id> --method POST \\
+        --body '{"question": "What is gradient descent?"}'
+"""
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+
+def _import_time() -> float:
+    code = "import time; t0 = time.perf_counter(); import backend.main; print(time.perf_counter() - t0)"
+    out = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, check=True)
+    return float(out.stdout.strip().splitlines()[-1]) * 1000.0
+
+
+HEAVY_MODULES = ("torch", "numpy", "fitz", "chromadb", "sentence_transformers", "transformers",
+                 "PIL", "easyocr", "whisper", "faster_whisper", "google.generativeai", "httpx")
+
+
+def _heavy_imports() -> list:
+    """Heavy libraries already in sys.modules after importing backend.main (should be none)."""
+    code = ("import sys, json; import backend.main; "
+            f"print(json.dumps([m for m in {HEAVY_MODULES!r} if m in sys.modules]))")
+    out = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _ok(url: str, method: str = "GET", body: str = None) -> bool:
+    data = body.encode("utf-8") if body else None
+    req = urllib.request.Request(url, data=data, method=method, headers={"Content-Type": "application/json"})
+    try:
+        with urllib.request.urlopen(req, timeout=120) as resp:
+            return 200 <= resp.status < 300
+    except (urllib.error.URLError, ConnectionError, OSError):
+        return False
+
+
+def _wait(url: str, t0: float, timeout: float, **kwargs) -> float:
+    while time.perf_counter() - t0 < timeout:
+        if _ok(url, **kwargs):
+            return (time.perf_counter() - t0) * 1000.0
+        time.sleep(0.05)
+    return float("nan")
+
+
+def _serve_once(args) -> dict:
+    port = _free_port()
+    base = f"http://127.0.0.1:{port}"
+    t0 = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "backend.main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        out = {"health": _wait(f"{base}/health", t0, args.timeout)}
+        if args.path:
+            out["first_request"] = _wait(base + args.path, t0, args.timeout, method=args.method, body=args.body)
+        out["ready"] = _wait(f"{base}/ready", t0, args.timeout)
+        return out
+    finally:
+        proc.terminate()
+        proc.wait(timeout=30)
+
+
+def _report(label: str, samples):
+    print(f"{label:<22} median={statistics.median(samples):9.1f} ms  min={min(samples):9.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--path", default=None, help="first real request to time, e.g. /qa/<doc_id>")
+    parser.add_argument("--method", default="GET")
+    parser.add_argument("--body", default=None, help="JSON body for --path")
+    parser.add_argument("--timeout", type=float, default=300.0)
+    args = parser.parse_args()
+    if args.body:
+        json.loads(args.body)  # fail early on a malformed body
+
+    print(f"WARMUP_MODELS={os.getenv('WARMUP_MODELS', '(default)')}")
+    _report("import backend.main", [_import_time() for _ in range(args.runs)])
+    print(f"{'heavy libs imported':<22} {', '.join(_heavy_imports()) or 'none'}")
+    runs = [_serve_once(args) for _ in range(args.runs)]
+    for key in ("health", "first_request", "ready"):
+        samples = [r[key] for r in runs if key in r]
+        if samples:
+            _report(f"to {key}", samples)
+
+
+if __name__ == "__main__":
+    main()
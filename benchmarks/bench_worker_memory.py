@@ -0,0 +1,114 @@
+"""
+Memory per worker: plain `uvicorn --workers N` vs the pre-fork `backend.serve`.
+
+Starts the server in the chosen mode, waits for /ready with the same models
+warm in every worker, then reads /proc/<pid>/smaps_rollup for the master and
+each worker. PSS (proportional set size) splits shared pages between the
+processes using them, so sum(PSS) is the real footprint; RSS counts shared
+weights once per process and overstates it.
+
+Linux only. Usage:
+    python benchmarks/bench_worker_memory.py --mode uvicorn --workers 4
+    python benchmarks/bench_worker_memory.py --mode prefork --workers 4
+"""
+import argparse
+import os
+import socket
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+FIELDS = ("Rss", "Pss", "Shared_Clean", "Shared_Dirty", "Private_Clean", "Private_Dirty")
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _ready(url: str) -> bool:
+    try:
+        with urllib.request.urlopen(url, timeout=10) as resp:
+            return resp.status == 200
+    except (urllib.error.URLError, ConnectionError, OSError):
+        return False
+
+
+def _children(pid: int):
+    out = []
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        if ppid == pid:
+            out.append(int(entry))
+    return out
+
+
+def _smaps(pid: int) -> dict:
+    mem = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            key, _, rest = line.partition(":")
+            if key in FIELDS:
+                mem[key] = int(rest.split()[0]) / 1024.0  # kB -> MiB
+    mem["Private"] = mem.get("Private_Clean", 0) + mem.get("Private_Dirty", 0)
+    return mem
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--mode", choices=["uvicorn", "prefork"], default="prefork")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--models", default="embedder,caption,ocr",
+                        help="models every worker must have loaded before measuring")
+    parser.add_argument("--timeout", type=float, default=600.0)
+    args = parser.parse_args()
+
+    port = _free_port()
+    env = dict(os.environ, WARMUP_MODELS=args.models, SERVE_PRELOAD=args.models)
+    if args.mode == "uvicorn":
+        cmd = [sys.executable, "-m", "uvicorn", "backend.main:app", "--port", str(port),
+               "--workers", str(args.workers), "--log-level", "warning"]
+    else:
+        cmd = [sys.executable, "-m", "backend.serve", "--port", str(port),
+               "--workers", str(args.workers), "--log-level", "warning"]
+    proc = subprocess.Popen(cmd, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        t0 = time.perf_counter()
+        workers = []
+        # /ready is per worker; keep asking until every worker has answered 200 a few times
+        while time.perf_counter() - t0 < args.timeout:
+            workers = _children(proc.pid)
+            if len(workers) >= args.workers and all(_ready(f"http://127.0.0.1:{port}/ready")
+                                                    for _ in range(args.workers * 3)):
+                break
+            time.sleep(1)
+        time.sleep(2)  # let allocator arenas settle
+
+        print(f"mode={args.mode} workers={args.workers} models={args.models}")
+        print(f"{'process':<14}{'RSS':>10}{'PSS':>10}{'Private':>10}{'Shared':>10}  (MiB)")
+        total_pss = 0.0
+        for label, pid in [("master", proc.pid)] + [(f"worker {p}", p) for p in workers]:
+            m = _smaps(pid)
+            shared = m.get("Shared_Clean", 0) + m.get("Shared_Dirty", 0)
+            total_pss += m.get("Pss", 0)
+            print(f"{label:<14}{m.get('Rss', 0):>10.0f}{m.get('Pss', 0):>10.0f}{m['Private']:>10.0f}{shared:>10.0f}")
+        print(f"{'total PSS':<14}{total_pss:>20.0f}")
+        if workers:
+            print(f"{'PSS / worker':<14}{total_pss / len(workers):>20.0f}")
+    finally:
+        proc.terminate()
+        proc.wait(timeout=60)
+
+
+if __name__ == "__main__":
+    main()